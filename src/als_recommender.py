@@ -0,0 +1,245 @@
+import os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from scipy import sparse
+from book_catalog import BookCatalog
+from user_recommender import UserRecommender
+from recommendation_cache import next_model_version
+from metrics import instrument
+from persistence import save_arrays, load_arrays, check_shapes, to_storable
+
+class ALSRecommender(UserRecommender):
+    metrics_prefix = 'als'
+
+    def __init__(self, n_factors=64, regularization=0.1, iterations=15, implicit=False,
+                 alpha=40.0, cg_steps=3, n_jobs=None, block_memory_mb=64, random_state=42,
+                 fallback=None):
+        """
+        Initialize a matrix-factorization recommender trained with alternating least squares.
+
+        Only the (n_users x n_factors) and (n_items x n_factors) factor
+        matrices are kept, so memory grows linearly with users and items.
+
+        Args:
+            n_factors: Number of latent factors
+            regularization: L2 penalty. For explicit ratings it is scaled by
+                each user's/item's number of ratings (weighted-lambda ALS)
+            iterations: Number of alternating user/item sweeps
+            implicit: Treat ratings as implicit feedback (confidence-weighted
+                ALS) instead of fitting the rating values
+            alpha: Confidence scale for implicit feedback (confidence = 1 + alpha * rating)
+            cg_steps: Conjugate gradient steps per row and sweep (n_factors
+                steps solve each row exactly)
+            n_jobs: Worker threads for the per-user/per-item solves (defaults to the CPU count)
+            block_memory_mb: Upper bound (in MB) for the rating-aligned
+                factor arrays built by one worker at once
+            random_state: Seed for the factor initialization
+            fallback: Optional fitted PopularityIndex serving users without
+                ratings (cold start)
+        """
+        self.n_factors = n_factors
+        self.regularization = regularization
+        self.iterations = iterations
+        self.implicit = implicit
+        self.alpha = alpha
+        self.cg_steps = cg_steps
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+        self.block_memory_mb = block_memory_mb
+        self.random_state = random_state
+        self.fallback = fallback
+        self.user_item_matrix = None
+        self.user_factors = None
+        self.item_factors = None
+        self.catalog = None
+        self.version = next_model_version()
+
+    @instrument('als.fit_matrix')
+    def fit_matrix(self, user_item_matrix, user_ids, book_ids, books_data):
+        """
+        Fit the model on a prebuilt user-item matrix (e.g. RatingsStore.user_item_matrix).
+
+        Args:
+            user_item_matrix: Sparse (n_users x n_books) rating matrix
+            user_ids: User ID of every matrix row
+            book_ids: Book ID of every matrix column
+            books_data: BookCatalog (or DataFrame) with book information
+        """
+        self.catalog = books_data if isinstance(books_data, BookCatalog) else BookCatalog(books_data)
+        self.user_ids = np.asarray(user_ids)
+        self.book_ids = np.asarray(book_ids)
+        self.user_item_matrix = sparse.csr_matrix(user_item_matrix, dtype=np.float64)
+        self.user_item_matrix.eliminate_zeros()
+        item_user_matrix = self.user_item_matrix.T.tocsr()
+
+        rng = np.random.default_rng(self.random_state)
+        self.user_factors = np.zeros((len(self.user_ids), self.n_factors))
+        self.item_factors = rng.normal(0, 0.01, (len(self.book_ids), self.n_factors))
+
+        with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+            for _ in range(self.iterations):
+                self.user_factors = self._solve(self.user_item_matrix, self.item_factors,
+                                                self.user_factors, executor)
+                self.item_factors = self._solve(item_user_matrix, self.user_factors,
+                                                self.item_factors, executor)
+
+        self._build_indices()
+        self.version = next_model_version()
+
+    def _solve(self, matrix, factors, current, executor):
+        """
+        Update the factors of every row of `matrix` with `factors` fixed.
+
+        Each row's normal equations are solved with a few conjugate gradient
+        steps warm-started from its current factors (Takacs et al.), which
+        costs O(n_ratings * k) per step and never forms the k x k systems.
+        Rows are split into blocks of at most block_memory_mb of gathered
+        factors and the blocks run concurrently.
+
+        Args:
+            matrix: CSR matrix whose rows are the entities being solved
+            factors: Fixed factor matrix of the other side
+            current: Current factors of the rows (warm start)
+            executor: Thread pool running the blocks
+
+        Returns:
+            New (matrix.shape[0] x n_factors) factor matrix
+        """
+        gram = factors.T @ factors if self.implicit else None
+        solved = np.array(current, dtype=np.float64)
+
+        def solve_block(start, stop):
+            block = matrix[start:stop]
+            rows = np.repeat(np.arange(stop - start), np.diff(block.indptr))
+            neighbors = factors[block.indices]
+            x = solved[start:stop]
+
+            if self.implicit:
+                # (Y^T Y + Y^T (C_u - I) Y + lambda I) x = Y^T C_u p_u
+                weights = self.alpha * block.data
+                rhs = sparse.csr_matrix((1 + weights, block.indices, block.indptr),
+                                        shape=block.shape) @ factors
+                diagonal = np.full((stop - start, 1), self.regularization)
+            else:
+                # (Y_u^T Y_u + lambda n_u I) x = Y_u^T r_u
+                weights = np.ones(len(block.data))
+                rhs = block @ factors
+                diagonal = self.regularization * np.diff(block.indptr)[:, None].astype(np.float64)
+
+            def multiply(p):
+                projected = (neighbors * p[rows]).sum(axis=1) * weights
+                product = sparse.csr_matrix((projected, block.indices, block.indptr),
+                                            shape=block.shape) @ factors + diagonal * p
+                return product + p @ gram if self.implicit else product
+
+            residual = rhs - multiply(x)
+            direction = residual.copy()
+            residual_norm = (residual * residual).sum(axis=1)
+            for _ in range(self.cg_steps):
+                product = multiply(direction)
+                curvature = (direction * product).sum(axis=1)
+                step = np.divide(residual_norm, curvature, out=np.zeros_like(curvature),
+                                 where=curvature > 0)
+                x += step[:, None] * direction
+                residual -= step[:, None] * product
+                new_norm = (residual * residual).sum(axis=1)
+                if new_norm.max(initial=0) < 1e-10:
+                    break
+                direction = residual + np.divide(new_norm, residual_norm, out=np.zeros_like(new_norm),
+                                                 where=residual_norm > 0)[:, None] * direction
+                residual_norm = new_norm
+
+        # Blocks bounded by the size of the gathered (n_ratings x k) factors
+        max_entries = max(1, int(self.block_memory_mb * 1024 ** 2 // (self.n_factors * 8 * 4)))
+        bounds = [0]
+        while bounds[-1] < matrix.shape[0]:
+            start = bounds[-1]
+            stop = np.searchsorted(matrix.indptr, matrix.indptr[start] + max_entries, side='right') - 1
+            bounds.append(min(max(stop, start + 1), matrix.shape[0]))
+
+        list(executor.map(solve_block, bounds[:-1], bounds[1:]))
+        return solved
+
+    def _predict_ratings(self, user_rows):
+        """
+        Score every item for a block of users.
+
+        Args:
+            user_rows: Array of user factor rows
+
+        Returns:
+            Dense (len(user_rows) x n_items) scores with already-rated items set to -inf
+        """
+        scores = self.user_factors[user_rows] @ self.item_factors.T
+
+        # Mask items the users have already rated
+        rated_users, rated_items = self.user_item_matrix[user_rows].nonzero()
+        scores[rated_users, rated_items] = -np.inf
+        return scores
+
+    def save(self, path):
+        """
+        Save the fitted model as versioned .npy arrays.
+
+        The catalog is not included; save it separately with BookCatalog.save.
+
+        Args:
+            path: Directory to write the artifact into
+        """
+        rated = self.user_item_matrix.tocsr()
+        save_arrays(path, 'als_recommender', {
+            'user_ids': to_storable(self.user_ids),
+            'book_ids': to_storable(self.book_ids),
+            'user_factors': self.user_factors,
+            'item_factors': self.item_factors,
+            'rated_indptr': rated.indptr,
+            'rated_indices': rated.indices
+        }, meta={
+            'n_factors': self.n_factors,
+            'regularization': self.regularization,
+            'iterations': self.iterations,
+            'implicit': self.implicit,
+            'alpha': self.alpha,
+            'cg_steps': self.cg_steps
+        })
+
+    @classmethod
+    def load(cls, path, catalog, mmap=True):
+        """
+        Load a model saved with save().
+
+        Args:
+            path: Artifact directory
+            catalog: BookCatalog to resolve recommended books against
+            mmap: Memory-map the factor matrices so processes can share their pages
+
+        Returns:
+            Fitted ALSRecommender
+
+        Raises:
+            ValueError: If the factor matrices do not match the saved users and books
+        """
+        arrays, meta = load_arrays(path, 'als_recommender', mmap=mmap)
+        n_users, n_books = len(arrays['user_ids']), len(arrays['book_ids'])
+        check_shapes(path, {
+            'user_factors': (arrays['user_factors'].shape, (n_users, meta['n_factors'])),
+            'item_factors': (arrays['item_factors'].shape, (n_books, meta['n_factors'])),
+            'rated_indptr': (arrays['rated_indptr'].shape, (n_users + 1,))
+        })
+        recommender = cls(n_factors=meta['n_factors'], regularization=meta['regularization'],
+                          iterations=meta['iterations'], implicit=meta['implicit'],
+                          alpha=meta['alpha'], cg_steps=meta['cg_steps'])
+        recommender.catalog = catalog
+        recommender.user_ids = arrays['user_ids']
+        recommender.book_ids = arrays['book_ids']
+        recommender.user_factors = arrays['user_factors']
+        recommender.item_factors = arrays['item_factors']
+
+        # Only the rated positions are needed (to mask already-rated items)
+        indices = arrays['rated_indices']
+        recommender.user_item_matrix = sparse.csr_matrix(
+            (np.ones(len(indices)), indices, arrays['rated_indptr']),
+            shape=(len(recommender.user_ids), len(recommender.book_ids))
+        )
+
+        recommender._build_indices()
+        return recommender
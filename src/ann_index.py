@@ -0,0 +1,138 @@
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+
+class ClusterIndex:
+    def __init__(self, n_clusters=None, n_components=64, n_probe=8, random_state=42):
+        """
+        Initialize an IVF-style approximate nearest-neighbor index.
+
+        Items are embedded with truncated SVD and grouped into clusters. A
+        query only scores the items in its `n_probe` closest clusters, and the
+        candidates are re-ranked with exact cosine similarity on the original
+        features.
+
+        Args:
+            n_clusters: Number of clusters (defaults to ~sqrt(n_items))
+            n_components: Dimensionality of the SVD embedding
+            n_probe: Number of clusters searched per query. Higher values
+                raise recall at the cost of latency.
+            random_state: Seed for SVD and clustering
+        """
+        self.n_clusters = n_clusters
+        self.n_components = n_components
+        self.n_probe = n_probe
+        self.random_state = random_state
+        self.features = None
+        self.svd = None
+        self.centroids = None
+        self.cluster_items = None
+
+    def fit(self, features):
+        """
+        Build the index.
+
+        Args:
+            features: Sparse (n_items x n_features) matrix, e.g. TF-IDF
+        """
+        self.features = features
+        n_items = features.shape[0]
+        n_components = max(1, min(self.n_components, features.shape[1] - 1, n_items - 1))
+        n_clusters = self.n_clusters or int(np.sqrt(n_items))
+        n_clusters = max(1, min(n_clusters, n_items))
+
+        self.svd = TruncatedSVD(n_components=n_components, random_state=self.random_state)
+        embedding = normalize(self.svd.fit_transform(features))
+
+        kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=self.random_state,
+                                 n_init=3, batch_size=4096)
+        labels = kmeans.fit_predict(embedding)
+        self.centroids = normalize(kmeans.cluster_centers_)
+
+        # Inverted lists: item positions grouped by cluster
+        order = np.argsort(labels, kind='stable')
+        bounds = np.searchsorted(labels[order], np.arange(n_clusters + 1))
+        self.cluster_items = [order[bounds[c]:bounds[c + 1]] for c in range(n_clusters)]
+        return self
+
+    def add(self, features, start):
+        """
+        Index rows appended to the feature matrix since the index was built.
+
+        New items are assigned to their nearest existing cluster; the SVD
+        basis and centroids are not refit.
+
+        Args:
+            features: Full feature matrix including the new rows
+            start: Position of the first new row
+        """
+        self.features = features
+        if start >= features.shape[0]:
+            return self
+
+        embedded = normalize(self.svd.transform(features[start:]))
+        labels = np.argmax(embedded @ self.centroids.T, axis=1)
+        positions = np.arange(start, features.shape[0])
+        for cluster in np.unique(labels):
+            self.cluster_items[cluster] = np.concatenate([
+                self.cluster_items[cluster], positions[labels == cluster]
+            ])
+        return self
+
+    def query(self, query_vector, n, n_probe=None, exclude=None):
+        """
+        Find approximate nearest neighbors of a single query.
+
+        Args:
+            query_vector: Sparse (1 x n_features) query row
+            n: Number of neighbors to return
+            n_probe: Overrides the index-wide number of probed clusters
+            exclude: Optional item position to leave out (e.g. the query item)
+
+        Returns:
+            Tuple of (item positions, cosine scores) ordered by descending score
+        """
+        n_probe = min(n_probe or self.n_probe, len(self.cluster_items))
+        embedded = normalize(self.svd.transform(query_vector))
+        centroid_scores = (self.centroids @ embedded.T).ravel()
+        probed = np.argpartition(-centroid_scores, n_probe - 1)[:n_probe]
+
+        candidates = np.concatenate([self.cluster_items[c] for c in probed])
+        if exclude is not None:
+            candidates = candidates[candidates != exclude]
+        if len(candidates) == 0:
+            return candidates, np.array([])
+
+        scores = cosine_similarity(query_vector, self.features[candidates]).ravel()
+        n = min(n, len(candidates))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return candidates[top], scores[top]
+
+
+def recall_at_k(index, features, query_indices, k=10, n_probe=None):
+    """
+    Measure how many of the exact top-k neighbors the index returns.
+
+    Args:
+        index: Fitted ClusterIndex
+        features: Feature matrix the index was built on
+        query_indices: Item positions to use as queries
+        k: Neighborhood size
+        n_probe: Number of probed clusters to evaluate
+
+    Returns:
+        Mean recall@k over the queries
+    """
+    recalls = []
+    for idx in query_indices:
+        exact_scores = cosine_similarity(features[idx:idx + 1], features).ravel()
+        exact_scores[idx] = -np.inf
+        exact = np.argpartition(-exact_scores, k - 1)[:k]
+
+        approx, _ = index.query(features[idx:idx + 1], k, n_probe=n_probe, exclude=idx)
+        recalls.append(len(np.intersect1d(exact, approx)) / k)
+
+    return float(np.mean(recalls))
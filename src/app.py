@@ -1,94 +1,402 @@
 import gradio as gr
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-from data_processor import DataProcessor
-from content_recommender import ContentBasedRecommender
-from collaborative_recommender import CollaborativeRecommender
-from hybrid_recommender import HybridRecommender
 import os
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from recommendation_cache import RecommendationCache
+from metrics import REGISTRY, instrument, timed
 
 # Initialize the recommendation system
 data_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'data.csv')
-data_processor = DataProcessor(data_path)
-data = data_processor.load_data(sample_size=30000)
-
-# Preprocess text features
-text_features = ['title', 'authors', 'description']
-tfidf_matrix = data_processor.preprocess_text_features(text_features)
-
-# Initialize recommenders
-content_recommender = ContentBasedRecommender()
-collaborative_recommender = CollaborativeRecommender()
-hybrid_recommender = HybridRecommender(
-    content_recommender,
-    collaborative_recommender,
-    content_weight=0.5
+model_dir = os.environ.get(
+    'BOOK_MODEL_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'model')
 )
-
-# Fit the recommenders
-content_recommender.fit(tfidf_matrix, data)
-collaborative_recommender.fit(
-    data[['user_id', 'book_id', 'rating']], 
-    data
+# Rating events ingested with `python src/ratings_store.py ingest`
+ratings_dir = os.environ.get(
+    'BOOK_RATINGS_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'ratings')
 )
+# Optional Prometheus endpoint and sampling profiler
+if os.environ.get('METRICS_PORT'):
+    REGISTRY.serve(int(os.environ['METRICS_PORT']))
+if os.environ.get('PROFILE_SAMPLE_RATE'):
+    REGISTRY.enable_profiling(float(os.environ['PROFILE_SAMPLE_RATE']),
+                              float(os.environ.get('PROFILE_THRESHOLD', 0.1)))
+
+# Leading rows of the CSV used by the app
+SAMPLE_SIZE = 30000
+# Catalog columns: result columns plus what the popularity and title indexes need
+CATALOG_COLUMNS = ('title', 'authors', 'genres', 'rating', 'num_ratings')
+UNKNOWN_USER = "Unknown user ID. Please enter the ID of a user with ratings."
+
+# Shared result cache for the recommenders and the UI handlers
+recommendation_cache = RecommendationCache(max_size=4096, ttl=600)
+
+# Models are built on a background thread after the UI is up. Each stage
+# publishes its objects here as soon as it finishes, and handlers only use
+# what is already available.
+models = {}
+stage_status = {stage: 'pending' for stage in ('data', 'content', 'collaborative')}
+stage_seconds = {}
+warm_up_lock = threading.Lock()
+warm_up_thread = None
+books_lock = threading.Lock()
+
+def artifact_path(name):
+    """Get the path of a saved artifact."""
+    return os.path.join(model_dir, name)
+
+def load_artifact(name, load, matches=None):
+    """
+    Load a saved artifact if it exists and still matches the current data.
+
+    Saved artifacts are memory-mapped, so worker processes share their pages.
+
+    Args:
+        name: Artifact name under model_dir
+        load: Function loading the artifact from its path
+        matches: Optional check of the loaded artifact against the current data
+
+    Returns:
+        The artifact, or None if it is missing, unreadable or stale
+    """
+    path = artifact_path(name)
+    if not os.path.isdir(path):
+        return None
+    try:
+        artifact = load(path)
+    except (OSError, ValueError, KeyError) as error:
+        print(f"Ignoring unreadable artifact {path}: {error}")
+        return None
+    if matches is not None and not matches(artifact):
+        print(f"Ignoring stale artifact {path}")
+        return None
+    return artifact
+
+def load_books():
+    """Parse the books CSV on first use; only needed to build missing artifacts."""
+    from data_processor import DataProcessor
+
+    with books_lock:
+        if 'data_processor' not in models:
+            data_processor = DataProcessor(data_path)
+            data_processor.load_data(sample_size=SAMPLE_SIZE)
+            models['data_processor'] = data_processor
+    return models['data_processor']
+
+def load_data_stage():
+    """Load the shared catalog, the title index and the popularity leaderboard."""
+    import numpy as np
+    from persistence import file_fingerprint
+    from book_catalog import BookCatalog
+    from title_index import TitleIndex
+    from popularity import PopularityIndex
+
+    # The saved catalog stands in for the CSV as long as the CSV is unchanged
+    source = {**file_fingerprint(data_path), 'sample_size': SAMPLE_SIZE}
+    catalog = load_artifact('catalog', BookCatalog.load, lambda catalog: catalog.source == source)
+    if catalog is None:
+        data = load_books().data
+        catalog = BookCatalog(data, columns=[col for col in CATALOG_COLUMNS if col in data])
+        catalog.save(artifact_path('catalog'), source=source)
+        # Everything saved from the previous catalog is stale
+        models['catalog_rebuilt'] = True
+
+    books = catalog.take(np.arange(len(catalog)), columns=list(catalog.columns))
+    models['catalog'] = catalog
+    # Popularity leaderboard, also the cold-start fallback for unknown users
+    models['popularity'] = PopularityIndex().fit(books, catalog)
+    models['title_index'] = TitleIndex(books['title'], books['book_id'], popularity=books['num_ratings'])
+
+def derived_from_catalog(n_items):
+    """Check that an artifact built for n_items books belongs to the current catalog."""
+    return not models.get('catalog_rebuilt') and n_items == len(models['catalog'])
+
+def content_stage():
+    """Load or fit the TF-IDF features and the content-based recommender."""
+    from data_processor import DataProcessor
+    from content_recommender import ContentBasedRecommender
+    from neighbor_table import NeighborTable
+
+    data_processor = load_artifact('processor', DataProcessor.load,
+                                   lambda processor: derived_from_catalog(processor.tfidf_matrix.shape[0]))
+    if data_processor is None:
+        # Preprocess text features
+        data_processor = load_books()
+        text_features = ['title', 'authors', 'description']
+        data_processor.preprocess_text_features(text_features)
+        data_processor.save(artifact_path('processor'))
+
+    content_recommender = ContentBasedRecommender()
+    content_recommender.fit(data_processor.tfidf_matrix, models['catalog'], data_processor.tfidf)
+    # Precomputed neighbors from `python src/neighbor_table.py`, if available
+    if os.path.isdir(artifact_path('neighbors')):
+        neighbor_table = load_artifact(
+            'neighbors', NeighborTable.load,
+            lambda table: (not models.get('catalog_rebuilt') and
+                           table.matches(data_processor.tfidf_matrix.shape[0], data_processor.features_version))
+        )
+        if neighbor_table is None:
+            # Rebuilding is an offline batch job; serve live scores until it is rerun
+            print("Content neighbors are computed live until `python src/neighbor_table.py` is rerun")
+        content_recommender.neighbor_table = neighbor_table
+    models['content'] = content_recommender
+
+def collaborative_stage():
+    """Load or fit the collaborative recommender."""
+    from collaborative_recommender import CollaborativeRecommender
+
+    # Real rating events, if any; a model fitted on them is stale once more are ingested
+    store = None
+    if os.path.isdir(ratings_dir):
+        from ratings_store import RatingsStore
+        store = RatingsStore(ratings_dir)
+    source = store.fingerprint() if store is not None else None
+
+    collaborative_recommender = load_artifact(
+        'collaborative',
+        lambda path: CollaborativeRecommender.load(path, models['catalog']),
+        lambda recommender: not models.get('catalog_rebuilt') and recommender.source == source
+    )
+    if collaborative_recommender is None:
+        collaborative_recommender = CollaborativeRecommender()
+        if store is not None:
+            # Fit on real rating events
+            collaborative_recommender.fit_matrix(*store.user_item_matrix(), models['catalog'])
+        else:
+            data = load_books().data
+            collaborative_recommender.fit(
+                data[['user_id', 'book_id', 'rating']], 
+                models['catalog']
+            )
+        collaborative_recommender.save(artifact_path('collaborative'), source=source)
+    collaborative_recommender.fallback = models['popularity']
+    models['collaborative'] = collaborative_recommender
+
+def run_stage(stage, build):
+    """Run one warm-up stage, recording its status instead of raising."""
+    stage_status[stage] = 'loading'
+    start = time.perf_counter()
+    try:
+        with timed(f'app.warm_up.{stage}'):
+            build()
+    except Exception as error:
+        stage_status[stage] = f'failed: {type(error).__name__}: {error}'
+        traceback.print_exc()
+        return False
+    stage_seconds[stage] = round(time.perf_counter() - start, 2)
+    stage_status[stage] = 'ready'
+    return True
+
+def warm_up():
+    """Build all models: data first, then content and collaborative concurrently."""
+    if not run_stage('data', load_data_stage):
+        stage_status.update(content='skipped', collaborative='skipped')
+        return
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        executor.submit(run_stage, 'content', content_stage)
+        executor.submit(run_stage, 'collaborative', collaborative_stage)
+
+def start_warm_up():
+    """Start building the models in the background (once)."""
+    global warm_up_thread
+    with warm_up_lock:
+        if warm_up_thread is None:
+            warm_up_thread = threading.Thread(target=warm_up, name='warm-up', daemon=True)
+            warm_up_thread.start()
+    return warm_up_thread
+
+def unavailable(*components):
+    """Get a message if any required component is not ready yet, else None."""
+    for component in components:
+        if component not in models:
+            stage = 'data' if component in ('catalog', 'popularity', 'title_index') else component
+            if stage_status[stage].startswith('failed') or stage_status[stage] == 'skipped':
+                return f"The {stage} component failed to load. Please contact the administrator."
+            return f"The {stage} component is still loading. Please try again in a moment."
+    return None
+
+def get_hybrid_recommender():
+    """Get the hybrid recommender once both components are ready."""
+    from hybrid_recommender import HybridRecommender
+
+    with warm_up_lock:
+        if 'hybrid' not in models:
+            models['hybrid'] = HybridRecommender(
+                models['content'],
+                models['collaborative'],
+                content_weight=0.5,
+                cache=recommendation_cache
+            )
+    return models['hybrid']
+
+def get_status():
+    """Get the readiness of every warm-up stage."""
+    return {
+        'ready': all(status == 'ready' for status in stage_status.values()),
+        'stages': dict(stage_status),
+        'seconds': dict(stage_seconds)
+    }
+
+# Rendered charts by popularity index version
+chart_dir = tempfile.mkdtemp(prefix='book-charts-')
+chart_paths = {}
+chart_lock = threading.Lock()
 
 def plot_top_books():
-    """Plot top N books by average rating."""
-    # Filter books with minimum number of ratings
-    min_ratings = 50
-    top_books = data[data['num_ratings'] >= min_ratings].copy()
-    
-    # Sort by rating and get top N
-    top_books = top_books.nlargest(10, 'rating')[['title', 'rating', 'num_ratings']]
-    
-    # Create the plot
-    plt.figure(figsize=(12, 6))
-    sns.barplot(data=top_books, y='title', x='rating', hue='title', legend=False)
-    plt.title(f'Top 10 Books by Rating (min {min_ratings} ratings)')
-    plt.xlabel('Rating')
-    plt.ylabel('Book Title')
-    plt.tight_layout()
-    
-    # Save plot to a temporary file
-    plt.savefig('temp_plot.png')
-    plt.close()
-    return 'temp_plot.png'
+    """Plot top 10 books by weighted rating, rendered once per data version."""
+    if unavailable('popularity'):
+        return None
+    popularity_index = models['popularity']
+    with chart_lock:
+        path = chart_paths.get(popularity_index.version)
+        if path is None:
+            # Plotting libraries are only imported when the chart is first needed
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+            import seaborn as sns
 
+            top_books = popularity_index.get_top_books(10)
+            
+            # Create the plot
+            plt.figure(figsize=(12, 6))
+            sns.barplot(data=top_books, y='title', x='weighted_rating', hue='title', legend=False)
+            plt.title('Top 10 Books by Weighted Rating')
+            plt.xlabel('Weighted Rating')
+            plt.ylabel('Book Title')
+            plt.tight_layout()
+            
+            # Each version gets its own file, so concurrent users never share a half-written image
+            path = os.path.join(chart_dir, f'top_books_{popularity_index.version}.png')
+            plt.savefig(path)
+            plt.close()
+            chart_paths[popularity_index.version] = path
+    return path
+
+def get_leaderboard(author, genre):
+    """Get the most popular books, optionally for one author and/or genre."""
+    message = unavailable('popularity')
+    if message:
+        return message
+    top_books = models['popularity'].get_top_books(20, authors=author or None, genres=genre or None)
+    if top_books.empty:
+        return "No rated books match. Please try another author or genre."
+    return format_recommendations(top_books, ['title', 'authors', 'weighted_rating'])
+
+def format_recommendations(recommendations, columns):
+    """Render recommendation columns as display text."""
+    with timed('app.format'):
+        return recommendations[columns].to_string()
+
+@instrument('app.content_recommendations', profile=True)
 def get_content_recommendations(book_title):
     """Get content-based recommendations for a book title."""
+    message = unavailable('title_index', 'content')
+    if message:
+        return message
+    content_recommender = models['content']
     try:
-        book_id = data[data['title'].str.contains(book_title, case=False)].iloc[0]['book_id']
-        recommendations = content_recommender.get_recommendations(book_id)
-        return recommendations[['title', 'authors', 'similarity_score']].to_string()
+        with timed('app.title_lookup'):
+            book_id = models['title_index'].best_match(book_title)
+        if book_id is None:
+            return "Book not found. Please try another title."
+        return recommendation_cache.get_or_compute(
+            ('content_text', book_id), content_recommender.version,
+            lambda: format_recommendations(content_recommender.get_recommendations(book_id),
+                                           ['title', 'authors', 'similarity_score'])
+        )
     except (IndexError, KeyError):
         return "Book not found. Please try another title."
 
-def get_collaborative_recommendations(user_id):
-    """Get collaborative recommendations for a user ID."""
+@instrument('app.autocomplete')
+def autocomplete_titles(prefix):
+    """Suggest matching titles for a partially typed book title."""
+    if unavailable('title_index'):
+        return ""
+    return "\n".join(models['title_index'].autocomplete(prefix))
+
+def parse_user_id(user_id, collaborative_recommender):
+    """
+    Match a typed user ID to a user of the collaborative model.
+
+    The ID is tried as entered and as an integer, since the textbox always
+    yields text while the ratings data usually has integer IDs.
+
+    Args:
+        user_id: Text entered by the user
+        collaborative_recommender: Fitted CollaborativeRecommender
+
+    Returns:
+        The matching user ID; an unknown ID as entered when the recommender
+        has a cold-start fallback; otherwise None
+    """
+    user_id = str(user_id or '').strip()
+    if not user_id:
+        return None
+    if user_id in collaborative_recommender.user_indices:
+        return user_id
     try:
-        user_id = int(user_id)
-        if user_id < 0 or user_id >= 100:  # We created 100 dummy users
-            return "Invalid user ID. Please enter a number between 0 and 99."
-        recommendations = collaborative_recommender.get_recommendations(user_id)
-        return recommendations[['title', 'authors', 'predicted_rating']].to_string()
+        if int(user_id) in collaborative_recommender.user_indices:
+            return int(user_id)
     except ValueError:
-        return "Invalid user ID. Please enter a number between 0 and 99."
+        pass
+    # New users are served the popularity fallback, as in the JSON server
+    if getattr(collaborative_recommender, 'fallback', None) is not None:
+        return user_id
+    return None
 
+@instrument('app.collaborative_recommendations', profile=True)
+def get_collaborative_recommendations(user_id):
+    """Get collaborative recommendations for a user ID."""
+    message = unavailable('collaborative')
+    if message:
+        return message
+    collaborative_recommender = models['collaborative']
+    user_id = parse_user_id(user_id, collaborative_recommender)
+    if user_id is None:
+        return UNKNOWN_USER
+    return recommendation_cache.get_or_compute(
+        ('collaborative_text', user_id), collaborative_recommender.version,
+        lambda: format_recommendations(collaborative_recommender.get_recommendations(user_id),
+                                       ['title', 'authors', 'predicted_rating'])
+    )
+
+@instrument('app.hybrid_recommendations', profile=True)
 def get_hybrid_recommendations(user_id, book_title):
     """Get hybrid recommendations based on both user ID and book title."""
+    message = unavailable('title_index', 'content', 'collaborative')
+    if message:
+        return message
+    hybrid_recommender = get_hybrid_recommender()
+    user_id = parse_user_id(user_id, models['collaborative'])
+    if user_id is None:
+        return UNKNOWN_USER
     try:
-        user_id = int(user_id)
-        if user_id < 0 or user_id >= 100:
-            return "Invalid user ID. Please enter a number between 0 and 99."
-        
-        book_id = data[data['title'].str.contains(book_title, case=False)].iloc[0]['book_id']
+        with timed('app.title_lookup'):
+            book_id = models['title_index'].best_match(book_title)
+        if book_id is None:
+            return "Book not found. Please try another title."
         recommendations = hybrid_recommender.get_recommendations(user_id, book_id)
-        return recommendations[['title', 'authors', 'weighted_score']].to_string()
+        return format_recommendations(recommendations, ['title', 'authors', 'weighted_score'])
     except (IndexError, KeyError):
         return "Book not found. Please try another title."
-    except ValueError:
-        return "Invalid user ID. Please enter a number between 0 and 99."
+
+def get_cache_stats():
+    """Get hit/miss/eviction counters of the recommendation cache."""
+    return recommendation_cache.stats()
+
+def get_metrics():
+    """Get stage latency metrics and the slowest sampled request profiles."""
+    profiles = "\n\n".join(
+        f"{request} took {seconds * 1000:.1f} ms\n{report}"
+        for request, seconds, report in sorted(REGISTRY.slow_profiles, key=lambda p: -p[1])
+    )
+    return REGISTRY.export_prometheus(), profiles or "No slow requests sampled."
 
 # Create the Gradio interface
 with gr.Blocks(title="Book Recommendation System") as demo:
@@ -98,10 +406,21 @@ with gr.Blocks(title="Book Recommendation System") as demo:
         plot_button = gr.Button("Show Top 10 Books")
         plot_output = gr.Image(type="filepath")
         plot_button.click(plot_top_books, outputs=plot_output)
+        with gr.Row():
+            author_input = gr.Textbox(label="Author (optional)")
+            genre_input = gr.Textbox(label="Genre (optional)")
+        leaderboard_output = gr.Textbox(label="Most popular books")
+        gr.Button("Show Leaderboard").click(
+            get_leaderboard,
+            inputs=[author_input, genre_input],
+            outputs=leaderboard_output
+        )
     
     with gr.Tab("Content-Based Recommendations"):
         gr.Markdown("Get recommendations based on book similarity")
         book_input = gr.Textbox(label="Enter a book title")
+        book_suggestions = gr.Textbox(label="Matching titles")
+        book_input.change(autocomplete_titles, inputs=book_input, outputs=book_suggestions)
         content_output = gr.Textbox(label="Recommendations")
         gr.Button("Get Recommendations").click(
             get_content_recommendations, 
@@ -110,7 +429,7 @@ with gr.Blocks(title="Book Recommendation System") as demo:
         )
     
     with gr.Tab("Collaborative Recommendations"):
-        gr.Markdown("Get recommendations based on user ratings (Enter ID between 0-99)")
+        gr.Markdown("Get recommendations based on user ratings (enter the ID of a user with ratings)")
         user_input = gr.Textbox(label="Enter user ID")
         collab_output = gr.Textbox(label="Recommendations")
         gr.Button("Get Recommendations").click(
@@ -129,6 +448,23 @@ with gr.Blocks(title="Book Recommendation System") as demo:
             inputs=[hybrid_user_input, hybrid_book_input], 
             outputs=hybrid_output
         )
+    
+    with gr.Tab("Status"):
+        status_output = gr.JSON(label="Startup stages")
+        gr.Button("Refresh").click(get_status, outputs=status_output)
+        demo.load(get_status, outputs=status_output)
+    
+    with gr.Tab("Cache Stats"):
+        stats_output = gr.JSON(label="Recommendation cache")
+        gr.Button("Refresh").click(get_cache_stats, outputs=stats_output)
+    
+    with gr.Tab("Metrics"):
+        metrics_output = gr.Textbox(label="Stage latencies (Prometheus format)", lines=20)
+        profiles_output = gr.Textbox(label="Slow request profiles", lines=20)
+        gr.Button("Refresh").click(get_metrics, outputs=[metrics_output, profiles_output])
+
+# The UI comes up immediately; models become available as their stages finish
+start_warm_up()
 
 if __name__ == "__main__":
     demo.launch()
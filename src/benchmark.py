@@ -0,0 +1,284 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from data_processor import DataProcessor
+from content_recommender import ContentBasedRecommender
+from collaborative_recommender import CollaborativeRecommender
+from als_recommender import ALSRecommender
+from hybrid_recommender import HybridRecommender
+from book_catalog import BookCatalog
+from metrics import latency_stats
+
+COMPONENTS = ['data_processor', 'content', 'text', 'collaborative', 'als', 'hybrid']
+GENRES = ['Fantasy', 'Romance', 'Mystery', 'Science Fiction', 'Horror', 'History',
+          'Biography', 'Poetry', 'Thriller', 'Young Adult', 'Classics', 'Nonfiction']
+SYLLABLES = ['ka', 'lo', 'mi', 're', 'su', 'ta', 'ven', 'dor', 'el', 'ith',
+             'mar', 'on', 'ra', 'shi', 'tor', 'ul', 'wyn', 'zel', 'an', 'bri']
+
+def generate_synthetic_data(n_books, n_users=None, ratings_per_user=20, seed=42):
+    """
+    Generate a seeded synthetic catalog and user ratings.
+
+    Words, authors and book popularity follow Zipf-like distributions so that
+    TF-IDF and item co-occurrence look roughly like real data.
+
+    Args:
+        n_books: Number of books in the catalog
+        n_users: Number of users (defaults to n_books // 10)
+        ratings_per_user: Average number of ratings per user
+        seed: Random seed
+
+    Returns:
+        Tuple of (books DataFrame, ratings DataFrame [user_id, book_id, rating])
+    """
+    rng = np.random.default_rng(seed)
+    n_users = n_users or max(1, n_books // 10)
+
+    # Vocabulary of pronounceable pseudo-words with Zipfian frequencies
+    vocabulary = np.array([a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES[:10]])
+    word_weights = 1.0 / np.arange(1, len(vocabulary) + 1)
+    word_weights /= word_weights.sum()
+
+    def sentences(n_rows, min_words, max_words):
+        lengths = rng.integers(min_words, max_words + 1, n_rows)
+        words = vocabulary[rng.choice(len(vocabulary), lengths.sum(), p=word_weights)]
+        bounds = np.concatenate([[0], np.cumsum(lengths)])
+        return [' '.join(words[bounds[i]:bounds[i + 1]]) for i in range(n_rows)]
+
+    n_authors = max(1, n_books // 10)
+    author_ids = np.minimum(rng.zipf(1.5, n_books), n_authors) - 1
+    books = pd.DataFrame({
+        'book_id': [f'book-{i}' for i in range(n_books)],
+        'title': [title.title() for title in sentences(n_books, 1, 5)],
+        'authors': [f'Author {i}' for i in author_ids],
+        'description': sentences(n_books, 20, 60),
+        'genres': np.array(GENRES)[rng.integers(0, len(GENRES), n_books)],
+        'rating': rng.normal(3.9, 0.4, n_books).clip(1, 5).round(2),
+        'num_ratings': rng.zipf(1.8, n_books).clip(max=1_000_000).astype(np.int64)
+    })
+    books['user_id'] = books.index % 100
+
+    # Ratings skewed towards popular books
+    n_ratings = n_users * ratings_per_user
+    popularity = 1.0 / np.arange(1, n_books + 1) ** 0.8
+    popularity /= popularity.sum()
+    ratings = pd.DataFrame({
+        'user_id': rng.integers(0, n_users, n_ratings),
+        'book_id': books['book_id'].to_numpy()[rng.permutation(n_books)[
+            rng.choice(n_books, n_ratings, p=popularity)]],
+        'rating': rng.integers(1, 6, n_ratings).astype(np.float64)
+    }).drop_duplicates(['user_id', 'book_id'], ignore_index=True)
+
+    return books, ratings
+
+def _rss_mb():
+    """Current resident set size in MB (Linux), or None if unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (OSError, ValueError):
+        return None
+
+def _peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+def _time_queries(query, keys):
+    """Time query(key) for every key."""
+    latencies = []
+    for key in keys:
+        start = time.perf_counter()
+        query(key)
+        latencies.append(time.perf_counter() - start)
+    return latency_stats(latencies)
+
+def _benchmark_component(component, n_books, n_queries, seed, trace_memory=False):
+    """
+    Benchmark one component at one scale in its own process.
+
+    Peak RSS covers the whole process, including the synthetic data. With
+    `trace_memory`, the component's fit and queries instead run under
+    tracemalloc, which slows allocation-heavy code, so nothing is timed. The
+    result is then only the peak memory they allocated on top of their
+    inputs.
+    """
+    books, ratings = generate_synthetic_data(n_books, seed=seed)
+    rng = np.random.default_rng(seed + 1)
+    book_keys = books['book_id'].to_numpy()[rng.integers(0, len(books), n_queries)]
+    user_keys = ratings['user_id'].to_numpy()[rng.integers(0, len(ratings), n_queries)]
+    text_features = ['title', 'authors', 'description']
+    result = {'rss_before_fit_mb': _rss_mb()}
+
+    if component == 'data_processor':
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'data.csv')
+            books.drop(columns='user_id').rename(columns={
+                'book_id': 'bookId', 'authors': 'author', 'num_ratings': 'numRatings'
+            }).to_csv(path, index=False)
+            del books, ratings
+
+            if trace_memory:
+                tracemalloc.start()
+            start = time.perf_counter()
+            processor = DataProcessor(path)
+            processor.load_data()
+            result['load_seconds'] = time.perf_counter() - start
+            processor.preprocess_text_features(text_features)
+            result['fit_seconds'] = time.perf_counter() - start
+    else:
+        start = time.perf_counter()
+        processor = DataProcessor.from_frame(books)
+        tfidf_matrix = processor.preprocess_text_features(text_features)
+        result['tfidf_seconds'] = time.perf_counter() - start
+        catalog = BookCatalog(books)
+
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        if component in ('content', 'text', 'hybrid'):
+            content_recommender = ContentBasedRecommender()
+            content_recommender.fit(tfidf_matrix, catalog, processor.tfidf)
+        if component in ('collaborative', 'hybrid'):
+            collaborative_recommender = CollaborativeRecommender()
+            collaborative_recommender.fit(ratings, catalog)
+        if component == 'als':
+            collaborative_recommender = ALSRecommender()
+            collaborative_recommender.fit(ratings, catalog)
+        result['fit_seconds'] = time.perf_counter() - start
+
+        if component == 'content':
+            result['latency'] = _time_queries(content_recommender.get_recommendations, book_keys)
+        elif component == 'text':
+            # Free-text queries built from book descriptions (distinct, so the query cache misses)
+            descriptions = books.set_index('book_id')['description']
+            text_keys = [f'{descriptions[key]} {i}' for i, key in enumerate(book_keys)]
+            result['latency'] = _time_queries(content_recommender.get_similar_books_by_features, text_keys)
+            start = time.perf_counter()
+            content_recommender.query_cache().clear()
+            content_recommender.search_batch(text_keys, 5)
+            result['batch_ms_per_query'] = 1000 * (time.perf_counter() - start) / len(text_keys)
+        elif component in ('collaborative', 'als'):
+            result['latency'] = _time_queries(collaborative_recommender.get_recommendations, user_keys)
+        else:
+            hybrid_recommender = HybridRecommender(content_recommender, collaborative_recommender)
+            result['latency'] = _time_queries(
+                lambda keys: hybrid_recommender.get_recommendations(*keys),
+                list(zip(user_keys, book_keys))
+            )
+
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {'memory_mb': peak / 1024 ** 2}
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+def run_benchmarks(scales, components=COMPONENTS, n_queries=200, seed=42):
+    """
+    Benchmark every component at every scale, each in a fresh process.
+
+    Args:
+        scales: Catalog sizes (number of books) to benchmark
+        components: Components to benchmark (see COMPONENTS)
+        n_queries: Number of timed queries per recommender
+        seed: Seed for the synthetic data
+
+    Returns:
+        Dict with run metadata and a list of per-(component, scale) results
+    """
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for n_books in scales:
+        for component in components:
+            with context.Pool(1) as pool:
+                result = pool.apply(_benchmark_component, (component, n_books, n_queries, seed))
+            # Memory is traced in a second fresh process, since tracing would skew the timings
+            with context.Pool(1) as pool:
+                result.update(pool.apply(_benchmark_component, (component, n_books, n_queries, seed, True)))
+            result.update({'component': component, 'n_books': n_books})
+            results.append(result)
+            print(f"{component:>15} {n_books:>9,} books: fit {result['fit_seconds']:.2f}s, "
+                  f"memory {result['memory_mb']:.0f} MB (process peak RSS {result['peak_rss_mb']:.0f} MB)"
+                  + (f", p50 {result['latency']['p50_ms']:.2f} ms" if 'latency' in result else ''))
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': seed,
+            'n_queries': n_queries
+        },
+        'results': results
+    }
+
+def compare_results(baseline, current, threshold=0.2):
+    """
+    Flag metrics that got worse by more than `threshold` (relative).
+
+    Args:
+        baseline: Benchmark output dict of the reference run
+        current: Benchmark output dict of the new run
+        threshold: Allowed relative slowdown / memory growth
+
+    Returns:
+        List of regression descriptions (empty if none)
+    """
+    def metrics(result):
+        values = {'fit_seconds': result.get('fit_seconds'), 'memory_mb': result.get('memory_mb')}
+        for name, value in result.get('latency', {}).items():
+            if name.endswith('_ms'):
+                values[f'latency.{name}'] = value
+        return values
+
+    reference = {(r['component'], r['n_books']): metrics(r) for r in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        key = (result['component'], result['n_books'])
+        for name, value in metrics(result).items():
+            old = reference.get(key, {}).get(name)
+            if old and value is not None and value > old * (1 + threshold):
+                regressions.append(
+                    f'{key[0]} @ {key[1]:,} books: {name} {old:.3f} -> {value:.3f} '
+                    f'(+{(value / old - 1) * 100:.0f}%)'
+                )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the recommenders on synthetic data.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[10_000, 100_000],
+                        help='Catalog sizes to benchmark')
+    parser.add_argument('--components', nargs='+', default=COMPONENTS, choices=COMPONENTS)
+    parser.add_argument('--queries', type=int, default=200, help='Timed queries per recommender')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark_results.json', help='JSON output path')
+    parser.add_argument('--compare', help='Baseline JSON to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative change treated as a regression')
+    args = parser.parse_args()
+
+    output = run_benchmarks(args.scales, args.components, args.queries, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=2)
+    print(f'Results written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(json.load(f), output, args.threshold)
+        for regression in regressions:
+            print(f'REGRESSION: {regression}')
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+from persistence import save_arrays, load_arrays, check_shapes, to_storable
+
+class BookCatalog:
+    def __init__(self, books_data, columns=('title', 'authors')):
+        """
+        Initialize an array-backed book catalog shared by the recommenders.
+
+        Row positions match the rows of `books_data` (and therefore the rows of
+        any feature matrix built from it). Duplicate book IDs resolve to their
+        first row.
+
+        Args:
+            books_data: DataFrame with a book_id column and book information
+            columns: Columns to keep as arrays for building results
+        """
+        self.source = None
+        self._set_columns(
+            books_data['book_id'].to_numpy(),
+            {col: books_data[col].to_numpy() for col in columns}
+        )
+
+    def _set_columns(self, book_ids, columns):
+        """Store the column arrays and build the book_id index."""
+        self.book_ids = book_ids
+        self.columns = {'book_id': self.book_ids}
+        self.columns.update(columns)
+
+        # Hashed book_id -> first row position index
+        first = ~pd.Index(self.book_ids).duplicated()
+        self.index = pd.Index(self.book_ids[first])
+        self.first_positions = np.flatnonzero(first)
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    def __contains__(self, book_id):
+        return book_id in self.index
+
+    def position(self, book_id):
+        """
+        Get the row position of a book.
+
+        Args:
+            book_id: ID of the book
+
+        Returns:
+            Row position of the book
+
+        Raises:
+            KeyError: If the book is not in the catalog
+        """
+        return int(self.first_positions[self.index.get_loc(book_id)])
+
+    def positions(self, book_ids):
+        """
+        Get the row positions of many books at once.
+
+        Args:
+            book_ids: Array-like of book IDs
+
+        Returns:
+            Integer array of row positions, -1 for unknown books
+        """
+        locs = self.index.get_indexer(np.asarray(book_ids))
+        return np.where(locs >= 0, self.first_positions[locs], -1)
+
+    def take(self, positions, columns=('title', 'authors'), **scores):
+        """
+        Build a result DataFrame for the given rows in one fancy-indexing step.
+
+        Args:
+            positions: Integer array of row positions
+            columns: Catalog columns to include
+            **scores: Extra per-row columns (e.g. similarity_score) to append
+
+        Returns:
+            DataFrame with the requested columns followed by the score columns
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        result = {col: self.columns[col][positions] for col in columns}
+        result.update({name: np.asarray(values) for name, values in scores.items()})
+        return pd.DataFrame(result)
+
+    def add_books(self, books_data):
+        """
+        Append books to the end of the catalog.
+
+        Existing rows keep their positions. IDs already in the catalog keep
+        resolving to their first row.
+
+        Args:
+            books_data: DataFrame with the catalog columns for the new books
+
+        Returns:
+            Row positions assigned to the new books
+        """
+        start = len(self.book_ids)
+        new_ids = books_data['book_id'].to_numpy()
+        self.book_ids = np.concatenate([self.book_ids, new_ids])
+        self.columns = {
+            col: self.book_ids if col == 'book_id' else
+            np.concatenate([values, books_data[col].to_numpy()])
+            for col, values in self.columns.items()
+        }
+
+        # Index only IDs that are new to the catalog
+        first = ~pd.Index(new_ids).duplicated() & ~pd.Index(new_ids).isin(self.index)
+        self.index = self.index.append(pd.Index(new_ids[first]))
+        self.first_positions = np.concatenate([self.first_positions, start + np.flatnonzero(first)])
+        return np.arange(start, len(self.book_ids))
+
+    def save(self, path, source=None):
+        """
+        Save the catalog columns as versioned .npy arrays.
+
+        Args:
+            path: Directory to write the artifact into
+            source: Optional JSON-serializable description of the data the
+                catalog was built from (e.g. persistence.file_fingerprint),
+                restored as `source` on load
+        """
+        columns = [col for col in self.columns if col != 'book_id']
+        arrays = {f'column_{col}': to_storable(self.columns[col]) for col in columns}
+        arrays['book_id'] = to_storable(self.book_ids)
+        save_arrays(path, 'book_catalog', arrays, meta={'columns': columns, 'source': source})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a catalog saved with save().
+
+        Args:
+            path: Artifact directory
+            mmap: Memory-map the column arrays instead of reading them into RAM
+
+        Returns:
+            BookCatalog
+
+        Raises:
+            ValueError: If the columns do not all have one entry per book
+        """
+        arrays, meta = load_arrays(path, 'book_catalog', mmap=mmap)
+        check_shapes(path, {f'column_{col}': (arrays[f'column_{col}'].shape, arrays['book_id'].shape)
+                            for col in meta['columns']})
+        catalog = cls.__new__(cls)
+        catalog.source = meta.get('source')
+        catalog._set_columns(
+            arrays['book_id'],
+            {col: arrays[f'column_{col}'] for col in meta['columns']}
+        )
+        return catalog
@@ -1,88 +1,617 @@
 import pandas as pd
 import numpy as np
+from scipy import sparse
 from sklearn.metrics.pairwise import cosine_similarity
+from book_catalog import BookCatalog
+from recommendation_cache import next_model_version
+from metrics import instrument
+from user_recommender import UserRecommender
+from persistence import save_arrays, load_arrays, check_shapes, csr_to_arrays, arrays_to_csr, to_storable
 
-class CollaborativeRecommender:
-    def __init__(self):
-        """Initialize collaborative filtering recommender."""
+# Bytes per entry of a sparse similarity block: the product's value and
+# column index plus the row index and sort order used to select the top k
+BLOCK_ENTRY_BYTES = 32
+
+class CollaborativeRecommender(UserRecommender):
+    metrics_prefix = 'collaborative'
+
+    def __init__(self, n_neighbors=50, block_memory_mb=256, rebuild_every=None, fallback=None):
+        """
+        Initialize collaborative filtering recommender.
+
+        Args:
+            n_neighbors: Number of most similar items kept per item. Use None
+                to keep the full dense item-item similarity matrix.
+            block_memory_mb: Upper bound (in MB) for the block of similarities
+                computed at once while building the neighbor lists
+            rebuild_every: Run a full similarity rebuild after this many
+                incremental add_ratings calls (None never rebuilds automatically)
+            fallback: Optional fitted PopularityIndex serving users without
+                ratings (cold start)
+        """
+        self.n_neighbors = n_neighbors
+        self.block_memory_mb = block_memory_mb
+        self.rebuild_every = rebuild_every
+        self.fallback = fallback
         self.user_item_matrix = None
+        self.item_user_matrix = None
         self.similarity_matrix = None
-        self.books_data = None
+        self.catalog = None
+        self.source = None
+        self.version = next_model_version()
 
-    def fit(self, ratings_data, books_data):
+    @instrument('collaborative.fit_matrix')
+    def fit_matrix(self, user_item_matrix, user_ids, book_ids, books_data):
         """
-        Fit the collaborative filtering model.
-        
+        Fit the model on a prebuilt user-item matrix (e.g. RatingsStore.user_item_matrix).
+
+        Args:
+            user_item_matrix: Sparse (n_users x n_books) rating matrix
+            user_ids: User ID of every matrix row
+            book_ids: Book ID of every matrix column
+            books_data: BookCatalog (or DataFrame) with book information
+        """
+        self.catalog = books_data if isinstance(books_data, BookCatalog) else BookCatalog(books_data)
+        self.user_ids = np.asarray(user_ids)
+        self.book_ids = np.asarray(book_ids)
+        self.user_item_matrix = sparse.csr_matrix(user_item_matrix, dtype=np.float64)
+        self.user_item_matrix.eliminate_zeros()
+        self.item_user_matrix = None
+
+        self._build_indices()
+        self.rebuild()
+
+    def partial_fit(self, ratings_data, books_data=None):
+        """
+        Fit the model on the first call and add ratings incrementally afterwards.
+
         Args:
             ratings_data: DataFrame with columns [user_id, book_id, rating]
-            books_data: DataFrame with book information
-        """
-        self.books_data = books_data.copy()  # Make a copy to avoid warnings
-        
-        # Create user-item matrix
-        self.user_item_matrix = pd.pivot_table(
-            ratings_data,
-            values='rating',
-            index='user_id',
-            columns='book_id',
-            fill_value=0
-        )
-        
+            books_data: BookCatalog (or DataFrame), required on the first call
+        """
+        if self.user_item_matrix is None:
+            self.fit(ratings_data, books_data)
+        else:
+            self.add_ratings(ratings_data)
+
+    def rebuild(self):
+        """Recompute the item norms and the full item-item similarity from the current ratings."""
+        self.item_norms = np.sqrt(np.asarray(
+            self.user_item_matrix.multiply(self.user_item_matrix).sum(axis=0)
+        ).ravel())
+
         # Calculate item-item similarity
-        self.similarity_matrix = cosine_similarity(self.user_item_matrix.T)
-        
-        # Create a mapping of matrix indices to book_ids
-        self.book_indices = {book_id: idx for idx, book_id in 
-                           enumerate(self.user_item_matrix.columns)}
-        self.inverse_book_indices = {idx: book_id for book_id, idx in 
-                                   self.book_indices.items()}
-
-    def get_recommendations(self, user_id, n_recommendations=5):
-        """
-        Get personalized recommendations for a user.
-        
+        if self.n_neighbors is None:
+            self.similarity_matrix = cosine_similarity(self.user_item_matrix.T)
+        else:
+            self.similarity_matrix = self._top_k_similarity()
+
+        self._update_scoring_cache()
+        self.updates_since_rebuild = 0
+        self.version = next_model_version()
+
+    def _update_scoring_cache(self):
+        """Cache prediction normalizers and the row-major transposed similarity matrix."""
+        # Sum of absolute similarities per item
+        self.similarity_sums = np.asarray(abs(self.similarity_matrix).sum(axis=1)).ravel()
+        self.similarity_sums[self.similarity_sums == 0] = 1e-10
+
+        # R @ S.T with S.T stored as CSR only touches the rows of rated items
+        if sparse.issparse(self.similarity_matrix):
+            self.similarity_matrix_t = self.similarity_matrix.T.tocsr()
+        else:
+            self.similarity_matrix_t = self.similarity_matrix.T
+
+    @instrument('collaborative.add_ratings')
+    def add_ratings(self, ratings_data):
+        """
+        Add new ratings without a full refit.
+
+        New users and books are appended to the matrices, a new rating for an
+        existing (user, book) pair replaces the old one, and only the
+        similarity rows and neighbor lists touching the rated books are
+        recomputed. Neighbor lists of unaffected items can only gain entries,
+        so an item that drops out of a list is not backfilled until the next
+        rebuild().
+
+        The work follows the rows that change: the rated users' and books'
+        rows are merged and spliced into the rating matrices (an item-major
+        copy is kept for this after the first call), and only the changed
+        similarity rows are spliced into the similarity matrix, its
+        transpose and the similarity sums.
+
+        Args:
+            ratings_data: DataFrame with columns [user_id, book_id, rating]
+        """
+        ratings = (ratings_data.dropna(subset=['rating'])
+                   .groupby(['user_id', 'book_id'])['rating'].mean()
+                   .reset_index())
+        if ratings.empty:
+            return
+
+        # Register unseen users and books at the end of the matrix (lookups
+        # per rating: mapping through the whole index dicts costs O(model))
+        new_users = [user_id for user_id in pd.unique(ratings['user_id']) if user_id not in self.user_indices]
+        new_books = [book_id for book_id in pd.unique(ratings['book_id']) if book_id not in self.book_indices]
+        self.user_indices.update({user_id: len(self.user_ids) + i for i, user_id in enumerate(new_users)})
+        self.book_indices.update({book_id: len(self.book_ids) + i for i, book_id in enumerate(new_books)})
+        self.user_ids = np.concatenate([self.user_ids, np.asarray(new_users, dtype=self.user_ids.dtype)])
+        self.book_ids = np.concatenate([self.book_ids, np.asarray(new_books, dtype=self.book_ids.dtype)])
+        n_users, n_items = len(self.user_ids), len(self.book_ids)
+
+        # Merge the new ratings into the rated users' and books' rows only
+        user_codes = np.array([self.user_indices[user_id] for user_id in ratings['user_id']], dtype=np.int64)
+        book_codes = np.array([self.book_indices[book_id] for book_id in ratings['book_id']], dtype=np.int64)
+        values = ratings['rating'].to_numpy(dtype=np.float64)
+        users, affected = np.unique(user_codes), np.unique(book_codes)
+        item_user = self._item_user()
+        user_rows = self._merged_rows(self.user_item_matrix, users, user_codes, book_codes, values, n_items)
+        item_rows = self._merged_rows(item_user, affected, book_codes, user_codes, values, n_users)
+        self.user_item_matrix = self._splice_rows(self.user_item_matrix, users, user_rows, (n_users, n_items))
+        self.item_user_matrix = self._splice_rows(item_user, affected, item_rows, (n_items, n_users))
+        self.catalog_positions = self.catalog.positions(self.book_ids)
+
+        self.updates_since_rebuild += 1
+        if self.rebuild_every and self.updates_since_rebuild >= self.rebuild_every:
+            self.rebuild()
+            return
+
+        self.item_norms = np.concatenate([self.item_norms, np.zeros(len(new_books))])
+        self.item_norms[affected] = np.sqrt(np.asarray(item_rows.multiply(item_rows).sum(axis=1)).ravel())
+        self._update_similarity(affected, item_rows)
+        self.version = next_model_version()
+
+    def _item_user(self):
+        """Get the item-major (items x users) copy of the ratings, building it on first use."""
+        if self.item_user_matrix is None:
+            self.item_user_matrix = self.user_item_matrix.T.tocsr()
+        return self.item_user_matrix
+
+    @staticmethod
+    def _merged_rows(matrix, rows, row_codes, col_codes, values, n_cols):
+        """
+        Build updated copies of some rows of a CSR matrix.
+
+        Args:
+            matrix: CSR matrix with the current entries
+            rows: Sorted row positions to update; positions past the end of
+                matrix are new, empty rows
+            row_codes: Row of every update
+            col_codes: Column of every update
+            values: Value of every update (one per (row, col)); 0 removes the entry
+            n_cols: Number of columns of the result
+
+        Returns:
+            CSR (len(rows) x n_cols) matrix of the updated rows
+        """
+        current = matrix[rows[:np.searchsorted(rows, matrix.shape[0])]].tocoo()
+        local_rows = np.concatenate([current.row, np.searchsorted(rows, row_codes)])
+        cols = np.concatenate([current.col, col_codes])
+        merged = np.concatenate([current.data, values])
+
+        # Updates come last, so the last entry per (row, col) in a stable sort wins
+        keys = local_rows.astype(np.int64) * n_cols + cols
+        order = np.argsort(keys, kind='stable')
+        last = order[np.r_[keys[order][1:] != keys[order][:-1], True]] if len(keys) else order
+        last = last[merged[last] != 0]
+        return sparse.csr_matrix((merged[last], (local_rows[last], cols[last])), shape=(len(rows), n_cols))
+
+    @staticmethod
+    def _splice_rows(matrix, rows, replacement, shape):
+        """
+        Replace some rows of a CSR matrix, copying the other rows as contiguous runs.
+
+        Args:
+            matrix: CSR matrix to update; may have fewer rows and columns than shape
+            rows: Sorted positions of the replaced rows
+            replacement: CSR (len(rows) x shape[1]) matrix with the new rows
+            shape: Shape of the result
+
+        Returns:
+            New CSR matrix
+        """
+        old_rows = matrix.shape[0]
+        lengths = np.zeros(shape[0], dtype=np.int64)
+        lengths[:old_rows] = np.diff(matrix.indptr)
+        lengths[rows] = np.diff(replacement.indptr)
+        indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+
+        index_dtype = np.int32 if max(shape[0], shape[1], indptr[-1]) < np.iinfo(np.int32).max else np.int64
+        data = np.empty(indptr[-1], dtype=matrix.dtype)
+        indices = np.empty(indptr[-1], dtype=index_dtype)
+
+        # Runs of untouched rows keep their order, so each run is one slice copy
+        kept = np.ones(old_rows, dtype=bool)
+        kept[rows[rows < old_rows]] = False
+        edges = np.flatnonzero(np.diff(np.r_[0, kept.view(np.int8), 0]))
+        for start, stop in zip(edges[::2], edges[1::2]):
+            source = slice(matrix.indptr[start], matrix.indptr[stop])
+            target = slice(indptr[start], indptr[stop])
+            data[target] = matrix.data[source]
+            indices[target] = matrix.indices[source]
+
+        replacement_lengths = np.diff(replacement.indptr)
+        targets = (np.repeat(indptr[rows] - replacement.indptr[:-1], replacement_lengths)
+                   + np.arange(replacement.nnz))
+        data[targets] = replacement.data
+        indices[targets] = replacement.indices
+        return sparse.csr_matrix((data, indices, indptr.astype(index_dtype)), shape=shape)
+
+    def _item_vectors(self):
+        """Get L2-normalized item vectors (items x users) from the cached item norms."""
+        inverse_norms = np.divide(1.0, self.item_norms, out=np.zeros_like(self.item_norms),
+                                  where=self.item_norms > 0)
+        item_vectors = sparse.diags(inverse_norms.astype(np.float32)) @ self.user_item_matrix.T.tocsr()
+        return item_vectors.astype(np.float32).tocsr()
+
+    def _similarity_block(self, vectors, inverse_norms):
+        """
+        Compute cosine similarities between some items and every item.
+
+        Args:
+            vectors: CSR (n x n_users) L2-normalized rating vectors of the items
+            inverse_norms: Inverse norm of every item (0 for items without ratings)
+
+        Returns:
+            CSR (n x n_items) float32 similarity block
+        """
+        # vectors @ R @ diag(inverse_norms), scaling the product instead of a copy of R
+        block = (vectors @ self.user_item_matrix).tocsr()
+        block.data *= inverse_norms[block.indices]
+        return block.astype(np.float32)
+
+    def _update_similarity(self, affected, item_rows):
+        """
+        Recompute similarities between the affected items and all items.
+
+        Only the neighbor lists that change are rebuilt. They are spliced
+        into the similarity matrix and its transpose, and only their
+        similarity sums are recomputed.
+
+        Args:
+            affected: Sorted array of item positions whose ratings changed
+            item_rows: CSR (len(affected) x n_users) ratings of the affected items
+        """
+        n_items = len(self.book_ids)
+        inverse_norms = np.divide(1.0, self.item_norms, out=np.zeros_like(self.item_norms),
+                                  where=self.item_norms > 0)
+        vectors = (sparse.diags(inverse_norms[affected]) @ item_rows).tocsr()
+
+        if self.n_neighbors is None:
+            self._update_dense_similarity(affected, vectors, inverse_norms)
+            return
+
+        k = min(self.n_neighbors, max(n_items - 1, 0))
+        similarity, similarity_t = self.similarity_matrix, self.similarity_matrix_t
+        old_items = similarity.shape[0]
+        is_affected = np.zeros(n_items, dtype=bool)
+        is_affected[affected] = True
+
+        rows, cols, values = [], [], []
+        candidate_rows, candidate_cols, candidate_values = [], [], []
+        for start, stop in self._row_blocks(vectors, np.diff(self.user_item_matrix.indptr), n_items):
+            items = affected[start:stop]
+            block = self._similarity_block(vectors[start:stop], inverse_norms)
+
+            # Fresh neighbor lists for the affected items
+            if k > 0:
+                block_rows, block_cols, block_values = self._sparse_block_top_k(block, items, k)
+                rows.append(block_rows)
+                cols.append(block_cols)
+                values.append(block_values)
+
+            # Candidate entries for the other items' neighbor lists
+            offsets = np.repeat(np.arange(len(items)), np.diff(block.indptr))
+            keep = (block.data > 0) & ~is_affected[block.indices]
+            candidate_rows.append(block.indices[keep])
+            candidate_cols.append(items[offsets[keep]])
+            candidate_values.append(block.data[keep])
+        candidate_rows = np.concatenate(candidate_rows)
+        candidate_cols = np.concatenate(candidate_cols)
+        candidate_values = np.concatenate(candidate_values)
+
+        # Lists holding an affected item lose that entry and have to be redone
+        stale = np.zeros(n_items, dtype=bool)
+        stale[similarity_t[affected[affected < old_items]].indices] = True
+
+        # Other lists only change when a candidate beats their current k-th entry
+        candidate_lists = np.unique(candidate_rows)
+        lists = similarity[candidate_lists]
+        lengths = np.diff(lists.indptr)
+        full = (lengths >= k) & (lengths > 0)
+        thresholds = np.full(n_items, -np.inf)
+        if full.any():
+            thresholds[candidate_lists[full]] = np.minimum.reduceat(lists.data, lists.indptr[:-1][full])
+        keep = stale[candidate_rows] | (candidate_values > thresholds[candidate_rows])
+        changed = np.union1d(affected, np.union1d(np.flatnonzero(stale), candidate_rows[keep]))
+
+        # Rebuild the changed lists: kept entries plus candidates, top k per row
+        previous = similarity[changed[changed < old_items]].tocoo()
+        previous_rows = changed[previous.row]
+        keep_previous = ~is_affected[previous_rows] & ~is_affected[previous.col]
+        rows += [previous_rows[keep_previous], candidate_rows[keep]]
+        cols += [previous.col[keep_previous], candidate_cols[keep]]
+        values += [previous.data[keep_previous], candidate_values[keep]]
+        rows, cols, values = np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+
+        order = np.lexsort((-values, rows))
+        rows, cols, values = rows[order], cols[order], values[order]
+        keep = np.arange(len(rows)) - np.searchsorted(rows, rows) < k
+        rows, cols, values = rows[keep], cols[keep], values[keep].astype(np.float32)
+
+        replacement = sparse.csr_matrix((values, (np.searchsorted(changed, rows), cols)),
+                                        shape=(len(changed), n_items))
+        self.similarity_matrix = self._splice_rows(similarity, changed, replacement, (n_items, n_items))
+
+        # Transposed copy: only the columns with an entry that was removed, added or changed
+        previous_keys = previous_rows.astype(np.int64) * n_items + previous.col
+        keys = rows.astype(np.int64) * n_items + cols
+        _, previous_common, common = np.intersect1d(previous_keys, keys, assume_unique=True, return_indices=True)
+        same = previous.data[previous_common] == values[common]
+        previous_differs = np.ones(len(previous_keys), dtype=bool)
+        previous_differs[previous_common[same]] = False
+        differs = np.ones(len(keys), dtype=bool)
+        differs[common[same]] = False
+        columns = np.union1d(previous.col[previous_differs], cols[differs])
+
+        in_changed = np.zeros(n_items, dtype=bool)
+        in_changed[changed] = True
+        in_columns = np.zeros(n_items, dtype=bool)
+        in_columns[columns] = True
+        previous_t = similarity_t[columns[columns < old_items]].tocoo()
+        keep_t = ~in_changed[previous_t.col]
+        added = in_columns[cols]
+        rows_t = np.concatenate([columns[previous_t.row[keep_t]], cols[added]])
+        cols_t = np.concatenate([previous_t.col[keep_t], rows[added]])
+        values_t = np.concatenate([previous_t.data[keep_t], values[added]])
+        replacement_t = sparse.csr_matrix((values_t, (np.searchsorted(columns, rows_t), cols_t)),
+                                          shape=(len(columns), n_items))
+        self.similarity_matrix_t = self._splice_rows(similarity_t, columns, replacement_t, (n_items, n_items))
+
+        similarity_sums = np.full(n_items, 1e-10)
+        similarity_sums[:old_items] = self.similarity_sums
+        changed_sums = np.asarray(abs(replacement).sum(axis=1)).ravel()
+        changed_sums[changed_sums == 0] = 1e-10
+        similarity_sums[changed] = changed_sums
+        self.similarity_sums = similarity_sums
+
+    def _update_dense_similarity(self, affected, vectors, inverse_norms):
+        """
+        Overwrite the affected rows and columns of the dense similarity matrix.
+
+        Args:
+            affected: Sorted array of item positions whose ratings changed
+            vectors: CSR L2-normalized rating vectors of the affected items
+            inverse_norms: Inverse norm of every item
+        """
+        n_items = len(self.book_ids)
+        old_items = self.similarity_matrix.shape[0]
+        similarity_sums = np.full(n_items, 1e-10)
+        similarity_sums[:old_items] = self.similarity_sums
+        if old_items < n_items:
+            similarity = np.zeros((n_items, n_items))
+            similarity[:old_items, :old_items] = self.similarity_matrix
+        else:
+            # Copy only when the matrix is a read-only memory map
+            similarity = self.similarity_matrix if self.similarity_matrix.flags.writeable \
+                else np.array(self.similarity_matrix)
+
+        # Patch the sums by the change in the affected columns, then redo the affected rows
+        similarity_sums -= np.abs(similarity[:, affected]).sum(axis=1)
+        block_size = self._block_size(n_items)
+        for start in range(0, len(affected), block_size):
+            items = affected[start:start + block_size]
+            block = self._similarity_block(vectors[start:start + block_size], inverse_norms).toarray()
+            similarity[items, :] = block
+            similarity[:, items] = block.T
+        similarity_sums += np.abs(similarity[:, affected]).sum(axis=1)
+        similarity_sums[affected] = np.abs(similarity[affected]).sum(axis=1)
+        # Delta updates leave rounding residue where a sum should be exactly 0
+        similarity_sums[similarity_sums <= 1e-10] = 1e-10
+
+        self.similarity_matrix = similarity
+        self.similarity_matrix_t = similarity.T
+        self.similarity_sums = similarity_sums
+
+    def _block_size(self, n_items):
+        """Number of item rows whose dense similarity block fits in block_memory_mb."""
+        # The dense float32 block plus the sparse product (value and column) it is built from
+        bytes_per_row = n_items * (2 * np.dtype(np.float32).itemsize + np.dtype(np.int32).itemsize)
+        return max(1, int(self.block_memory_mb * 1024 ** 2 // bytes_per_row))
+
+    def _row_blocks(self, item_vectors, user_counts, n_items):
+        """
+        Split item rows into blocks whose sparse similarity products fit in block_memory_mb.
+
+        A row of the product has at most as many entries as the ratings of
+        the users who rated the item (capped at n_items), so the bound takes
+        one pass over the item's ratings instead of the product itself.
+
+        Args:
+            item_vectors: CSR (rows x n_users) matrix of the items to score
+            user_counts: Number of rated items per user
+            n_items: Number of columns of the product
+
+        Yields:
+            (start, stop) row ranges of item_vectors
+        """
+        n_rows = item_vectors.shape[0]
+        row_of_entry = np.repeat(np.arange(n_rows), np.diff(item_vectors.indptr))
+        entries = np.minimum(
+            np.bincount(row_of_entry, weights=user_counts[item_vectors.indices], minlength=n_rows),
+            n_items
+        )
+        cumulative = np.cumsum(entries * BLOCK_ENTRY_BYTES)
+        budget = self.block_memory_mb * 1024 ** 2
+
+        start = 0
+        while start < n_rows:
+            base = cumulative[start - 1] if start else 0
+            stop = max(start + 1, int(np.searchsorted(cumulative, base + budget, side='right')))
+            yield start, stop
+            start = stop
+
+    @staticmethod
+    def _sparse_block_top_k(block, items, k):
+        """
+        Select the k most similar positive entries for each row of a sparse block.
+
+        Only the stored entries of each row (its indptr segment) are ranked,
+        so the cost follows the block's nonzeros rather than n_items.
+
+        Args:
+            block: CSR (len(items) x n_items) similarity block
+            items: Item positions of the block rows
+            k: Number of neighbors per row
+
+        Returns:
+            Tuple of (rows, cols, values) arrays for the kept entries, sorted
+            by row and then by descending similarity
+        """
+        offsets = np.repeat(np.arange(block.shape[0]), np.diff(block.indptr))
+        rows = np.asarray(items)[offsets]
+
+        # Exclude each item from its own neighbor list
+        keep = (block.data > 0) & (block.indices != rows)
+        offsets, cols, values = offsets[keep], block.indices[keep], block.data[keep]
+
+        order = np.lexsort((-values, offsets))
+        offsets, cols, values = offsets[order], cols[order], values[order]
+        keep = np.arange(len(offsets)) - np.searchsorted(offsets, offsets) < k
+        return np.asarray(items)[offsets[keep]], cols[keep], values[keep]
+
+    def _top_k_similarity(self):
+        """
+        Build a sparse item-item matrix holding the top-k neighbors per item.
+
+        Similarities are computed as sparse products for a block of items
+        at a time, sized so that one block's product and selection stay
+        within `block_memory_mb`. Each row's top k is selected among its
+        nonzeros only, so sparse ratings never pay for n_items-wide rows.
+
+        Returns:
+            CSR matrix of shape (n_items, n_items) with at most k entries per row
+        """
+        item_vectors = self._item_vectors()
+        # CSR on both sides: a row's product only visits the items its users rated
+        item_vectors_t = item_vectors.T.tocsr()
+        n_items = item_vectors.shape[0]
+        k = min(self.n_neighbors, max(n_items - 1, 0))
+        if k == 0:
+            return sparse.csr_matrix((n_items, n_items), dtype=np.float32)
+
+        rows, cols, values = [], [], []
+        for start, stop in self._row_blocks(item_vectors, np.diff(item_vectors_t.indptr), n_items):
+            block = item_vectors[start:stop] @ item_vectors_t
+            block_rows, block_cols, block_values = self._sparse_block_top_k(block, np.arange(start, stop), k)
+            rows.append(block_rows)
+            cols.append(block_cols)
+            values.append(block_values)
+
+        return sparse.csr_matrix(
+            (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(n_items, n_items)
+        )
+
+    def _predict_ratings(self, user_rows):
+        """
+        Predict ratings for every item for a block of users.
+
+        Args:
+            user_rows: Array of user rows of the user-item matrix
+
+        Returns:
+            Dense array of predicted ratings with already-rated items set to -inf
+        """
+        user_ratings = self.user_item_matrix[user_rows]
+        weighted_sums = user_ratings @ self.similarity_matrix_t
+        if sparse.issparse(weighted_sums):
+            weighted_sums = weighted_sums.toarray()
+        predicted_ratings = np.asarray(weighted_sums, dtype=np.float64) / self.similarity_sums
+
+        # Mask items the users have already rated
+        rated_users, rated_items = user_ratings.nonzero()
+        predicted_ratings[rated_users, rated_items] = -np.inf
+        return predicted_ratings
+
+    def save(self, path, source=None):
+        """
+        Save the fitted model as versioned .npy arrays.
+
+        The catalog is not included; save it separately with BookCatalog.save.
+
         Args:
-            user_id: ID of the user to recommend for
-            n_recommendations: Number of recommendations to return
-        
+            path: Directory to write the artifact into
+            source: Optional JSON-serializable description of the ratings the
+                model was fitted on (e.g. RatingsStore.fingerprint), restored
+                as `source` on load
+        """
+        arrays = {
+            'user_ids': to_storable(self.user_ids),
+            'book_ids': to_storable(self.book_ids),
+            'similarity_sums': self.similarity_sums,
+            'item_norms': self.item_norms,
+            **csr_to_arrays('user_item', self.user_item_matrix)
+        }
+        dense_similarity = not sparse.issparse(self.similarity_matrix)
+        if dense_similarity:
+            arrays['similarity'] = self.similarity_matrix
+        else:
+            arrays.update(csr_to_arrays('similarity', self.similarity_matrix))
+            arrays.update(csr_to_arrays('similarity_t', self.similarity_matrix_t))
+
+        save_arrays(path, 'collaborative_recommender', arrays, meta={
+            'n_neighbors': self.n_neighbors,
+            'block_memory_mb': self.block_memory_mb,
+            'rebuild_every': self.rebuild_every,
+            'dense_similarity': dense_similarity,
+            'source': source
+        })
+
+    @classmethod
+    def load(cls, path, catalog, mmap=True):
+        """
+        Load a model saved with save().
+
+        Args:
+            path: Artifact directory
+            catalog: BookCatalog to resolve recommended books against
+            mmap: Memory-map the matrices so processes can share their pages
+
         Returns:
-            DataFrame with recommended books
-        """
-        if user_id not in self.user_item_matrix.index:
-            return pd.DataFrame(columns=['title', 'authors', 'predicted_rating'])
-            
-        # Get user's ratings
-        user_ratings = self.user_item_matrix.loc[user_id]
-        
-        # Calculate predicted ratings using weighted sum
-        weighted_sums = np.dot(self.similarity_matrix, user_ratings)
-        similarity_sums = np.sum(np.abs(self.similarity_matrix), axis=1)
-        
-        # Avoid division by zero
-        similarity_sums[similarity_sums == 0] = 1e-10
-        predicted_ratings = weighted_sums / similarity_sums
-        
-        # Get indices of top recommended books
-        user_rated = user_ratings > 0
-        unrated_indices = np.where(~user_rated)[0]
-        
-        if len(unrated_indices) == 0:
-            return pd.DataFrame(columns=['title', 'authors', 'predicted_rating'])
-            
-        unrated_predictions = predicted_ratings[unrated_indices]
-        recommended_indices = unrated_indices[np.argsort(unrated_predictions)[::-1][:n_recommendations]]
-        
-        # Get book IDs for recommended indices
-        recommended_book_ids = [self.inverse_book_indices[idx] for idx in recommended_indices]
-        
-        # Get book details and predicted ratings
-        recommendations = []
-        for idx, book_id in zip(recommended_indices, recommended_book_ids):
-            book_info = self.books_data[self.books_data['book_id'] == book_id].iloc[0]
-            recommendations.append({
-                'title': book_info['title'],
-                'authors': book_info['authors'],
-                'predicted_rating': predicted_ratings[idx]
-            })
-        
-        return pd.DataFrame(recommendations)
+            Fitted CollaborativeRecommender
+
+        Raises:
+            ValueError: If the matrices do not match the saved users and books
+        """
+        arrays, meta = load_arrays(path, 'collaborative_recommender', mmap=mmap)
+        n_users, n_books = len(arrays['user_ids']), len(arrays['book_ids'])
+        similarity_shapes = ({'similarity': arrays['similarity'].shape} if meta['dense_similarity'] else
+                             {name: arrays[f'{name}_shape'] for name in ('similarity', 'similarity_t')})
+        check_shapes(path, {
+            'user_item': (arrays['user_item_shape'], (n_users, n_books)),
+            'similarity_sums': (arrays['similarity_sums'].shape, (n_books,)),
+            'item_norms': (arrays['item_norms'].shape, (n_books,)),
+            **{name: (shape, (n_books, n_books)) for name, shape in similarity_shapes.items()}
+        })
+        recommender = cls(n_neighbors=meta['n_neighbors'],
+                          block_memory_mb=meta['block_memory_mb'],
+                          rebuild_every=meta.get('rebuild_every'))
+        recommender.catalog = catalog
+        recommender.source = meta.get('source')
+        recommender.user_ids = arrays['user_ids']
+        recommender.book_ids = arrays['book_ids']
+        recommender.similarity_sums = arrays['similarity_sums']
+        recommender.item_norms = arrays['item_norms']
+        recommender.updates_since_rebuild = 0
+        recommender.user_item_matrix = arrays_to_csr('user_item', arrays)
+        if meta['dense_similarity']:
+            recommender.similarity_matrix = arrays['similarity']
+            recommender.similarity_matrix_t = recommender.similarity_matrix.T
+        else:
+            recommender.similarity_matrix = arrays_to_csr('similarity', arrays)
+            recommender.similarity_matrix_t = arrays_to_csr('similarity_t', arrays)
+
+        recommender._build_indices()
+        return recommender
@@ -1,63 +1,328 @@
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+from sklearn.preprocessing import normalize
 import numpy as np
 import pandas as pd
+from book_catalog import BookCatalog
+from recommendation_cache import RecommendationCache, next_model_version
+from metrics import instrument, timed
+from neighbor_table import build_neighbor_table
 
 class ContentBasedRecommender:
-    def __init__(self):
-        """Initialize content-based recommender."""
+    def __init__(self, ann_index=None, neighbor_table=None, query_cache_size=1024):
+        """
+        Initialize content-based recommender.
+
+        Args:
+            ann_index: Optional unfitted approximate nearest-neighbor index
+                (e.g. ClusterIndex) built at fit time. None uses exact search.
+            neighbor_table: Optional precomputed NeighborTable matching the
+                rows of the TF-IDF matrix passed to fit. Books it covers are
+                answered by lookup; others are computed live.
+            query_cache_size: Number of recent free-text query vectors kept
+        """
         self.tfidf_matrix = None
-        self.books_data = None
+        self.catalog = None
+        self.vectorizer = None
+        self.ann_index = ann_index
+        self.neighbor_table = neighbor_table
+        self.query_cache_size = query_cache_size
+        self._query_cache = None
+        self.version = next_model_version()
+        self.vectorizer_version = self.version
 
-    def fit(self, tfidf_matrix, books_data):
+    @instrument('content.fit')
+    def fit(self, tfidf_matrix, books_data, vectorizer=None):
         """
         Fit the recommender with TF-IDF matrix and book data.
         
         Args:
             tfidf_matrix: TF-IDF matrix of book features
-            books_data: DataFrame containing book information
+            books_data: BookCatalog (or DataFrame) containing book information
+            vectorizer: Fitted vectorizer that produced tfidf_matrix
+                (DataProcessor.tfidf), needed for free-text queries
+
+        Raises:
+            ValueError: If the vectorizer does not match the matrix columns
+        """
+        if vectorizer is not None:
+            n_features = vectorizer.transform(['']).shape[1]
+            if n_features != tfidf_matrix.shape[1]:
+                raise ValueError(f"Vectorizer produces {n_features} features, "
+                                 f"but the TF-IDF matrix has {tfidf_matrix.shape[1]}")
+        self.tfidf_matrix = self._l2_normalized(tfidf_matrix)
+        self.catalog = books_data if isinstance(books_data, BookCatalog) else BookCatalog(books_data)
+        self.vectorizer = vectorizer
+        if self.ann_index is not None:
+            self.ann_index.fit(self.tfidf_matrix)
+        self.version = next_model_version()
+        # Cached query vectors only depend on the vectorizer, not on added books
+        self.vectorizer_version = self.version
+
+    def __getstate__(self):
+        # The query cache holds a lock and cannot be pickled (e.g. into worker processes)
+        state = self.__dict__.copy()
+        state['_query_cache'] = None
+        return state
+
+    def query_cache(self):
+        """Get the cache of recent free-text query vectors."""
+        if self._query_cache is None:
+            self._query_cache = RecommendationCache(max_size=self.query_cache_size, ttl=None)
+        return self._query_cache
+
+    def add_books(self, books_data, features):
+        """
+        Add books without rebuilding the TF-IDF matrix.
+
+        Args:
+            books_data: DataFrame with the new books' catalog columns
+            features: TF-IDF rows for the new books, transformed with the
+                existing vocabulary (see DataProcessor.add_books)
+        """
+        start = self.tfidf_matrix.shape[0]
+        self.catalog.add_books(books_data)
+        self.tfidf_matrix = sparse.vstack([self.tfidf_matrix, self._l2_normalized(features)],
+                                          format='csr')
+        if self.ann_index is not None:
+            self.ann_index.add(self.tfidf_matrix, start)
+        self.version = next_model_version()
+
+    def precompute_neighbors(self, n_neighbors=50, block_memory_mb=256, n_jobs=None,
+                             features_version=None):
+        """
+        Precompute the top content neighbors of every book and serve them by lookup.
+
+        Books added later with add_books are computed live (and do not
+        appear in older books' lists) until this is run again.
+
+        Args:
+            n_neighbors: Number of neighbors kept per book
+            block_memory_mb: Upper bound (in MB) for one block's scoring
+            n_jobs: Worker processes (defaults to the CPU count)
+            features_version: DataProcessor.features_version of the fitted
+                features, recorded in the table so a saved copy can be checked
+
+        Returns:
+            The NeighborTable, e.g. to save() it
+        """
+        self.neighbor_table = build_neighbor_table(self.tfidf_matrix, n_neighbors,
+                                                   block_memory_mb, n_jobs, features_version)
+        return self.neighbor_table
+
+    @staticmethod
+    def _l2_normalized(features):
+        """Return features with unit-length rows, copying only if they are not already."""
+        norms = np.sqrt(np.asarray(features.multiply(features).sum(axis=1)).ravel())
+        if np.all((norms == 0) | np.isclose(norms, 1.0, atol=1e-4)):
+            return features
+        return normalize(features)
+
+    def score_items(self, book_id):
         """
-        self.tfidf_matrix = tfidf_matrix
-        self.books_data = books_data.copy()  # Make a copy to avoid warnings
+        Score every catalog book by content similarity to one book.
+
+        Args:
+            book_id: ID of the book to compare against
+
+        Returns:
+            Array of cosine similarities indexed by catalog position, with the
+            book itself set to -inf
 
-    def get_recommendations(self, book_id, n_recommendations=5):
+        Raises:
+            KeyError: If the book is not in the catalog
+        """
+        book_idx = self.catalog.position(book_id)
+
+        # Rows are unit length, so the dot product is the cosine similarity
+        scores = self.tfidf_matrix @ self.tfidf_matrix[book_idx].toarray().ravel()
+        scores[book_idx] = -np.inf
+        return scores
+
+    def score_items_batch(self, book_ids):
+        """
+        Score every catalog book against many query books at once.
+
+        Args:
+            book_ids: IDs of the query books
+
+        Returns:
+            Dense (n_queries x n_catalog) array of cosine similarities, with
+            each query book set to -inf in its own row
+
+        Raises:
+            KeyError: If a book is not in the catalog
+        """
+        book_indices = np.array([self.catalog.position(book_id) for book_id in book_ids], dtype=np.int64)
+        scores = (self.tfidf_matrix[book_indices] @ self.tfidf_matrix.T).toarray()
+        scores[np.arange(len(book_indices)), book_indices] = -np.inf
+        return scores
+
+    @instrument('content.get_recommendations', profile=True)
+    def get_recommendations(self, book_id, n_recommendations=5, exact=False):
         """
         Get book recommendations based on content similarity.
         
         Args:
             book_id: ID of the book to base recommendations on
             n_recommendations: Number of recommendations to return
+            exact: Bypass the approximate index and score every book
         
         Returns:
             DataFrame with recommended books
         """
         try:
             # Get the index of the book
-            book_idx = self.books_data[self.books_data['book_id'] == book_id].index[0]
-            
-            # Calculate similarity scores
-            sim_scores = cosine_similarity(
-                self.tfidf_matrix[book_idx:book_idx+1], 
-                self.tfidf_matrix
-            ).flatten()
+            with timed('content.lookup'):
+                book_idx = self.catalog.position(book_id)
             
-            # Get indices of top similar books
-            similar_indices = np.argsort(sim_scores)[::-1][1:n_recommendations+1]
+            if self.neighbor_table is not None and self.neighbor_table.covers(book_idx, n_recommendations):
+                with timed('content.scoring'):
+                    similar_indices, similar_scores = self.neighbor_table.lookup(book_idx, n_recommendations)
+            elif self.ann_index is not None and not exact:
+                with timed('content.scoring'):
+                    similar_indices, similar_scores = self.ann_index.query(
+                        self.tfidf_matrix[book_idx:book_idx+1],
+                        n_recommendations,
+                        exclude=book_idx
+                    )
+            else:
+                # Calculate similarity scores (rows are unit length)
+                with timed('content.scoring'):
+                    sim_scores = self.tfidf_matrix @ self.tfidf_matrix[book_idx].toarray().ravel()
+                    sim_scores[book_idx] = -np.inf
+                
+                # Get indices of top similar books
+                with timed('content.selection'):
+                    n = min(n_recommendations, len(sim_scores) - 1)
+                    similar_indices = np.argpartition(-sim_scores, n - 1)[:n] if n > 0 else np.array([], dtype=np.int64)
+                    similar_indices = similar_indices[np.argsort(-sim_scores[similar_indices], kind='stable')]
+                    similar_scores = sim_scores[similar_indices]
             
             # Create recommendations dataframe
-            recommendations = []
-            for idx in similar_indices:
-                book_info = self.books_data.iloc[idx]
-                recommendations.append({
-                    'title': book_info['title'],
-                    'authors': book_info['authors'],
-                    'similarity_score': sim_scores[idx]
-                })
-            
-            return pd.DataFrame(recommendations)
+            with timed('content.assembly'):
+                return self.catalog.take(similar_indices, similarity_score=similar_scores)
             
         except (IndexError, KeyError):
             return pd.DataFrame(columns=['title', 'authors', 'similarity_score'])
 
+    def _query_vectors(self, texts):
+        """
+        Transform free-text queries into unit-length TF-IDF rows.
+
+        Recently seen queries come from the query cache; the others are
+        transformed together in one vectorizer call.
+
+        Args:
+            texts: Query strings
+
+        Returns:
+            Sparse (n_queries x n_features) CSR matrix
+
+        Raises:
+            ValueError: If the recommender was fitted without a vectorizer
+            TypeError: If a query is not a string
+        """
+        if self.vectorizer is None:
+            raise ValueError("Text queries need the fitted vectorizer: "
+                             "call fit(tfidf_matrix, books_data, vectorizer)")
+
+        cache = self.query_cache()
+        rows = [None] * len(texts)
+        missing = {}
+        for i, text in enumerate(texts):
+            if not isinstance(text, str):
+                raise TypeError(f"Text queries must be strings, got {type(text).__name__}")
+            # The vectorizer lowercases and tokenizes, so case and spacing never change the vector
+            key = ' '.join(text.lower().split())
+            found, row = cache.get(key, self.vectorizer_version)
+            if found:
+                rows[i] = row
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            with timed('content.query_transform'):
+                vectors = self._l2_normalized(self.vectorizer.transform(list(missing))).tocsr()
+            for j, (key, positions) in enumerate(missing.items()):
+                row = vectors[j]
+                cache.put(key, self.vectorizer_version, row)
+                for i in positions:
+                    rows[i] = row
+
+        return sparse.vstack(rows, format='csr')
+
+    def _text_scores(self, queries):
+        """Get dense (n_queries x n_catalog) cosine similarities for query rows."""
+        # Sparse catalog @ dense queries beats a sparse @ sparse product, whose
+        # output is nearly dense anyway for multi-word queries
+        return np.ascontiguousarray((self.tfidf_matrix @ queries.T.toarray()).T)
+
+    def score_texts(self, texts):
+        """
+        Score every catalog book against many free-text queries at once.
+
+        Args:
+            texts: Query strings
+
+        Returns:
+            Dense (n_queries x n_catalog) array of cosine similarities; books
+            sharing no term with a query are -inf, as search_batch never
+            recommends them
+        """
+        scores = self._text_scores(self._query_vectors(texts))
+        scores[scores <= 0] = -np.inf
+        return scores
+
+    @instrument('content.search_batch', profile=True)
+    def search_batch(self, texts, n_recommendations=5, block_memory_mb=64):
+        """
+        Find the books most similar to each of many free-text queries.
+
+        The queries are transformed in one vectorizer call and scored with
+        one matrix product per block of queries, followed by a partial top-n
+        selection per row. Books sharing no term with a query are never
+        recommended for it.
+
+        Args:
+            texts: Query strings
+            n_recommendations: Number of recommendations per query
+            block_memory_mb: Upper bound (in MB) for one dense block of scores
+
+        Returns:
+            List with one DataFrame of recommended books per query (fewer
+            than n_recommendations rows if fewer books match)
+
+        Raises:
+            ValueError: If the recommender was fitted without a vectorizer
+            TypeError: If a query is not a string
+        """
+        queries = self._query_vectors(texts) if len(texts) else None
+        n_items = self.tfidf_matrix.shape[0]
+        block_size = max(1, int(block_memory_mb * 1024 ** 2 // (max(n_items, 1) * np.dtype(np.float64).itemsize)))
+        k = min(n_recommendations, n_items)
+
+        results = []
+        for start in range(0, len(texts), block_size):
+            with timed('content.scoring'):
+                scores = self._text_scores(queries[start:start + block_size])
+
+            with timed('content.selection'):
+                if k <= 0:
+                    results.extend([(np.array([], dtype=np.int64), np.array([]))] * len(scores))
+                    continue
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                top_scores = np.take_along_axis(scores, top, axis=1)
+                order = np.argsort(-top_scores, axis=1, kind='stable')
+                top = np.take_along_axis(top, order, axis=1)
+                top_scores = np.take_along_axis(top_scores, order, axis=1)
+                for indices, similarity in zip(top, top_scores):
+                    matched = similarity > 0
+                    results.append((indices[matched], similarity[matched]))
+
+        with timed('content.assembly'):
+            return [self.catalog.take(indices, similarity_score=similarity)
+                    for indices, similarity in results]
+
     def get_similar_books_by_features(self, features, n_recommendations=5):
         """
         Get recommendations based on text features.
@@ -65,28 +330,12 @@ class ContentBasedRecommender:
         Args:
             features: Text features to base recommendations on
             n_recommendations: Number of recommendations to return
+
+        Returns:
+            DataFrame with recommended books
+
+        Raises:
+            ValueError: If the recommender was fitted without a vectorizer
+            TypeError: If features is not a string
         """
-        try:
-            # Transform input features
-            feature_matrix = self.tfidf.transform([features])
-            
-            # Calculate similarity
-            sim_scores = cosine_similarity(feature_matrix, self.tfidf_matrix).flatten()
-            
-            # Get indices of top similar books
-            similar_indices = np.argsort(sim_scores)[::-1][:n_recommendations]
-            
-            # Create recommendations dataframe
-            recommendations = []
-            for idx in similar_indices:
-                book_info = self.books_data.iloc[idx]
-                recommendations.append({
-                    'title': book_info['title'],
-                    'authors': book_info['authors'],
-                    'similarity_score': sim_scores[idx]
-                })
-            
-            return pd.DataFrame(recommendations)
-            
-        except Exception:
-            return pd.DataFrame(columns=['title', 'authors', 'similarity_score'])
+        return self.search_batch([features], n_recommendations)[0]
@@ -1,61 +1,423 @@
+import sys
+import uuid
 import pandas as pd
 import numpy as np
 from sklearn.model_selection import train_test_split
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer, TfidfTransformer
+from sklearn.pipeline import make_pipeline
+from sklearn.preprocessing import normalize
+from metrics import instrument
+from persistence import save_arrays, load_arrays, check_shapes, csr_to_arrays, arrays_to_csr
+
+# JSON-serializable TfidfVectorizer parameters stored alongside the vocabulary
+VECTORIZER_PARAMS = [
+    'analyzer', 'binary', 'lowercase', 'max_df', 'max_features', 'min_df',
+    'ngram_range', 'norm', 'smooth_idf', 'stop_words', 'strip_accents',
+    'sublinear_tf', 'token_pattern', 'use_idf'
+]
+
+# Source CSV columns read by load_data and their parse dtypes
+COLUMN_DTYPES = {
+    'bookId': str,
+    'title': str,
+    'author': str,
+    'description': str,
+    'genres': str,
+    'rating': 'float64',
+    'numRatings': 'float64'
+}
+
+# Source CSV column -> name used in our code
+COLUMN_RENAMES = {
+    'bookId': 'book_id',
+    'author': 'authors',
+    'numRatings': 'num_ratings'
+}
+
+# Parse dtypes that replace COLUMN_DTYPES in compact mode
+COMPACT_DTYPES = {
+    'rating': 'float32',
+    'numRatings': 'float32'
+}
+
+# Low-cardinality text columns stored as categoricals in compact mode
+CATEGORICAL_COLUMNS = ['authors']
+
+def split_frame(data, test_size=0.2, random_state=42):
+    """
+    Split a DataFrame into random training and testing rows.
+
+    Args:
+        data: DataFrame to split (e.g. ratings)
+        test_size: Fraction of rows held out
+        random_state: Seed of the split
+
+    Returns:
+        Tuple of (training rows, testing rows)
+    """
+    return train_test_split(data, test_size=test_size, random_state=random_state)
 
 class DataProcessor:
-    def __init__(self, file_path):
-        """Initialize DataProcessor with the path to the dataset."""
+    def __init__(self, file_path, compact=False):
+        """
+        Initialize DataProcessor with the path to the dataset.
+
+        Args:
+            file_path: Path to the CSV file
+            compact: Memory-lean mode: float32 numeric columns and TF-IDF
+                features, categorical authors and the smallest integer type
+                for user IDs
+        """
         self.file_path = file_path
+        self.compact = compact
         self.data = None
         self.train_data = None
         self.test_data = None
         self.tfidf_matrix = None
         self.tfidf = None
+        # Identifies the fitted features, so artifacts derived from them can be checked
+        self.features_version = None
 
-    def load_data(self, sample_size=None):
-        """Load and optionally sample the dataset."""
-        self.data = pd.read_csv(self.file_path)
-        if sample_size:
-            self.data = self.data[:sample_size]
-            
-        # Rename columns to match our code
-        self.data = self.data.rename(columns={
-            'bookId': 'book_id',
-            'author': 'authors',
-            'numRatings': 'num_ratings'
-        })
+    @classmethod
+    def from_frame(cls, data, compact=False):
+        """
+        Create a DataProcessor around an already loaded DataFrame.
+
+        Use this for data that does not come from a CSV file, such as
+        synthetic benchmark data; load_data is not needed.
+
+        Args:
+            data: DataFrame with the columns load_data would produce
+            compact: Memory-lean mode (see __init__); the frame itself is not converted
+
+        Returns:
+            DataProcessor with `data` set
+        """
+        processor = cls(None, compact=compact)
+        processor.data = data
+        return processor
+
+    @instrument('data.load_data')
+    def load_data(self, sample_size=None, chunksize=None):
+        """
+        Load and optionally sample the dataset.
+
+        Only the columns in COLUMN_DTYPES are parsed, and parsing stops once
+        `sample_size` rows have been read.
+
+        Args:
+            sample_size: Number of leading rows to load (None loads all)
+            chunksize: Stream the file in chunks of this many rows
+        """
+        chunks = list(self._read_chunks(COLUMN_DTYPES, sample_size, chunksize))
+        self.data = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0]
         
         # Add a user_id column for collaborative filtering
         self.data['user_id'] = self.data.index % 100  # Create 100 dummy users
         
+        if self.compact:
+            self.data = self._compacted(self.data)
         return self.data
 
-    def preprocess_text_features(self, text_columns):
-        """Create TF-IDF features from text columns."""
-        # Fill NaN values with empty string for each column
-        text_data = self.data[text_columns].fillna('')
-        
-        # Combine all text columns
-        combined_text = text_data.agg(' '.join, axis=1)
-        
-        self.tfidf = TfidfVectorizer(stop_words='english')
-        self.tfidf_matrix = self.tfidf.fit_transform(combined_text)
+    @staticmethod
+    def _compacted(data):
+        """Categorize low-cardinality text columns and downcast numeric columns."""
+        data = data.copy()
+        for col in CATEGORICAL_COLUMNS:
+            if col in data and not isinstance(data[col].dtype, pd.CategoricalDtype):
+                data[col] = data[col].astype('category')
+        for col in data.select_dtypes(include='float').columns:
+            data[col] = data[col].astype(np.float32)
+        for col in data.select_dtypes(include='integer').columns:
+            data[col] = pd.to_numeric(data[col], downcast='integer')
+        return data
+
+    def _read_chunks(self, columns, sample_size=None, chunksize=None):
+        """
+        Read the CSV, yielding renamed DataFrame chunks.
+
+        Args:
+            columns: Source column names to parse
+            sample_size: Stop after this many rows
+            chunksize: Rows per chunk (None yields one frame)
+        """
+        dtypes = {**COLUMN_DTYPES, **COMPACT_DTYPES} if self.compact else COLUMN_DTYPES
+        reader = pd.read_csv(
+            self.file_path,
+            usecols=lambda col: col in columns,
+            dtype={col: dtype for col, dtype in dtypes.items() if col in columns},
+            nrows=sample_size,
+            chunksize=chunksize
+        )
+        for chunk in ([reader] if chunksize is None else reader):
+            # Rename columns to match our code
+            yield chunk.rename(columns=COLUMN_RENAMES)
+
+    @staticmethod
+    def _combine_text(data, text_columns):
+        """Concatenate text columns with spaces using vectorized string ops."""
+        def text(col):
+            # Categoricals only accept their own categories as fill values
+            return data[col].astype(object).fillna('').astype(str)
+
+        combined = text(text_columns[0])
+        for col in text_columns[1:]:
+            combined = combined + ' ' + text(col)
+        return combined
+
+    @instrument('data.preprocess_text_features')
+    def preprocess_text_features(self, text_columns, chunksize=None, n_features=2 ** 20,
+                                 min_df=1, max_df=1.0, max_features=None):
+        """
+        Create TF-IDF features from text columns.
+
+        With `chunksize`, features are built chunk by chunk with a hashing
+        vectorizer (no vocabulary held in memory) and re-weighted by IDF at
+        the end. The chunks come from the loaded data or, if no data is
+        loaded, are streamed from the CSV file.
+
+        Features are float32 in compact mode and float64 otherwise.
+
+        Args:
+            text_columns: Columns to combine into the document text
+            chunksize: Rows per chunk for out-of-core feature building
+            n_features: Number of hash buckets in chunked mode
+            min_df: Drop terms in fewer documents than this (int) or fraction
+                of documents (float)
+            max_df: Drop terms in more documents than this (int) or fraction
+                of documents (float)
+            max_features: Keep only this many most frequent terms
+        """
+        dtype = np.float32 if self.compact else np.float64
+        self.features_version = uuid.uuid4().hex
+        if chunksize is None:
+            # Combine all text columns
+            combined_text = self._combine_text(self.data, text_columns)
+            
+            self.tfidf = TfidfVectorizer(stop_words='english', min_df=min_df, max_df=max_df,
+                                         max_features=max_features, dtype=dtype)
+            self.tfidf_matrix = self.tfidf.fit_transform(combined_text)
+            return self.tfidf_matrix
+
+        if self.data is not None:
+            chunks = (self.data.iloc[start:start + chunksize]
+                      for start in range(0, len(self.data), chunksize))
+        else:
+            source_names = {name: col for col, name in COLUMN_RENAMES.items()}
+            source_columns = [source_names.get(col, col) for col in text_columns]
+            chunks = self._read_chunks(source_columns, chunksize=chunksize)
+
+        hashing = self._make_hashing_vectorizer(n_features, dtype)
+        counts, document_frequency, n_documents = [], np.zeros(n_features), 0
+        for chunk in chunks:
+            chunk_counts = hashing.transform(self._combine_text(chunk, text_columns))
+            document_frequency += np.bincount(chunk_counts.indices, minlength=n_features)
+            n_documents += chunk_counts.shape[0]
+            counts.append(chunk_counts)
+
+        # Smoothed IDF, as computed by TfidfTransformer; pruned buckets get weight 0
+        idf = np.log((1 + n_documents) / (1 + document_frequency)) + 1
+        idf[~self._kept_features(document_frequency, n_documents, min_df, max_df, max_features)] = 0
+        self.tfidf_matrix = sparse.vstack(counts, format='csr')
+        self.tfidf_matrix.data *= idf[self.tfidf_matrix.indices].astype(dtype)
+        self.tfidf_matrix.eliminate_zeros()
+        normalize(self.tfidf_matrix, copy=False)
+
+        self.tfidf = self._make_hashed_tfidf(hashing, idf)
         return self.tfidf_matrix
 
+    def add_books(self, new_data, text_columns):
+        """
+        Append books and transform them with the already fitted vocabulary.
+
+        Args:
+            new_data: DataFrame of new books with the same columns as data
+            text_columns: Columns combined into the document text
+
+        Returns:
+            TF-IDF rows of the new books
+        """
+        new_data = new_data.copy()
+        if 'user_id' not in new_data:
+            new_data['user_id'] = np.arange(len(self.data), len(self.data) + len(new_data)) % 100
+
+        features = self.tfidf.transform(self._combine_text(new_data, text_columns))
+        self.data = pd.concat([self.data, new_data], ignore_index=True)
+        if self.compact:
+            # Concatenating categoricals with new values falls back to objects
+            self.data = self._compacted(self.data)
+        self.tfidf_matrix = sparse.vstack([self.tfidf_matrix, features], format='csr')
+        self.features_version = uuid.uuid4().hex
+        return features
+
+    @staticmethod
+    def _kept_features(document_frequency, n_documents, min_df, max_df, max_features):
+        """
+        Select features by document frequency, with TfidfVectorizer semantics.
+
+        Returns:
+            Boolean mask of the features to keep
+        """
+        min_count = min_df if isinstance(min_df, int) else min_df * n_documents
+        max_count = max_df if isinstance(max_df, int) else max_df * n_documents
+        kept = (document_frequency >= min_count) & (document_frequency <= max_count) & (document_frequency > 0)
+        if max_features is not None and kept.sum() > max_features:
+            candidates = np.flatnonzero(kept)
+            top = candidates[np.argsort(-document_frequency[candidates], kind='stable')[:max_features]]
+            kept = np.zeros_like(kept)
+            kept[top] = True
+        return kept
+
+    @staticmethod
+    def _make_hashing_vectorizer(n_features, dtype=np.float64):
+        """Create the term-count hashing vectorizer used in chunked mode."""
+        return HashingVectorizer(
+            n_features=n_features,
+            stop_words='english',
+            alternate_sign=False,
+            norm=None,
+            dtype=dtype
+        )
+
+    @staticmethod
+    def _make_hashed_tfidf(hashing, idf):
+        """Wrap a hashing vectorizer and fitted IDF weights into one transformer."""
+        transformer = TfidfTransformer()
+        transformer.idf_ = np.asarray(idf)
+        return make_pipeline(hashing, transformer)
+
+    def memory_report(self):
+        """
+        Break down the bytes held by the loaded data, features and vectorizer.
+
+        Object columns are measured including their strings, and categorical
+        columns including their categories.
+
+        Returns:
+            Dict with per-column 'data' bytes, 'tfidf_matrix' bytes per
+            component array, 'vectorizer' bytes (vocabulary and IDF weights)
+            and the 'total'
+        """
+        report = {'data': {}, 'tfidf_matrix': {}, 'vectorizer': {}}
+        if self.data is not None:
+            usage = self.data.memory_usage(deep=True)
+            report['data'] = {col: int(size) for col, size in usage.items()}
+        if self.tfidf_matrix is not None:
+            report['tfidf_matrix'] = {
+                name: int(getattr(self.tfidf_matrix, name).nbytes)
+                for name in ('data', 'indices', 'indptr')
+            }
+        if self.tfidf is not None:
+            if isinstance(self.tfidf, TfidfVectorizer):
+                vocabulary, idf = self.tfidf.vocabulary_, self.tfidf.idf_
+                # Dict table plus the term strings and their int values
+                report['vectorizer']['vocabulary'] = sys.getsizeof(vocabulary) + sum(
+                    sys.getsizeof(term) + sys.getsizeof(index) for term, index in vocabulary.items()
+                )
+            else:
+                idf = self.tfidf.steps[-1][1].idf_
+            report['vectorizer']['idf'] = int(np.asarray(idf).nbytes)
+
+        report['total'] = sum(sum(part.values()) for part in report.values())
+        return report
+
     def split_data(self, test_size=0.2):
         """Split data into training and testing sets."""
-        self.train_data, self.test_data = train_test_split(
-            self.data, test_size=test_size, random_state=42
-        )
+        self.train_data, self.test_data = split_frame(self.data, test_size=test_size)
         return self.train_data, self.test_data
 
     def get_user_item_ratings(self):
-        """Get user-item ratings matrix."""
-        return pd.pivot_table(
-            self.data,
-            values='rating',
-            index='user_id',
-            columns='book_id',
-            fill_value=0
-        )
+        """
+        Get the sparse user-item ratings matrix, built from integer codes
+        without a pivot (duplicate ratings are averaged).
+
+        For real rating events at scale use ratings_store.RatingsStore.
+
+        Returns:
+            Tuple of (CSR matrix, user IDs of its rows, book IDs of its columns)
+        """
+        ratings = self.data.dropna(subset=['rating'])
+        user_codes, user_ids = pd.factorize(ratings['user_id'], sort=True)
+        book_codes, book_ids = pd.factorize(ratings['book_id'], sort=True)
+        shape = (len(user_ids), len(book_ids))
+
+        # Duplicate entries are summed when building the matrix, so divide by their counts
+        totals = sparse.csr_matrix((ratings['rating'].to_numpy(dtype=np.float64),
+                                    (user_codes, book_codes)), shape=shape)
+        counts = sparse.csr_matrix((np.ones(len(ratings)), (user_codes, book_codes)), shape=shape)
+        totals.data /= counts.data
+        totals.eliminate_zeros()
+        return totals, np.asarray(user_ids), np.asarray(book_ids)
+
+    def save(self, path):
+        """
+        Save the fitted vectorizer and TF-IDF matrix as versioned .npy arrays.
+
+        Args:
+            path: Directory to write the artifact into
+        """
+        arrays = csr_to_arrays('tfidf', self.tfidf_matrix)
+        meta = {'file_path': self.file_path, 'compact': self.compact,
+                'features_version': self.features_version}
+
+        if isinstance(self.tfidf, TfidfVectorizer):
+            params = self.tfidf.get_params()
+            vocabulary = sorted(self.tfidf.vocabulary_, key=self.tfidf.vocabulary_.get)
+            arrays['vocabulary'] = np.asarray(vocabulary, dtype=str)
+            arrays['idf'] = self.tfidf.idf_
+            meta.update({
+                'vectorizer_type': 'tfidf',
+                'vectorizer_params': {name: params[name] for name in VECTORIZER_PARAMS},
+                'vectorizer_dtype': np.dtype(params['dtype']).name
+            })
+        else:
+            # Hashing vectorizer + IDF pipeline from chunked mode
+            hashing, transformer = (step for _, step in self.tfidf.steps)
+            arrays['idf'] = transformer.idf_
+            meta.update({
+                'vectorizer_type': 'hashing',
+                'n_features': hashing.n_features,
+                'vectorizer_dtype': np.dtype(hashing.dtype).name
+            })
+
+        save_arrays(path, 'data_processor', arrays, meta=meta)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a DataProcessor saved with save().
+
+        Args:
+            path: Artifact directory
+            mmap: Memory-map the TF-IDF matrix so processes can share its pages
+
+        Returns:
+            DataProcessor with tfidf and tfidf_matrix restored (data is not loaded)
+
+        Raises:
+            ValueError: If the TF-IDF matrix and the vectorizer do not fit together
+        """
+        arrays, meta = load_arrays(path, 'data_processor', mmap=mmap)
+        n_features = len(arrays['idf'])
+        shapes = {'tfidf': (arrays['tfidf_shape'], (arrays['tfidf_shape'][0], n_features))}
+        if 'vocabulary' in arrays:
+            shapes['vocabulary'] = (arrays['vocabulary'].shape, (n_features,))
+        check_shapes(path, shapes)
+        processor = cls(meta['file_path'], compact=meta.get('compact', False))
+
+        if meta.get('vectorizer_type', 'tfidf') == 'tfidf':
+            params = dict(meta['vectorizer_params'])
+            params['ngram_range'] = tuple(params['ngram_range'])
+            processor.tfidf = TfidfVectorizer(dtype=np.dtype(meta['vectorizer_dtype']).type, **params)
+            processor.tfidf.vocabulary_ = {term: idx for idx, term in enumerate(arrays['vocabulary'].tolist())}
+            processor.tfidf.idf_ = np.asarray(arrays['idf'])
+        else:
+            processor.tfidf = cls._make_hashed_tfidf(
+                cls._make_hashing_vectorizer(meta['n_features'],
+                                             np.dtype(meta.get('vectorizer_dtype', 'float64')).type),
+                arrays['idf']
+            )
+        processor.tfidf_matrix = arrays_to_csr('tfidf', arrays)
+        processor.features_version = meta.get('features_version')
+        return processor
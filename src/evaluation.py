@@ -0,0 +1,295 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from data_processor import DataProcessor, split_frame
+from book_catalog import BookCatalog
+from content_recommender import ContentBasedRecommender
+from collaborative_recommender import CollaborativeRecommender
+from als_recommender import ALSRecommender
+from hybrid_recommender import HybridRecommender
+from benchmark import generate_synthetic_data
+from metrics import latency_stats
+
+# Recommender shared with the evaluation worker processes
+_worker_state = {}
+
+def _init_worker(evaluator, recommender):
+    """Store the evaluator and recommender in a worker process."""
+    _worker_state['evaluator'] = evaluator
+    _worker_state['recommender'] = recommender
+
+def _evaluate_worker(rows):
+    """Evaluate a batch of test users inside a worker process."""
+    return _worker_state['evaluator']._evaluate_batch(_worker_state['recommender'], rows)
+
+class Evaluator:
+    def __init__(self, train_ratings, test_ratings, catalog, k=10, relevance_threshold=None,
+                 batch_size=256, n_jobs=None):
+        """
+        Initialize an offline evaluation of recommenders on a train/test split.
+
+        Every test user who also has training ratings is evaluated. Their
+        test books are the relevant items, their training books are never
+        counted as recommendations, and their highest-rated training book
+        is the query book for content-based and hybrid recommenders.
+
+        Args:
+            train_ratings: DataFrame with columns [user_id, book_id, rating]
+                the recommenders were fitted on
+            test_ratings: Held-out DataFrame with the same columns
+            catalog: BookCatalog the recommenders were fitted on
+            k: Cutoff for precision@k, recall@k and NDCG@k
+            relevance_threshold: Minimum test rating for a book to count as
+                relevant (None counts every test rating)
+            batch_size: Number of users scored per vectorized batch
+            n_jobs: Worker processes (defaults to the CPU count; 1 runs in-process)
+        """
+        self.catalog = catalog
+        self.k = k
+        self.batch_size = batch_size
+        self.n_jobs = n_jobs or os.cpu_count() or 1
+
+        train_ratings = train_ratings.dropna(subset=['rating'])
+        test_ratings = test_ratings.dropna(subset=['rating'])
+        if relevance_threshold is not None:
+            test_ratings = test_ratings[test_ratings['rating'] >= relevance_threshold]
+        train_ratings = train_ratings.assign(position=catalog.positions(train_ratings['book_id']))
+        test_ratings = test_ratings.assign(position=catalog.positions(test_ratings['book_id']))
+        train_ratings = train_ratings[train_ratings['position'] >= 0]
+        test_ratings = test_ratings[test_ratings['position'] >= 0]
+
+        # Users with both training history and relevant test books
+        self.user_ids = np.intersect1d(train_ratings['user_id'].unique(),
+                                       test_ratings['user_id'].unique())
+        n_users, n_items = len(self.user_ids), len(catalog)
+
+        def user_item(ratings):
+            ratings = ratings[ratings['user_id'].isin(self.user_ids)]
+            rows = np.searchsorted(self.user_ids, ratings['user_id'].to_numpy())
+            matrix = sparse.csr_matrix(
+                (np.ones(len(rows), dtype=bool), (rows, ratings['position'].to_numpy())),
+                shape=(n_users, n_items)
+            )
+            return matrix, ratings, rows
+
+        self.train_items, train_ratings, train_rows = user_item(train_ratings)
+        self.relevant_items, _, _ = user_item(test_ratings)
+        self.n_relevant = np.asarray(self.relevant_items.sum(axis=1)).ravel()
+
+        # Highest-rated training book per user as the content query
+        best = (train_ratings.assign(row=train_rows)
+                .sort_values(['row', 'rating'], ascending=[True, False])
+                .drop_duplicates('row'))
+        self.query_books = best['book_id'].to_numpy()
+
+    @classmethod
+    def from_processor(cls, data_processor, catalog, test_size=0.2, **kwargs):
+        """
+        Build an evaluator from the loaded data of a DataProcessor, split
+        like DataProcessor.split_data.
+
+        Args:
+            data_processor: DataProcessor with loaded data
+            catalog: BookCatalog the recommenders are fitted on
+            test_size: Fraction of ratings held out
+            **kwargs: Passed to Evaluator
+
+        Returns:
+            Tuple of (evaluator, training ratings to fit the recommenders on)
+        """
+        return cls.from_ratings(data_processor.data, catalog, test_size=test_size, **kwargs)
+
+    @classmethod
+    def from_ratings(cls, ratings, catalog, test_size=0.2, **kwargs):
+        """
+        Build an evaluator from a random split of a ratings DataFrame.
+
+        Args:
+            ratings: DataFrame with columns [user_id, book_id, rating]
+            catalog: BookCatalog the recommenders are fitted on
+            test_size: Fraction of ratings held out
+            **kwargs: Passed to Evaluator
+
+        Returns:
+            Tuple of (evaluator, training ratings to fit the recommenders on)
+        """
+        train_data, test_data = split_frame(ratings, test_size=test_size)
+        columns = ['user_id', 'book_id', 'rating']
+        return cls(train_data[columns], test_data[columns], catalog, **kwargs), train_data[columns]
+
+    def _queries(self, recommender, rows):
+        """Get the score_items_batch arguments of a recommender for a batch of users."""
+        if isinstance(recommender, HybridRecommender):
+            return self.user_ids[rows], self.query_books[rows]
+        if isinstance(recommender, ContentBasedRecommender):
+            return (self.query_books[rows],)
+        return (self.user_ids[rows],)
+
+    def _single_query(self, recommender, row):
+        """Get get_recommendations arguments for one user."""
+        return tuple(keys[0] for keys in self._queries(recommender, np.array([row])))
+
+    def _evaluate_batch(self, recommender, rows):
+        """
+        Score one batch of users and compute their ranking metrics.
+
+        Returns:
+            Tuple of (precision, recall, ndcg arrays, recommended positions, seconds)
+        """
+        start = time.perf_counter()
+        scores = recommender.score_items_batch(*self._queries(recommender, rows))
+        scores[np.isnan(scores)] = -np.inf
+
+        # Never count books the user rated in training
+        train_rows, train_cols = self.train_items[rows].nonzero()
+        scores[train_rows, train_cols] = -np.inf
+
+        k = min(self.k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        recommended = np.isfinite(np.take_along_axis(scores, top, axis=1))
+        seconds = time.perf_counter() - start
+
+        hits = np.take_along_axis(self.relevant_items[rows].toarray(), top, axis=1) & recommended
+        n_relevant = self.n_relevant[rows]
+        discounts = 1.0 / np.log2(np.arange(2, k + 2))
+        ideal = np.cumsum(discounts)[np.minimum(n_relevant, k) - 1]
+
+        return (
+            hits.sum(axis=1) / self.k,
+            hits.sum(axis=1) / n_relevant,
+            (hits * discounts).sum(axis=1) / ideal,
+            top[recommended],
+            seconds
+        )
+
+    def evaluate(self, recommender, latency_queries=100):
+        """
+        Compute ranking metrics, catalog coverage and latency for a fitted recommender.
+
+        Users are scored in vectorized batches of batch_size, spread over
+        n_jobs processes (forked where available, so the model is shared
+        copy-on-write instead of pickled).
+
+        Args:
+            recommender: Fitted ContentBasedRecommender, CollaborativeRecommender,
+                ALSRecommender or HybridRecommender
+            latency_queries: Number of single get_recommendations calls timed
+                for the per-query latency percentiles
+
+        Returns:
+            Dict with precision@k, recall@k, ndcg@k, coverage, users and latency stats
+        """
+        batches = [np.arange(start, min(start + self.batch_size, len(self.user_ids)))
+                   for start in range(0, len(self.user_ids), self.batch_size)]
+
+        start = time.perf_counter()
+        if self.n_jobs == 1 or len(batches) <= 1:
+            results = [self._evaluate_batch(recommender, rows) for rows in batches]
+        else:
+            method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+            with multiprocessing.get_context(method).Pool(
+                min(self.n_jobs, len(batches)), initializer=_init_worker,
+                initargs=(self, recommender)
+            ) as pool:
+                results = pool.map(_evaluate_worker, batches)
+        elapsed = time.perf_counter() - start
+
+        if not results:
+            raise ValueError('No test users with training ratings to evaluate')
+        precision, recall, ndcg, recommended, seconds = zip(*results)
+
+        # Per-query latency of the interactive get_recommendations path
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(self.user_ids), min(latency_queries, len(self.user_ids)), replace=False)
+        latencies = []
+        for row in sample:
+            query = self._single_query(recommender, row)
+            query_start = time.perf_counter()
+            recommender.get_recommendations(*query, self.k)
+            latencies.append(time.perf_counter() - query_start)
+
+        return {
+            f'precision@{self.k}': float(np.concatenate(precision).mean()),
+            f'recall@{self.k}': float(np.concatenate(recall).mean()),
+            f'ndcg@{self.k}': float(np.concatenate(ndcg).mean()),
+            'coverage': len(np.unique(np.concatenate(recommended))) / len(self.catalog),
+            'users': len(self.user_ids),
+            'seconds': elapsed,
+            'batch_ms_per_user': 1000 * sum(seconds) / len(self.user_ids),
+            'latency': latency_stats(latencies) if latencies else {}
+        }
+
+    def grid_search(self, build, param_grid, sort_by=None, latency_queries=20):
+        """
+        Evaluate a recommender for every combination of parameters.
+
+        Args:
+            build: Callable taking the parameters as keyword arguments and
+                returning a fitted recommender. For hybrid weights, reuse the
+                fitted components, e.g.
+                lambda content_weight: HybridRecommender(content, collab, content_weight)
+            param_grid: Dict of parameter name -> list of values
+            sort_by: Metric to sort by, descending (defaults to ndcg@k)
+            latency_queries: Single-query latency samples per combination
+
+        Returns:
+            DataFrame with one row per combination: parameters, metrics and fit seconds
+        """
+        names = list(param_grid)
+        rows = []
+        for values in itertools.product(*(param_grid[name] for name in names)):
+            params = dict(zip(names, values))
+            start = time.perf_counter()
+            recommender = build(**params)
+            fit_seconds = time.perf_counter() - start
+
+            metrics = self.evaluate(recommender, latency_queries=latency_queries)
+            latency = metrics.pop('latency')
+            rows.append({**params, **metrics, 'fit_seconds': fit_seconds,
+                         'p50_ms': latency.get('p50_ms')})
+
+        return (pd.DataFrame(rows)
+                .sort_values(sort_by or f'ndcg@{self.k}', ascending=False, ignore_index=True))
+
+def main():
+    parser = argparse.ArgumentParser(description='Evaluate the recommenders on synthetic data.')
+    parser.add_argument('--books', type=int, default=20_000, help='Catalog size')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--weights', type=float, nargs='+', default=[0.0, 0.25, 0.5, 0.75, 1.0],
+                        help='Hybrid content weights to grid search')
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    books, ratings = generate_synthetic_data(args.books, seed=args.seed)
+    catalog = BookCatalog(books)
+    evaluator, train_ratings = Evaluator.from_ratings(ratings, catalog, k=args.k, n_jobs=args.jobs)
+
+    content = ContentBasedRecommender()
+    content.fit(DataProcessor.from_frame(books).preprocess_text_features(['title', 'authors', 'description']),
+                catalog)
+    collaborative = CollaborativeRecommender()
+    collaborative.fit(train_ratings, catalog)
+    als = ALSRecommender()
+    als.fit(train_ratings, catalog)
+
+    for name, recommender in [('content', content), ('collaborative', collaborative), ('als', als)]:
+        metrics = evaluator.evaluate(recommender)
+        latency = metrics.pop('latency')
+        print(name, {key: round(value, 4) for key, value in metrics.items()},
+              f"p50 {latency['p50_ms']:.2f} ms")
+
+    print(evaluator.grid_search(
+        lambda content_weight: HybridRecommender(content, collaborative, content_weight),
+        {'content_weight': args.weights}
+    ).to_string())
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,11 @@
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from metrics import instrument, timed
 
 class HybridRecommender:
     def __init__(self, content_recommender, collaborative_recommender, 
-                 content_weight=0.5):
+                 content_weight=0.5, cache=None, candidate_pool=200, concurrent=False):
         """
         Initialize hybrid recommender system.
         
@@ -11,12 +13,31 @@ class HybridRecommender:
             content_recommender: Instance of ContentBasedRecommender
             collaborative_recommender: Instance of CollaborativeRecommender
             content_weight: Weight for content-based recommendations (0-1)
+            cache: Optional RecommendationCache for combined results
+            candidate_pool: Rank only the union of each component's top
+                candidate_pool books (None ranks the whole catalog)
+            concurrent: Score the two components on separate threads. Off by
+                default: each component takes about a millisecond, which is
+                less than the cost of handing work to a thread.
+
+        Both recommenders must be fitted on the same BookCatalog, since their
+        scores are combined by catalog position.
         """
         self.content_recommender = content_recommender
         self.collaborative_recommender = collaborative_recommender
         self.content_weight = content_weight
         self.collab_weight = 1 - content_weight
+        self.cache = cache
+        self.candidate_pool = candidate_pool
+        self.concurrent = concurrent
+        self._thread_pool = None
+
+    @property
+    def version(self):
+        """Combined model version of both component recommenders."""
+        return (self.content_recommender.version, self.collaborative_recommender.version)
 
+    @instrument('hybrid.get_recommendations', profile=True)
     def get_recommendations(self, user_id, book_id, n_recommendations=5):
         """
         Get hybrid recommendations combining both approaches.
@@ -29,42 +50,152 @@ class HybridRecommender:
         Returns:
             DataFrame with recommended books and combined scores
         """
-        # Get recommendations from both systems
-        content_recs = self.content_recommender.get_recommendations(
-            book_id, 
-            n_recommendations=n_recommendations
-        )
-        
-        collab_recs = self.collaborative_recommender.get_recommendations(
-            user_id, 
-            n_recommendations=n_recommendations
-        )
+        if self.cache is not None:
+            key = ('hybrid', user_id, book_id, n_recommendations,
+                   (self.content_weight, self.collab_weight))
+            return self.cache.get_or_compute(
+                key, self.version,
+                lambda: self._get_recommendations(user_id, book_id, n_recommendations)
+            )
+        return self._get_recommendations(user_id, book_id, n_recommendations)
 
-        # Normalize scores
-        content_recs['norm_score'] = (content_recs['similarity_score'] - 
-                                    content_recs['similarity_score'].min()) / \
-                                   (content_recs['similarity_score'].max() - 
-                                    content_recs['similarity_score'].min())
-        
-        collab_recs['norm_score'] = (collab_recs['predicted_rating'] - 
-                                    collab_recs['predicted_rating'].min()) / \
-                                   (collab_recs['predicted_rating'].max() - 
-                                    collab_recs['predicted_rating'].min())
-
-        # Combine recommendations
-        all_recs = pd.concat([
-            content_recs.assign(source='content'),
-            collab_recs.assign(source='collaborative')
-        ])
-
-        # Calculate weighted scores
-        all_recs['weighted_score'] = np.where(
-            all_recs['source'] == 'content',
-            all_recs['norm_score'] * self.content_weight,
-            all_recs['norm_score'] * self.collab_weight
+    def _get_recommendations(self, user_id, book_id, n_recommendations):
+        """Compute hybrid recommendations without consulting the cache."""
+        # Score the whole catalog with both systems
+        with timed('hybrid.scoring'):
+            if self.concurrent:
+                content_future = self._executor().submit(self._component_scores,
+                                                         self.content_recommender, book_id)
+                collab_scores = self._component_scores(self.collaborative_recommender, user_id)
+                content_scores = content_future.result()
+            else:
+                content_scores = self._component_scores(self.content_recommender, book_id)
+                collab_scores = self._component_scores(self.collaborative_recommender, user_id)
+
+        if content_scores is None and collab_scores is None:
+            return pd.DataFrame(columns=['title', 'authors', 'similarity_score',
+                                         'predicted_rating', 'weighted_score'])
+
+        n_items = len(self.content_recommender.catalog)
+        if content_scores is None:
+            content_scores = np.full(n_items, np.nan)
+        if collab_scores is None:
+            collab_scores = np.full(n_items, np.nan)
+
+        with timed('hybrid.selection'):
+            candidates, weighted_scores = self._fuse(content_scores, collab_scores)
+
+            # Get top recommendations
+            n = min(n_recommendations, len(candidates))
+            if n == 0:
+                top = np.array([], dtype=np.int64)
+            else:
+                top = np.argpartition(-weighted_scores, n - 1)[:n]
+                top = top[np.argsort(-weighted_scores[top], kind='stable')]
+            positions = candidates[top]
+
+        with timed('hybrid.assembly'):
+            return self.content_recommender.catalog.take(
+                positions,
+                similarity_score=content_scores[positions],
+                predicted_rating=collab_scores[positions],
+                weighted_score=weighted_scores[top]
+            )
+
+    def score_items_batch(self, user_ids, book_ids):
+        """
+        Score every catalog book for many (user, book) queries at once.
+
+        Args:
+            user_ids: User IDs, one per query
+            book_ids: Book IDs to base content similarity on, aligned with user_ids
+
+        Returns:
+            Dense (n_queries x n_catalog) array of weighted scores; books
+            outside a query's candidate pool are -inf
+
+        Raises:
+            KeyError: If a user or book is unknown to its component
+        """
+        content_scores = self.content_recommender.score_items_batch(book_ids)
+        collab_scores = self.collaborative_recommender.score_items_batch(user_ids)
+
+        scores = np.full(content_scores.shape, -np.inf)
+        for row in range(len(scores)):
+            candidates, weighted_scores = self._fuse(content_scores[row], collab_scores[row])
+            scores[row, candidates] = weighted_scores
+        return scores
+
+    def _fuse(self, content_scores, collab_scores):
+        """
+        Combine one query's catalog-wide component scores.
+
+        Returns:
+            Tuple of (candidate catalog positions, weighted scores)
+        """
+        candidates = self._candidate_pool(content_scores, collab_scores)
+        content_scores, collab_scores = content_scores[candidates], collab_scores[candidates]
+
+        # Drop items excluded by either component (the query book, already rated books)
+        keep = (content_scores != -np.inf) & (collab_scores != -np.inf)
+        candidates, content_scores, collab_scores = candidates[keep], content_scores[keep], collab_scores[keep]
+
+        # Normalize over the candidate pool and combine
+        weighted_scores = (
+            self.content_weight * self._normalize(content_scores) +
+            self.collab_weight * self._normalize(collab_scores)
         )
+        return candidates, weighted_scores
+
+    @staticmethod
+    def _component_scores(recommender, key):
+        """Get a component's catalog-wide scores, or None if it cannot score key."""
+        try:
+            return recommender.score_items(key)
+        except (IndexError, KeyError):
+            return None
+
+    def _candidate_pool(self, content_scores, collab_scores):
+        """
+        Get the catalog positions that are ranked, before exclusions.
+
+        Without a candidate_pool size every book is a candidate; otherwise it
+        is the union of each component's top candidate_pool books. Books the
+        other component excludes are dropped afterwards by _fuse, so a pool
+        can end up slightly smaller than candidate_pool.
+        """
+        if self.candidate_pool is None:
+            return np.arange(len(content_scores))
+
+        pools = []
+        for scores in (content_scores, collab_scores):
+            if len(scores) > self.candidate_pool:
+                # NaN and -inf sort last, so the partition prefers scored books
+                top = np.argpartition(-scores, self.candidate_pool - 1)[:self.candidate_pool]
+            else:
+                top = np.arange(len(scores))
+            pools.append(top[np.isfinite(scores[top])])
+        return np.union1d(*pools)
+
+    @staticmethod
+    def _normalize(scores):
+        """Min-max normalize scores to [0, 1]; missing (NaN) scores and constant inputs map to 0."""
+        finite = np.isfinite(scores)
+        normalized = np.zeros(len(scores))
+        if finite.any():
+            low, high = scores[finite].min(), scores[finite].max()
+            if high > low:
+                normalized[finite] = (scores[finite] - low) / (high - low)
+        return normalized
+
+    def __getstate__(self):
+        # The thread pool cannot be pickled (e.g. into worker processes)
+        state = self.__dict__.copy()
+        state['_thread_pool'] = None
+        return state
 
-        # Get top recommendations
-        final_recs = all_recs.sort_values('weighted_score', 
-                                        ascending=False).drop_duplicates('title')
-        return final_recs.head(n_recommendations)
+    def _executor(self):
+        """Get the thread pool used to run the components concurrently."""
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=2)
+        return self._thread_pool
@@ -0,0 +1,248 @@
+import bisect
+import cProfile
+import functools
+import io
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+# Latency histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize a thread-safe registry of stage latency histograms and counters.
+
+        Args:
+            buckets: Histogram bucket upper bounds in seconds
+        """
+        self.buckets = tuple(buckets)
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._hooks = []
+
+        # Opt-in sampling profiler state
+        self.profile_sample_rate = 0.0
+        self.profile_threshold = 0.0
+        self.slow_profiles = deque(maxlen=20)
+
+    def add_hook(self, hook):
+        """
+        Register a callable invoked as hook(stage, seconds) after each timed stage.
+
+        Args:
+            hook: Callable receiving the stage name and its duration
+        """
+        self._hooks.append(hook)
+
+    def observe(self, stage, seconds):
+        """Record one duration for a stage."""
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = {
+                    'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0
+                }
+            histogram['counts'][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram['sum'] += seconds
+            histogram['count'] += 1
+        for hook in self._hooks:
+            hook(stage, seconds)
+
+    def increment(self, name, value=1):
+        """Increase a counter."""
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    @contextmanager
+    def timed(self, stage):
+        """
+        Time the enclosed block and record it under `stage`.
+
+        Args:
+            stage: Stage name, e.g. 'content.scoring'
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def instrument(self, stage, profile=False):
+        """
+        Decorator timing every call of a function under `stage`.
+
+        Args:
+            stage: Stage name
+            profile: Treat calls as requests eligible for the sampling profiler
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with (self.profiled(stage) if profile else self.timed(stage)):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def enable_profiling(self, sample_rate=0.01, threshold=0.1):
+        """
+        Turn on the sampling profiler for requests wrapped in profiled().
+
+        Args:
+            sample_rate: Fraction of requests run under cProfile
+            threshold: Keep the profile only if the request took at least this many seconds
+        """
+        self.profile_sample_rate = sample_rate
+        self.profile_threshold = threshold
+
+    @contextmanager
+    def profiled(self, request):
+        """
+        Time a whole request and, if sampled, profile it.
+
+        Slow sampled requests are kept in `slow_profiles` as
+        (request, seconds, cProfile report) tuples.
+
+        Args:
+            request: Request name, e.g. 'hybrid.get_recommendations'
+        """
+        self.increment(f'{request}.requests')
+        if not self.enabled or random.random() >= self.profile_sample_rate:
+            with self.timed(request):
+                yield
+            return
+
+        # Only one profiler can be active at a time (nested or concurrent
+        # requests); fall back to plain timing when one already runs
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            with self.timed(request):
+                yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            seconds = time.perf_counter() - start
+            self.observe(request, seconds)
+            if seconds >= self.profile_threshold:
+                report = io.StringIO()
+                pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(25)
+                self.slow_profiles.append((request, seconds, report.getvalue()))
+
+    def reset(self):
+        """Drop all recorded metrics."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self.slow_profiles.clear()
+
+    def snapshot(self):
+        """Get a copy of the histograms and counters."""
+        with self._lock:
+            return (
+                {stage: {'counts': list(h['counts']), 'sum': h['sum'], 'count': h['count']}
+                 for stage, h in self._histograms.items()},
+                dict(self._counters)
+            )
+
+    def export_prometheus(self, prefix='book_recommender'):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Args:
+            prefix: Metric name prefix
+
+        Returns:
+            Exposition text
+        """
+        histograms, counters = self.snapshot()
+        lines = [f'# TYPE {prefix}_stage_seconds histogram']
+        for stage in sorted(histograms):
+            histogram = histograms[stage]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), histogram['counts']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+
+        lines.append(f'# TYPE {prefix}_events_total counter')
+        for name in sorted(counters):
+            lines.append(f'{prefix}_events_total{{name="{name}"}} {counters[name]}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port=9100, host='127.0.0.1'):
+        """
+        Serve /metrics in a daemon thread.
+
+        Args:
+            port: Port to listen on
+            host: Interface to bind
+
+        Returns:
+            The running ThreadingHTTPServer
+        """
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.export_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+def latency_stats(latencies):
+    """
+    Summarize per-query latencies as percentiles and throughput.
+
+    Args:
+        latencies: Per-query latencies in seconds
+
+    Returns:
+        Dict with the number of queries, p50/p95/p99 in milliseconds and
+        queries per second
+    """
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        'queries': len(latencies_ms),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'throughput_qps': float(len(latencies_ms) / (latencies_ms.sum() / 1000))
+    }
+
+# Default process-wide registry used by the recommenders
+REGISTRY = MetricsRegistry()
+timed = REGISTRY.timed
+instrument = REGISTRY.instrument
+profiled = REGISTRY.profiled
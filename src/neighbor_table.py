@@ -0,0 +1,252 @@
+import argparse
+import multiprocessing
+import os
+import time
+import numpy as np
+from sklearn.preprocessing import normalize
+from data_processor import DataProcessor
+from persistence import save_arrays, load_arrays, check_shapes
+
+# Feature matrix shared with the precompute worker processes
+_worker_state = {}
+
+# Bytes per (row, item) score of a block: the float64 scores, their
+# negation and the int64 positions returned by argpartition
+SCORE_BYTES = 24
+
+def _init_worker(features, n_neighbors):
+    """Store the features in a worker process."""
+    _worker_state['features'] = features
+    _worker_state['features_csc'] = features.tocsc()
+    _worker_state['n_neighbors'] = n_neighbors
+
+def _top_neighbors(bounds):
+    """
+    Compute the top neighbors of one block of rows.
+
+    Args:
+        bounds: (start, stop) row range of the block
+
+    Returns:
+        Tuple of (start, neighbor positions, neighbor scores)
+    """
+    start, stop = bounds
+    features, k = _worker_state['features'], _worker_state['n_neighbors']
+    # Sparse @ dense over only the features the block uses
+    rows = features[start:stop]
+    columns = np.unique(rows.indices)
+    block = np.ascontiguousarray(
+        (_worker_state['features_csc'][:, columns] @ rows[:, columns].toarray().T).T
+    )
+
+    # Exclude each book from its own neighbor list
+    block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+
+    top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(block, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return (start,
+            np.take_along_axis(top, order, axis=1).astype(np.int32),
+            np.take_along_axis(top_scores, order, axis=1).astype(np.float32))
+
+def _block_bounds(features, block_memory_mb):
+    """
+    Split the rows into blocks whose scoring fits in block_memory_mb.
+
+    A block's cost is its dense scores against every item, plus the dense
+    copy of its rows and the column slice of the features it is multiplied
+    with. The last two depend on the terms the block uses, so they are
+    bounded from above by the rows' term counts and the document
+    frequencies of those terms.
+
+    Args:
+        features: Sparse (n_items x n_features) CSR matrix
+        block_memory_mb: Upper bound (in MB) for one block
+
+    Returns:
+        List of (start, stop) row ranges
+    """
+    n_items, n_features = features.shape
+    row_of_entry = np.repeat(np.arange(n_items), np.diff(features.indptr))
+    document_frequency = np.bincount(features.indices, minlength=n_features)
+    row_terms = np.r_[0, np.cumsum(np.diff(features.indptr))]
+    column_entries = np.r_[0, np.cumsum(np.bincount(
+        row_of_entry, weights=document_frequency[features.indices], minlength=n_items
+    ))]
+    budget = block_memory_mb * 1024 ** 2
+
+    def cost(start, stop):
+        n_rows = stop - start
+        columns = min(row_terms[stop] - row_terms[start], n_features)
+        entries = min(column_entries[stop] - column_entries[start], features.nnz)
+        dense_rows = n_rows * columns * np.dtype(np.float64).itemsize
+        # CSC slice: float64 values and int32 row indices
+        column_slice = entries * 12 + (columns + 1) * np.dtype(np.int64).itemsize
+        return n_rows * n_items * SCORE_BYTES + dense_rows + column_slice
+
+    blocks, start = [], 0
+    while start < n_items:
+        # Largest stop within budget (cost grows with stop); always at least one row
+        low, high = start + 1, n_items
+        while low < high:
+            middle = (low + high + 1) // 2
+            if cost(start, middle) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        blocks.append((start, low))
+        start = low
+    return blocks
+
+class NeighborTable:
+    def __init__(self, indices, scores, features_version=None):
+        """
+        Initialize a table of precomputed nearest neighbors.
+
+        Args:
+            indices: (n_items x n_neighbors) int32 array of neighbor positions,
+                ordered by descending score
+            scores: Matching (n_items x n_neighbors) float32 similarities
+            features_version: DataProcessor.features_version of the features
+                the table was built from
+        """
+        self.indices = indices
+        self.scores = scores
+        self.features_version = features_version
+
+    @property
+    def n_neighbors(self):
+        return self.indices.shape[1]
+
+    def __len__(self):
+        return self.indices.shape[0]
+
+    def matches(self, n_items, features_version):
+        """Whether the table was built from features with this many items and this version."""
+        return len(self) == n_items and self.features_version == features_version
+
+    def covers(self, position, n):
+        """Whether the table can answer a query for `n` neighbors of `position`."""
+        return position < len(self) and n <= self.n_neighbors
+
+    def lookup(self, position, n):
+        """
+        Get the top n neighbors of an item.
+
+        Args:
+            position: Row position of the item
+            n: Number of neighbors (at most n_neighbors)
+
+        Returns:
+            Tuple of (neighbor positions, scores) ordered by descending score
+        """
+        return self.indices[position, :n], self.scores[position, :n]
+
+    def save(self, path):
+        """
+        Save the table as versioned .npy arrays.
+
+        Args:
+            path: Directory to write the artifact into
+        """
+        save_arrays(path, 'neighbor_table', {'indices': self.indices, 'scores': self.scores},
+                    meta={'n_items': len(self), 'features_version': self.features_version})
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Load a table saved with save().
+
+        Args:
+            path: Artifact directory
+            mmap: Memory-map the table so lookups only page in the rows they read
+
+        Returns:
+            NeighborTable
+
+        Raises:
+            ValueError: If the arrays do not match the saved number of items
+        """
+        arrays, meta = load_arrays(path, 'neighbor_table', mmap=mmap)
+        n_neighbors = arrays['indices'].shape[1] if arrays['indices'].ndim == 2 else 0
+        check_shapes(path, {name: (arrays[name].shape, (meta['n_items'], n_neighbors))
+                            for name in ('indices', 'scores')})
+        return cls(arrays['indices'], arrays['scores'], meta.get('features_version'))
+
+def build_neighbor_table(features, n_neighbors=50, block_memory_mb=256, n_jobs=None,
+                         features_version=None):
+    """
+    Compute the top content neighbors of every item.
+
+    Similarities are computed as blocked sparse features @ features.T
+    products. Each block, including the dense copy of its rows and the
+    feature columns it uses, stays within `block_memory_mb` per worker.
+    Blocks are spread over `n_jobs` processes (forked where available, so
+    the features are shared instead of pickled).
+
+    Args:
+        features: Sparse (n_items x n_features) matrix with L2-normalized rows
+        n_neighbors: Number of neighbors kept per item
+        block_memory_mb: Upper bound (in MB) for one block's scoring
+        n_jobs: Worker processes (defaults to the CPU count; 1 runs in-process)
+        features_version: Version of the features, recorded in the table
+
+    Returns:
+        NeighborTable
+    """
+    features = features.tocsr()
+    n_items = features.shape[0]
+    k = min(n_neighbors, max(n_items - 1, 0))
+    indices = np.full((n_items, k), -1, dtype=np.int32)
+    scores = np.zeros((n_items, k), dtype=np.float32)
+    if k == 0:
+        return NeighborTable(indices, scores, features_version)
+
+    blocks = _block_bounds(features, block_memory_mb)
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(blocks))
+
+    if n_jobs == 1:
+        _init_worker(features, k)
+        results = map(_top_neighbors, blocks)
+    else:
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        pool = multiprocessing.get_context(method).Pool(n_jobs, initializer=_init_worker,
+                                                        initargs=(features, k))
+        results = pool.imap_unordered(_top_neighbors, blocks)
+
+    try:
+        for start, block_indices, block_scores in results:
+            indices[start:start + len(block_indices)] = block_indices
+            scores[start:start + len(block_scores)] = block_scores
+    finally:
+        if n_jobs == 1:
+            _worker_state.clear()
+        else:
+            pool.terminate()
+
+    return NeighborTable(indices, scores, features_version)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Precompute the top content neighbors of every book from saved artifacts.'
+    )
+    parser.add_argument('--model-dir', default=os.environ.get(
+        'BOOK_MODEL_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'model')
+    ), help='Artifact directory written by the app')
+    parser.add_argument('--neighbors', type=int, default=50, help='Neighbors kept per book')
+    parser.add_argument('--block-memory-mb', type=int, default=256)
+    parser.add_argument('--jobs', type=int, default=None, help='Worker processes')
+    args = parser.parse_args()
+
+    processor = DataProcessor.load(os.path.join(args.model_dir, 'processor'))
+    features = normalize(processor.tfidf_matrix)
+
+    start = time.perf_counter()
+    table = build_neighbor_table(features, args.neighbors, args.block_memory_mb, args.jobs,
+                                 processor.features_version)
+    table.save(os.path.join(args.model_dir, 'neighbors'))
+    print(f'{len(table):,} books x {table.n_neighbors} neighbors in '
+          f'{time.perf_counter() - start:.1f}s')
+
+if __name__ == '__main__':
+    main()
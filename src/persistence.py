@@ -0,0 +1,194 @@
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# Bump when the on-disk layout of any artifact changes
+FORMAT_VERSION = 2
+# Version 1 stored strings as fixed-width unicode arrays; it is still readable
+READABLE_VERSIONS = (1, 2)
+META_FILE = 'meta.json'
+
+def encode_strings(values):
+    """
+    Pack an array of strings as UTF-8 bytes plus offsets.
+
+    Every string takes only its own length on disk, where a fixed-width
+    unicode array pads every row to the longest one.
+
+    Returns:
+        Tuple of (uint8 bytes, int64 offsets with one entry per string plus one)
+    """
+    encoded = [str(value).encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+def decode_strings(data, offsets):
+    """Unpack strings packed by encode_strings into an object array."""
+    data = bytes(data)
+    strings = np.empty(len(offsets) - 1, dtype=object)
+    bounds = np.asarray(offsets).tolist()
+    strings[:] = [data[start:stop].decode('utf-8') for start, stop in zip(bounds[:-1], bounds[1:])]
+    return strings
+
+def save_arrays(path, kind, arrays, meta=None):
+    """
+    Save a set of named arrays as .npy files plus a versioned meta.json.
+
+    The artifact is written into a hidden sibling directory and renamed into
+    place, so a crash or a concurrent reader never sees a partial artifact.
+    An existing artifact at `path` is replaced; processes that memory-mapped
+    its files keep reading the old data.
+
+    Args:
+        path: Directory to write (replaced if it exists)
+        kind: Artifact type stored in the metadata and checked on load
+        arrays: Dict of name -> array. String arrays (unicode, or object
+            arrays of str as returned by to_storable) are stored as UTF-8
+            bytes plus offsets; other object arrays are not allowed.
+        meta: Optional JSON-serializable dict of extra metadata
+    """
+    parent, name = os.path.split(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    staging = os.path.join(parent, f'.{name}-{uuid.uuid4().hex}')
+    os.makedirs(staging)
+    try:
+        string_arrays = []
+        for array_name, values in arrays.items():
+            values = np.asarray(values)
+            if values.dtype.kind in 'OU':
+                values, offsets = encode_strings(values)
+                np.save(os.path.join(staging, f'{array_name}.offsets.npy'), offsets, allow_pickle=False)
+                string_arrays.append(array_name)
+            np.save(os.path.join(staging, f'{array_name}.npy'), values, allow_pickle=False)
+
+        with open(os.path.join(staging, META_FILE), 'w') as f:
+            json.dump({
+                'format_version': FORMAT_VERSION,
+                'kind': kind,
+                'arrays': sorted(arrays),
+                'string_arrays': sorted(string_arrays),
+                **(meta or {})
+            }, f, indent=2)
+
+        if os.path.isdir(path):
+            # A directory cannot be renamed over another one: move the old one aside first
+            retired = os.path.join(parent, f'.{name}-old-{uuid.uuid4().hex}')
+            os.rename(path, retired)
+            try:
+                os.rename(staging, path)
+            except OSError:
+                os.rename(retired, path)
+                raise
+            shutil.rmtree(retired, ignore_errors=True)
+        else:
+            os.rename(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+def load_arrays(path, kind, mmap=True):
+    """
+    Load arrays written by save_arrays.
+
+    Args:
+        path: Artifact directory
+        kind: Expected artifact type
+        mmap: Memory-map the arrays read-only instead of reading them into RAM
+
+    Returns:
+        Tuple of (dict of name -> array, metadata dict). String arrays are
+        decoded into object arrays of str; they are never memory-mapped.
+
+    Raises:
+        ValueError: If the artifact type or format version does not match
+    """
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+
+    if meta.get('kind') != kind:
+        raise ValueError(f"Expected a '{kind}' artifact in {path}, found '{meta.get('kind')}'")
+    if meta.get('format_version') not in READABLE_VERSIONS:
+        raise ValueError(
+            f"Unsupported artifact format version {meta.get('format_version')} "
+            f"in {path} (expected {FORMAT_VERSION})"
+        )
+
+    arrays = {}
+    string_arrays = set(meta.get('string_arrays', ()))
+    for name in meta['arrays']:
+        values = np.load(os.path.join(path, f'{name}.npy'),
+                         mmap_mode='r' if mmap else None, allow_pickle=False)
+        if name in string_arrays:
+            values = decode_strings(values, np.load(os.path.join(path, f'{name}.offsets.npy'),
+                                                    allow_pickle=False))
+        elif values.dtype.kind == 'U':
+            # Fixed-width strings of a version 1 artifact
+            values = values.astype(object)
+        arrays[name] = values
+    return arrays, meta
+
+def file_fingerprint(path):
+    """
+    Identify the version of a source file without reading it.
+
+    Store the result in an artifact's metadata and compare it on load to
+    detect artifacts built from an older copy of the file.
+
+    Returns:
+        JSON-serializable dict with the file size and modification time
+    """
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def check_shapes(path, shapes):
+    """
+    Check that the arrays of a loaded artifact fit together.
+
+    Args:
+        path: Artifact directory (for the error message)
+        shapes: Dict of name -> (actual shape, expected shape)
+
+    Raises:
+        ValueError: If any shape does not match
+    """
+    for name, (actual, expected) in shapes.items():
+        if tuple(actual) != tuple(expected):
+            raise ValueError(f"Inconsistent artifact in {path}: {name} has shape "
+                             f"{tuple(actual)}, expected {tuple(expected)}")
+
+def csr_to_arrays(prefix, matrix):
+    """Split a CSR matrix into its component arrays."""
+    matrix = sparse.csr_matrix(matrix)
+    return {
+        f'{prefix}_data': matrix.data,
+        f'{prefix}_indices': matrix.indices,
+        f'{prefix}_indptr': matrix.indptr,
+        f'{prefix}_shape': np.asarray(matrix.shape, dtype=np.int64)
+    }
+
+def arrays_to_csr(prefix, arrays):
+    """Rebuild a CSR matrix from its component arrays without copying them."""
+    return sparse.csr_matrix(
+        (arrays[f'{prefix}_data'], arrays[f'{prefix}_indices'], arrays[f'{prefix}_indptr']),
+        shape=tuple(int(x) for x in arrays[f'{prefix}_shape']),
+        copy=False
+    )
+
+def to_storable(values):
+    """
+    Convert an array to a dtype that can be saved without pickling.
+
+    Object arrays (e.g. strings) become object arrays of str with missing
+    values stored as empty strings; save_arrays packs them as UTF-8.
+    """
+    values = np.asarray(values)
+    if values.dtype == object:
+        strings = np.empty(len(values), dtype=object)
+        strings[:] = ['' if pd.isna(value) else str(value) for value in values]
+        return strings
+    return values
@@ -0,0 +1,168 @@
+import re
+import numpy as np
+import pandas as pd
+from book_catalog import BookCatalog
+from recommendation_cache import next_model_version
+
+def split_values(value):
+    """
+    Split a multi-valued text cell into normalized keys.
+
+    Handles list literals such as "['Fantasy', 'Fiction']" and comma
+    separated names such as "J.K. Rowling, Mary GrandPré (Illustrator)".
+    """
+    if not isinstance(value, str):
+        return []
+    value = re.sub(r"[\[\]'\"]", '', value)
+    value = re.sub(r'\([^)]*\)', '', value)
+    return [part.strip().lower() for part in value.split(',') if part.strip()]
+
+class PopularityIndex:
+    def __init__(self, min_ratings=None, slice_columns=('authors', 'genres')):
+        """
+        Initialize a popularity leaderboard ranked by Bayesian-weighted rating.
+
+        A book's weighted rating is (v * R + m * C) / (v + m), where R is its
+        average rating, v its number of ratings, C the mean rating of all
+        books and m the prior weight, so books with few ratings are pulled
+        towards the mean.
+
+        Args:
+            min_ratings: Prior weight m (defaults to the median number of ratings)
+            slice_columns: Columns with per-value leaderboards (e.g. per author
+                or genre); columns missing from the data are skipped
+        """
+        self.min_ratings = min_ratings
+        self.slice_columns = slice_columns
+        self.scores = None
+        self.order = None
+        self.slices = {}
+        self.catalog = None
+        self.version = next_model_version()
+
+    def fit(self, books_data, catalog=None):
+        """
+        Compute the weighted ratings and sorted leaderboards.
+
+        Args:
+            books_data: DataFrame with book_id, rating and num_ratings columns
+                (plus any slice columns)
+            catalog: BookCatalog built from books_data (built here if None)
+
+        Returns:
+            self
+        """
+        self.catalog = catalog if catalog is not None else BookCatalog(books_data)
+        first = ~books_data['book_id'].duplicated().to_numpy()
+        positions = self.catalog.positions(books_data['book_id'].to_numpy()[first])
+
+        ratings = books_data['rating'].to_numpy(dtype=np.float64)[first]
+        counts = np.nan_to_num(books_data['num_ratings'].to_numpy(dtype=np.float64)[first]).clip(min=0)
+        rated = np.isfinite(ratings) & (counts > 0)
+
+        # Bayesian average: shrink each rating towards the mean by prior weight m
+        if rated.any():
+            mean_rating = np.average(ratings[rated], weights=counts[rated])
+            m = self.min_ratings if self.min_ratings is not None else float(np.median(counts[rated]))
+            self.prior = (mean_rating, m)
+        else:
+            self.prior = (np.nan, 0.0)
+        mean_rating, m = self.prior
+        weighted = np.where(rated, (counts * ratings + m * mean_rating) / (counts + m), np.nan)
+
+        self.scores = np.full(len(self.catalog), np.nan)
+        self.scores[positions] = weighted
+
+        # Global leaderboard of catalog positions, best first
+        valid = np.flatnonzero(np.isfinite(self.scores))
+        self.order = valid[np.argsort(-self.scores[valid], kind='stable')]
+
+        # Per-value leaderboards share one array: key -> (start, stop) into it
+        self.slices = {}
+        for column in self.slice_columns:
+            if column not in books_data.columns:
+                continue
+            exploded = pd.DataFrame({
+                'position': positions,
+                'key': books_data[column].to_numpy()[first]
+            })
+            exploded['key'] = exploded['key'].map(split_values)
+            exploded = exploded.explode('key').dropna()
+            exploded['score'] = self.scores[exploded['position'].to_numpy(dtype=np.int64)]
+            exploded = exploded[np.isfinite(exploded['score'])]
+            exploded = exploded.sort_values(['key', 'score'], ascending=[True, False], kind='stable')
+
+            keys = exploded['key'].to_numpy()
+            starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype=np.int64)
+            stops = np.r_[starts[1:], len(keys)]
+            self.slices[column] = (
+                exploded['position'].to_numpy(dtype=np.int64),
+                {key: (start, stop) for key, start, stop in zip(keys[starts], starts, stops)}
+            )
+
+        self.version = next_model_version()
+        return self
+
+    def slice_values(self, column):
+        """Get the values with a leaderboard for a slice column (e.g. all genres)."""
+        return sorted(self.slices.get(column, (None, {}))[1])
+
+    def top(self, n=10, exclude=None, **filters):
+        """
+        Get the n most popular books, optionally within slices.
+
+        Args:
+            n: Number of books
+            exclude: Optional array-like of catalog positions to skip
+            **filters: Slice column -> value, e.g. genres='fantasy'
+
+        Returns:
+            Tuple of (catalog positions, weighted ratings), best first
+        """
+        candidates = self.order
+        for column, value in filters.items():
+            if value is None:
+                continue
+            if column not in self.slices:
+                raise KeyError(f"No popularity slices for column '{column}'")
+            positions, bounds = self.slices[column]
+            keys = split_values(value)
+            start, stop = bounds.get(keys[0] if keys else '', (0, 0))
+            slice_positions = positions[start:stop]
+            if candidates is self.order:
+                candidates = slice_positions
+            else:
+                candidates = candidates[np.isin(candidates, slice_positions)]
+
+        if exclude is not None and len(exclude):
+            # Only the first n + len(exclude) candidates can make the list
+            head = candidates[:n + len(exclude)]
+            candidates = head[~np.isin(head, np.asarray(exclude))]
+        top = candidates[:n]
+        return top, self.scores[top]
+
+    def get_top_books(self, n=10, **filters):
+        """
+        Get the leaderboard as a DataFrame.
+
+        Args:
+            n: Number of books
+            **filters: Slice column -> value, e.g. authors='Jane Austen'
+
+        Returns:
+            DataFrame with title, authors and weighted_rating
+        """
+        positions, scores = self.top(n, **filters)
+        return self.catalog.take(positions, weighted_rating=scores)
+
+    def score_items(self):
+        """
+        Score every catalog book by weighted rating.
+
+        Returns:
+            Array indexed by catalog position (NaN for books without ratings,
+            including books added to the catalog after fit)
+        """
+        scores = np.full(len(self.catalog), np.nan)
+        scores[:len(self.scores)] = self.scores
+        return scores
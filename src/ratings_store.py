@@ -0,0 +1,297 @@
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from persistence import save_arrays, load_arrays, to_storable
+
+# Columns of a rating event
+EVENT_COLUMNS = ['user_id', 'book_id', 'rating', 'timestamp']
+
+def to_epoch_seconds(timestamps):
+    """
+    Convert timestamps to int64 Unix seconds.
+
+    Args:
+        timestamps: Series of numbers (already Unix seconds), datetimes or
+            date strings
+
+    Returns:
+        int64 array
+    """
+    if pd.api.types.is_numeric_dtype(timestamps):
+        return timestamps.to_numpy(dtype=np.int64)
+    return pd.to_datetime(timestamps, utc=True).to_numpy(dtype='datetime64[s]').astype(np.int64)
+
+class RatingsStore:
+    def __init__(self, path):
+        """
+        Open (or create) an appendable on-disk store of rating events.
+
+        Events are kept in immutable column segments (one directory of .npy
+        arrays per appended chunk) with user and book IDs replaced by dense
+        integer codes. Each segment also stores the IDs it introduced, so the
+        code dictionaries are rebuilt by concatenating segments and nothing
+        is ever rewritten. A single writer is assumed; readers can open the
+        store at any time and only see complete segments.
+
+        Args:
+            path: Store directory
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.segments = []
+        user_ids, book_ids = [], []
+        for name in sorted(os.listdir(path)):
+            if name.startswith('.'):
+                continue
+            arrays, meta = load_arrays(os.path.join(path, name), 'ratings_segment')
+            self.segments.append((name, meta))
+            user_ids.append(arrays['new_user_ids'])
+            book_ids.append(arrays['new_book_ids'])
+
+        self.user_ids = np.concatenate(user_ids) if user_ids else np.array([], dtype=object)
+        self.book_ids = np.concatenate(book_ids) if book_ids else np.array([], dtype=object)
+        self.user_index = pd.Index(self.user_ids)
+        self.book_index = pd.Index(self.book_ids)
+
+    def __len__(self):
+        return sum(meta['rows'] for _, meta in self.segments)
+
+    def fingerprint(self):
+        """
+        Identify the store's contents without reading any segment.
+
+        Segments are immutable and only ever appended, so the segment and
+        event counts change whenever events are ingested.
+
+        Returns:
+            Dict with the number of segments and events
+        """
+        return {'segments': len(self.segments), 'rows': len(self)}
+
+    @property
+    def n_users(self):
+        return len(self.user_ids)
+
+    @property
+    def n_books(self):
+        return len(self.book_ids)
+
+    @staticmethod
+    def _encode(ids, index):
+        """
+        Map IDs to codes, assigning new codes to unseen IDs.
+
+        Returns:
+            Tuple of (int32 codes, new IDs in code order)
+        """
+        codes = index.get_indexer(ids)
+        unseen = codes < 0
+        new_ids = pd.unique(ids[unseen])
+        if len(new_ids):
+            codes[unseen] = len(index) + pd.Index(new_ids).get_indexer(ids[unseen])
+        return codes.astype(np.int32), new_ids
+
+    def append(self, events):
+        """
+        Write one chunk of rating events as a new segment.
+
+        Args:
+            events: DataFrame with columns [user_id, book_id, rating, timestamp];
+                rows without a rating are skipped
+
+        Returns:
+            Number of events written
+
+        Raises:
+            ValueError: If a column is missing
+            TypeError: If the IDs are of a different kind (e.g. strings
+                instead of integers) than the IDs already in the store
+        """
+        missing = [col for col in EVENT_COLUMNS if col not in events]
+        if missing:
+            raise ValueError(f"Rating events are missing columns {missing}")
+        events = events.dropna(subset=['rating'])
+        if events.empty:
+            return 0
+
+        user_codes, new_users = self._encode(events['user_id'].to_numpy(), self.user_index)
+        book_codes, new_books = self._encode(events['book_id'].to_numpy(), self.book_index)
+        new_users = self._checked_ids(self.user_ids, new_users, 'user_id')
+        new_books = self._checked_ids(self.book_ids, new_books, 'book_id')
+        timestamps = to_epoch_seconds(events['timestamp'])
+
+        # save_arrays writes atomically, so readers never see a partial segment
+        name = f'{len(self.segments):08d}'
+        meta = {
+            'rows': len(events),
+            'min_timestamp': int(timestamps.min()),
+            'max_timestamp': int(timestamps.max()),
+            'first_user_code': self.n_users,
+            'first_book_code': self.n_books
+        }
+        save_arrays(os.path.join(self.path, name), 'ratings_segment', {
+            'user_codes': user_codes,
+            'book_codes': book_codes,
+            'ratings': events['rating'].to_numpy(dtype=np.float32),
+            'timestamps': timestamps,
+            'new_user_ids': new_users,
+            'new_book_ids': new_books
+        }, meta=meta)
+
+        self.segments.append((name, meta))
+        if len(new_users):
+            self.user_ids = new_users if self.n_users == 0 else np.concatenate([self.user_ids, new_users])
+            self.user_index = pd.Index(self.user_ids)
+        if len(new_books):
+            self.book_ids = new_books if self.n_books == 0 else np.concatenate([self.book_ids, new_books])
+            self.book_index = pd.Index(self.book_ids)
+        return len(events)
+
+    @staticmethod
+    def _checked_ids(ids, new_ids, name):
+        """Convert new IDs to their stored dtype, refusing to mix integer and string IDs."""
+        new_ids = to_storable(new_ids)
+        if len(ids) and len(new_ids) and new_ids.dtype.kind != ids.dtype.kind:
+            raise TypeError(f"Store {name}s have dtype {ids.dtype}, got {new_ids.dtype}")
+        return new_ids
+
+    def ingest(self, source, chunksize=1_000_000, columns=None):
+        """
+        Append a ratings log chunk by chunk, one segment per chunk.
+
+        Args:
+            source: CSV path or iterable of event DataFrames
+            chunksize: Rows per chunk when reading a CSV
+            columns: Optional source column -> event column renames
+
+        Returns:
+            Number of events written
+        """
+        if isinstance(source, (str, os.PathLike)):
+            usecols = [next((src for src, dst in (columns or {}).items() if dst == col), col)
+                       for col in EVENT_COLUMNS]
+            source = pd.read_csv(source, usecols=usecols, chunksize=chunksize)
+
+        written = 0
+        for chunk in source:
+            written += self.append(chunk.rename(columns=columns or {}))
+        return written
+
+    def events(self, start=None, end=None):
+        """
+        Read the coded events, optionally within a time window.
+
+        Segments entirely outside the window are skipped without reading
+        their arrays.
+
+        Args:
+            start: Earliest timestamp to include (Unix seconds or datetime)
+            end: Timestamp to stop before (Unix seconds or datetime)
+
+        Returns:
+            Tuple of (user codes, book codes, ratings, timestamps) arrays in
+            ingestion order
+        """
+        start, end = (None if bound is None else int(to_epoch_seconds(pd.Series([bound]))[0])
+                      for bound in (start, end))
+        parts = []
+        for name, meta in self.segments:
+            if (start is not None and meta['max_timestamp'] < start) or \
+                    (end is not None and meta['min_timestamp'] >= end):
+                continue
+            arrays, _ = load_arrays(os.path.join(self.path, name), 'ratings_segment')
+            mask = np.ones(meta['rows'], dtype=bool)
+            if start is not None:
+                mask &= arrays['timestamps'] >= start
+            if end is not None:
+                mask &= arrays['timestamps'] < end
+            parts.append(tuple(np.asarray(arrays[col])[mask]
+                               for col in ('user_codes', 'book_codes', 'ratings', 'timestamps')))
+
+        if not parts:
+            return (np.array([], dtype=np.int32), np.array([], dtype=np.int32),
+                    np.array([], dtype=np.float32), np.array([], dtype=np.int64))
+        return tuple(np.concatenate(column) for column in zip(*parts))
+
+    def user_item_matrix(self, start=None, end=None):
+        """
+        Build the user-item rating matrix directly from the integer codes.
+
+        When a user rated a book more than once, the latest rating (by
+        timestamp, then ingestion order) wins. Only users and books with
+        nonzero ratings in the window get a row/column.
+
+        Args:
+            start: Earliest timestamp to include (Unix seconds or datetime)
+            end: Timestamp to stop before (Unix seconds or datetime)
+
+        Returns:
+            Tuple of (CSR matrix, user IDs of its rows, book IDs of its columns)
+        """
+        user_codes, book_codes, ratings, timestamps = self.events(start, end)
+
+        # Stable sort by (pair, timestamp): the last entry of each pair is the latest rating
+        pairs = user_codes.astype(np.int64) * max(self.n_books, 1) + book_codes
+        order = np.lexsort((timestamps, pairs))
+        pairs = pairs[order]
+        latest = order[np.r_[pairs[1:] != pairs[:-1], True]] if len(pairs) else order
+        # A latest rating of 0 means the rating was cleared
+        latest = latest[ratings[latest] != 0]
+
+        # Re-code to the users and books active in the window
+        users, rows = np.unique(user_codes[latest], return_inverse=True)
+        books, cols = np.unique(book_codes[latest], return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (ratings[latest].astype(np.float64), (rows, cols)),
+            shape=(len(users), len(books))
+        )
+        return matrix, self.user_ids[users], self.book_ids[books]
+
+def main():
+    parser = argparse.ArgumentParser(description='Ingest rating events and rebuild the collaborative model.')
+    parser.add_argument('--store', default=os.environ.get(
+        'BOOK_RATINGS_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'ratings')
+    ), help='Ratings store directory')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help='Append a CSV log of user_id,book_id,rating,timestamp')
+    ingest.add_argument('log')
+    ingest.add_argument('--chunksize', type=int, default=1_000_000)
+
+    rebuild = commands.add_parser('rebuild', help='Refit the collaborative model on a time window')
+    rebuild.add_argument('--model-dir', default=os.environ.get(
+        'BOOK_MODEL_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'model')
+    ), help='Artifact directory with the saved catalog')
+    rebuild.add_argument('--window-days', type=float, default=None,
+                         help='Only use ratings from the last N days (default: all)')
+    args = parser.parse_args()
+
+    store = RatingsStore(args.store)
+    start = time.perf_counter()
+    if args.command == 'ingest':
+        written = store.ingest(args.log, chunksize=args.chunksize)
+        print(f'{written:,} events ingested in {time.perf_counter() - start:.1f}s '
+              f'({len(store):,} events, {store.n_users:,} users, {store.n_books:,} books)')
+        return
+
+    from book_catalog import BookCatalog
+    from collaborative_recommender import CollaborativeRecommender
+
+    since = None
+    if args.window_days is not None:
+        latest = max((meta['max_timestamp'] for _, meta in store.segments), default=0)
+        since = latest - int(args.window_days * 86400)
+    matrix, user_ids, book_ids = store.user_item_matrix(start=since)
+
+    catalog = BookCatalog.load(os.path.join(args.model_dir, 'catalog'))
+    recommender = CollaborativeRecommender()
+    recommender.fit_matrix(matrix, user_ids, book_ids, catalog)
+    recommender.save(os.path.join(args.model_dir, 'collaborative'), source=store.fingerprint())
+    print(f'{matrix.nnz:,} ratings from {matrix.shape[0]:,} users on {matrix.shape[1]:,} books '
+          f'fitted in {time.perf_counter() - start:.1f}s')
+
+if __name__ == '__main__':
+    main()
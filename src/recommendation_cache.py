@@ -0,0 +1,113 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+# Process-wide model version counter, so versions are never reused even
+# when a recommender object is replaced (e.g. after load)
+_model_versions = itertools.count(1)
+
+def next_model_version():
+    """Get a new, process-unique model version number."""
+    return next(_model_versions)
+
+class RecommendationCache:
+    def __init__(self, max_size=1024, ttl=300):
+        """
+        Initialize a bounded LRU cache for recommendation results.
+
+        Every entry is tagged with the version of the model(s) that produced
+        it; a lookup with a different version is treated as a miss, so
+        refitting or updating a recommender invalidates its stale entries.
+
+        Args:
+            max_size: Maximum number of cached results
+            ttl: Seconds an entry stays valid (None never expires)
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        """
+        Look up a cached result.
+
+        Args:
+            key: Hashable request key, e.g. (kind, user_id, book_id, n, weights)
+            version: Current model version the result must match
+
+        Returns:
+            Tuple of (found, value)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, entry_version, expires_at = entry
+                if entry_version == version and (expires_at is None or expires_at > time.monotonic()):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._entries[key]
+                self.invalidations += 1
+            self.misses += 1
+            return False, None
+
+    def put(self, key, version, value):
+        """
+        Store a result, evicting the least recently used entries when full.
+
+        Args:
+            key: Hashable request key
+            version: Model version that produced the value
+            value: Result to cache
+        """
+        expires_at = None if self.ttl is None else time.monotonic() + self.ttl
+        with self._lock:
+            self._entries[key] = (value, version, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, version, compute):
+        """
+        Return the cached result for key, computing and storing it on a miss.
+
+        DataFrame results are copied on the way out so callers cannot mutate
+        the cached value.
+
+        Args:
+            key: Hashable request key
+            version: Current model version
+            compute: Zero-argument callable producing the result
+
+        Returns:
+            Cached or freshly computed result
+        """
+        found, value = self.get(key, version)
+        if not found:
+            value = compute()
+            self.put(key, version, value)
+        return value.copy() if hasattr(value, 'copy') else value
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Get cache counters and current size."""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+import numpy as np
+from data_processor import DataProcessor
+from content_recommender import ContentBasedRecommender
+from collaborative_recommender import CollaborativeRecommender
+from hybrid_recommender import HybridRecommender
+from book_catalog import BookCatalog
+from popularity import PopularityIndex
+from metrics import REGISTRY, timed
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class RequestError(Exception):
+    """Client error reported to the caller as a JSON error response."""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class MicroBatcher:
+    def __init__(self, name, score_batch, executor, max_batch_size=64, max_wait_ms=5):
+        """
+        Coalesce concurrent requests into one batched scoring call.
+
+        The first request of a batch opens a window of max_wait_ms; every
+        request arriving in that window (up to max_batch_size) is scored by a
+        single score_batch call on the worker pool.
+
+        Args:
+            name: Batch name used in metrics, e.g. 'content'
+            score_batch: Callable mapping a list of query keys to a dense
+                (n_keys x n_catalog) score array
+            executor: Worker pool running score_batch
+            max_batch_size: Maximum number of requests per batch
+            max_wait_ms: Time the first request of a batch waits for company
+        """
+        self.name = name
+        self.score_batch = score_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending = []
+        self._flush_handle = None
+
+    async def submit(self, key, n):
+        """
+        Queue one request and wait for its batch.
+
+        Args:
+            key: Query key passed to score_batch
+            n: Number of recommendations wanted
+
+        Returns:
+            Tuple of (catalog positions, scores) ordered by descending score
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((key, n, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        """Start scoring the pending requests as one batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        """Score a batch on the worker pool and resolve its futures."""
+        keys = [key for key, _, _ in batch]
+        n = max(n for _, n, _ in batch)
+        try:
+            top_indices, top_scores = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._score, keys, n
+            )
+        except Exception as error:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        for (_, request_n, future), indices, scores in zip(batch, top_indices, top_scores):
+            if not future.done():
+                future.set_result((indices[:request_n], scores[:request_n]))
+
+    def _score(self, keys, n):
+        """Score a batch and select each row's top n (runs on the worker pool)."""
+        REGISTRY.increment(f'server.{self.name}.batches')
+        REGISTRY.increment(f'server.{self.name}.batched_requests', len(keys))
+        with timed(f'server.{self.name}.batch'):
+            scores = self.score_batch(keys)
+            scores[np.isnan(scores)] = -np.inf
+            top_indices = CollaborativeRecommender._top_n_indices(scores, n)
+            # Excluded books (-inf) are never returned, even when fewer than n remain
+            top_indices = [indices[np.isfinite(row[indices])] for row, indices in zip(scores, top_indices)]
+            return top_indices, [row[indices] for row, indices in zip(scores, top_indices)]
+
+class RecommendationServer:
+    def __init__(self, content_recommender, collaborative_recommender, hybrid_recommender,
+                 host='127.0.0.1', port=8080, workers=4,
+                 max_batch_size=64, max_wait_ms=5, max_pending=1024, max_body_bytes=65536):
+        """
+        Initialize an asyncio HTTP/JSON recommendation service.
+
+        Endpoints (GET with query parameters, or POST with a JSON object body):
+            /recommend/content        book_id, n
+            /recommend/collaborative  user_id, n
+            /recommend/hybrid         user_id, book_id, n
+            /recommend/text           query, n
+            /health                   liveness and load (always 200 while running)
+            /ready                    200 once ready, 503 otherwise
+            /metrics                  Prometheus metrics
+
+        Args:
+            content_recommender: Fitted ContentBasedRecommender (fitted with its
+                vectorizer to enable /recommend/text)
+            collaborative_recommender: Fitted CollaborativeRecommender or ALSRecommender
+            hybrid_recommender: HybridRecommender over both
+            host: Interface to bind
+            port: Port to listen on
+            workers: Threads scoring batches (NumPy/SciPy release the GIL)
+            max_batch_size: Maximum number of requests coalesced into one batch
+            max_wait_ms: Batching window opened by the first request of a batch
+            max_pending: Requests in flight before new ones are rejected with 503
+            max_body_bytes: Largest accepted request body
+        """
+        self.content_recommender = content_recommender
+        self.collaborative_recommender = collaborative_recommender
+        self.hybrid_recommender = hybrid_recommender
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.max_body_bytes = max_body_bytes
+        self.pending = 0
+        self.ready = False
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        def batcher(name, score_batch):
+            return MicroBatcher(name, score_batch, self.executor, max_batch_size, max_wait_ms)
+
+        self.batchers = {
+            'content': batcher('content', content_recommender.score_items_batch),
+            'collaborative': batcher('collaborative', collaborative_recommender.score_items_batch),
+            'hybrid': batcher('hybrid', lambda keys: hybrid_recommender.score_items_batch(*zip(*keys))),
+            'text': batcher('text', content_recommender.score_texts)
+        }
+
+    @staticmethod
+    def _parse_id(value, known, name):
+        """Match a request parameter to a known ID, trying it as text and as an integer."""
+        if value is None:
+            raise RequestError(400, f"Missing parameter '{name}'")
+        # JSON bodies can carry any type; lists and objects are not hashable
+        if isinstance(value, bool) or not isinstance(value, (str, int)):
+            raise RequestError(400, f"Parameter '{name}' must be a string or an integer")
+        if value in known:
+            return value
+        try:
+            if int(value) in known:
+                return int(value)
+        except (TypeError, ValueError):
+            pass
+        raise RequestError(404, f"Unknown {name} {value!r}")
+
+    def _parse_user(self, params):
+        """Get the user ID; unknown users are allowed when there is a cold-start fallback."""
+        try:
+            return self._parse_id(params.get('user_id'), self.collaborative_recommender.user_indices,
+                                  'user_id')
+        except RequestError as error:
+            if error.status != 404 or getattr(self.collaborative_recommender, 'fallback', None) is None:
+                raise
+            return params['user_id']
+
+    @staticmethod
+    def _parse_n(params):
+        """Get the number of recommendations requested."""
+        try:
+            n = int(params.get('n', 5))
+        except (TypeError, ValueError):
+            raise RequestError(400, "Parameter 'n' must be an integer")
+        if not 1 <= n <= 100:
+            raise RequestError(400, "Parameter 'n' must be between 1 and 100")
+        return n
+
+    async def recommend(self, kind, params):
+        """
+        Serve one recommendation request through its micro-batcher.
+
+        Args:
+            kind: 'content', 'collaborative', 'hybrid' or 'text'
+            params: Request parameters
+
+        Returns:
+            JSON-serializable response dict
+        """
+        n = self._parse_n(params)
+        catalog = self.content_recommender.catalog
+
+        if kind == 'content':
+            key = self._parse_id(params.get('book_id'), catalog, 'book_id')
+        elif kind == 'collaborative':
+            key = self._parse_user(params)
+        elif kind == 'hybrid':
+            key = (self._parse_user(params), self._parse_id(params.get('book_id'), catalog, 'book_id'))
+        elif kind == 'text':
+            if self.content_recommender.vectorizer is None:
+                raise RequestError(404, 'Text queries are not enabled')
+            key = str(params.get('query') or '').strip()
+            if not key:
+                raise RequestError(400, "Missing parameter 'query'")
+        else:
+            raise RequestError(404, f'Unknown recommender {kind!r}')
+
+        positions, scores = await self.batchers[kind].submit(key, n)
+        recommendations = catalog.take(positions, columns=('book_id', 'title', 'authors'), score=scores)
+        return {'recommendations': json.loads(recommendations.to_json(orient='records'))}
+
+    async def handle(self, method, path, params):
+        """
+        Route a request.
+
+        Returns:
+            Tuple of (status, JSON-serializable body, content type)
+        """
+        if path == '/health':
+            return 200, {'status': 'ok', 'ready': self.ready, 'pending': self.pending}, None
+        if path == '/ready':
+            return (200 if self.ready else 503), {'ready': self.ready}, None
+        if path == '/metrics':
+            return 200, REGISTRY.export_prometheus(), 'text/plain; version=0.0.4'
+        if not path.startswith('/recommend/'):
+            raise RequestError(404, f'Unknown path {path!r}')
+        if method not in ('GET', 'POST'):
+            raise RequestError(405, f'Method {method} not allowed')
+        if not self.ready:
+            raise RequestError(503, 'Not ready')
+
+        # Backpressure: reject instead of queueing without bound
+        if self.pending >= self.max_pending:
+            REGISTRY.increment('server.rejected')
+            raise RequestError(503, 'Too many pending requests')
+        self.pending += 1
+        try:
+            with timed('server.request'):
+                return 200, await self.recommend(path[len('/recommend/'):], params), None
+        finally:
+            self.pending -= 1
+
+    async def _handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection (keep-alive supported)."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'Malformed request line'}, keep_alive=False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = (version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close')
+                content_type = None
+                try:
+                    url = urlsplit(target)
+                    params = dict(parse_qsl(url.query))
+                    length = int(headers.get('content-length') or 0)
+                    if length > self.max_body_bytes:
+                        keep_alive = False
+                        raise RequestError(413, 'Request body too large')
+                    if length:
+                        body = json.loads(await reader.readexactly(length))
+                        if not isinstance(body, dict):
+                            raise RequestError(400, 'Request body must be a JSON object')
+                        params.update(body)
+                    status, payload, content_type = await self.handle(method, url.path, params)
+                except RequestError as error:
+                    status, payload = error.status, {'error': str(error)}
+                except (ValueError, UnicodeDecodeError):
+                    status, payload = 400, {'error': 'Malformed request'}
+                except Exception as error:
+                    status, payload = 500, {'error': f'{type(error).__name__}: {error}'}
+
+                await self._respond(writer, status, payload, content_type, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer, status, payload, content_type=None, keep_alive=True):
+        """Write one HTTP response with a JSON (or preformatted text) body."""
+        body = payload.encode() if isinstance(payload, str) else json.dumps(payload).encode()
+        head = (
+            f'HTTP/1.1 {status} {REASONS.get(status, "")}\r\n'
+            f'Content-Type: {content_type or "application/json"}\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+            + ('Retry-After: 1\r\n' if status == 503 else '')
+            + '\r\n'
+        )
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+    async def start(self):
+        """Start listening and mark the server ready."""
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.ready = True
+        return self.server
+
+    async def serve_forever(self):
+        """Start the server and serve until cancelled."""
+        server = await self.start()
+        async with server:
+            await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve book recommendations over HTTP/JSON.')
+    parser.add_argument('--data', default=os.path.join(os.path.dirname(os.path.dirname(__file__)),
+                                                       'data', 'data.csv'))
+    parser.add_argument('--model-dir', default=os.environ.get(
+        'BOOK_MODEL_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'model')
+    ), help='Artifacts saved by the app (fitted from --data if missing)')
+    parser.add_argument('--sample-size', type=int, default=30000)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--max-pending', type=int, default=1024)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if os.path.isdir(args.model_dir):
+        data_processor = DataProcessor.load(os.path.join(args.model_dir, 'processor'))
+        catalog = BookCatalog.load(os.path.join(args.model_dir, 'catalog'))
+        collaborative_recommender = CollaborativeRecommender.load(
+            os.path.join(args.model_dir, 'collaborative'), catalog
+        )
+        data = catalog.take(np.arange(len(catalog)), columns=list(catalog.columns))
+    else:
+        data_processor = DataProcessor(args.data)
+        data = data_processor.load_data(sample_size=args.sample_size)
+        data_processor.preprocess_text_features(['title', 'authors', 'description'])
+        catalog = BookCatalog(data)
+        collaborative_recommender = CollaborativeRecommender()
+        collaborative_recommender.fit(data[['user_id', 'book_id', 'rating']], catalog)
+    # Unknown users get the popularity leaderboard, as in the app
+    collaborative_recommender.fallback = PopularityIndex().fit(data, catalog)
+
+    content_recommender = ContentBasedRecommender()
+    content_recommender.fit(data_processor.tfidf_matrix, catalog, data_processor.tfidf)
+    hybrid_recommender = HybridRecommender(content_recommender, collaborative_recommender)
+
+    server = RecommendationServer(
+        content_recommender, collaborative_recommender, hybrid_recommender,
+        host=args.host, port=args.port, workers=args.workers,
+        max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+        max_pending=args.max_pending
+    )
+    print(f'Models ready in {time.perf_counter() - start:.1f}s, '
+          f'listening on http://{args.host}:{args.port}')
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
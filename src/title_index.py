@@ -0,0 +1,180 @@
+import bisect
+import re
+import unicodedata
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+
+def normalize_title(text):
+    """Lowercase, strip accents and punctuation, and collapse whitespace."""
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return ' '.join(re.sub(r'[^\w]+', ' ', text).split())
+
+def trigrams(normalized):
+    """Get the set of character trigrams of a normalized string."""
+    padded = f'  {normalized} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class TitleIndex:
+    def __init__(self, titles, book_ids, popularity=None, max_postings=20000):
+        """
+        Build a title search index over normalized titles.
+
+        The index holds a trigram inverted index for fuzzy matching and a
+        sorted list of normalized titles for prefix autocomplete.
+
+        Args:
+            titles: Array-like of book titles
+            book_ids: Array-like of book IDs aligned with titles
+            popularity: Optional array-like (e.g. num_ratings) used to break
+                ties between equally good matches
+            max_postings: Budget of posting entries scanned per query. The
+                rarest query trigrams are used first, so very common trigrams
+                stop costing time on large catalogs.
+        """
+        self.max_postings = max_postings
+        self.titles = np.asarray(titles, dtype=object)
+        self.book_ids = np.asarray(book_ids)
+        self.normalized = [normalize_title(title) if pd.notna(title) else ''
+                           for title in self.titles]
+
+        if popularity is None:
+            self.popularity = np.zeros(len(self.titles))
+        else:
+            popularity = np.log1p(np.nan_to_num(np.asarray(popularity, dtype=np.float64)).clip(min=0))
+            self.popularity = popularity / (popularity.max() or 1.0)
+
+        # Trigram -> positions of titles containing it
+        postings = defaultdict(list)
+        for pos, title in enumerate(self.normalized):
+            if not title:
+                continue
+            for gram in trigrams(title):
+                postings[gram].append(pos)
+        self.postings = {gram: np.asarray(positions, dtype=np.int32)
+                         for gram, positions in postings.items()}
+
+        # Sorted normalized titles for prefix lookups
+        self.sorted_positions = np.array(
+            sorted(range(len(self.normalized)), key=self.normalized.__getitem__),
+            dtype=np.int64
+        )
+        self.sorted_titles = [self.normalized[pos] for pos in self.sorted_positions]
+
+    def _match(self, query, n):
+        """
+        Rank titles against a query.
+
+        Candidates are gathered from the rarest query trigrams, then a
+        shortlist is scored by trigram Jaccard similarity, with bonuses for
+        exact, prefix and substring matches and a small popularity tiebreak.
+
+        Returns:
+            Tuple of (title positions, scores) ordered by descending score
+        """
+        query = normalize_title(query)
+        if not query:
+            return np.array([], dtype=np.int64), np.array([])
+
+        query_grams = trigrams(query)
+        grams = sorted((gram for gram in query_grams if gram in self.postings),
+                       key=lambda gram: len(self.postings[gram]))
+        if not grams:
+            return np.array([], dtype=np.int64), np.array([])
+
+        # Use the rarest trigrams within the postings budget
+        used, budget = [], self.max_postings
+        for gram in grams:
+            if used and len(self.postings[gram]) > budget:
+                break
+            used.append(self.postings[gram])
+            budget -= len(self.postings[gram])
+
+        candidates, shared = np.unique(np.concatenate(used), return_counts=True)
+        shortlist_size = min(len(candidates), max(n * 10, 50))
+        shortlist = np.argpartition(-shared, shortlist_size - 1)[:shortlist_size]
+        positions = candidates[shortlist]
+
+        # Score the shortlist by Jaccard similarity plus exact/prefix/substring bonuses
+        scores = np.empty(len(positions))
+        for i, pos in enumerate(positions):
+            title = self.normalized[pos]
+            title_grams = trigrams(title)
+            common = len(query_grams & title_grams)
+            scores[i] = common / (len(query_grams) + len(title_grams) - common)
+            if title == query:
+                scores[i] += 3.0
+            elif title.startswith(query):
+                scores[i] += 2.0
+            elif query in title:
+                scores[i] += 1.0
+        scores += 0.01 * self.popularity[positions]
+
+        top = np.argsort(-scores, kind='stable')[:n]
+        return positions[top], scores[top]
+
+    def search(self, query, n=10):
+        """
+        Find the titles that best match a free-text query.
+
+        Args:
+            query: Title text typed by the user
+            n: Maximum number of matches to return
+
+        Returns:
+            DataFrame with columns [book_id, title, match_score]
+        """
+        positions, scores = self._match(query, n)
+        return pd.DataFrame({
+            'book_id': self.book_ids[positions],
+            'title': self.titles[positions],
+            'match_score': scores
+        })
+
+    def best_match(self, query):
+        """
+        Resolve a query to the ID of the best matching book.
+
+        Args:
+            query: Title text typed by the user
+
+        Returns:
+            Book ID of the top match, or None when nothing matches
+        """
+        positions, _ = self._match(query, 1)
+        return self.book_ids[positions[0]] if len(positions) else None
+
+    def autocomplete(self, prefix, n=10):
+        """
+        Suggest titles for a partially typed query.
+
+        Titles starting with the prefix come first (most popular first),
+        followed by fuzzy matches if there are fewer than n of them.
+
+        Args:
+            prefix: Partially typed title
+            n: Maximum number of suggestions
+
+        Returns:
+            List of title suggestions
+        """
+        prefix = normalize_title(prefix)
+        if not prefix:
+            return []
+
+        start = bisect.bisect_left(self.sorted_titles, prefix)
+        stop = bisect.bisect_left(self.sorted_titles, prefix + '\uffff')
+        positions = self.sorted_positions[start:stop]
+        if len(positions) > n:
+            top = np.argpartition(-self.popularity[positions], n - 1)[:n]
+            positions = positions[top]
+        positions = positions[np.argsort(-self.popularity[positions], kind='stable')]
+
+        suggestions = list(positions)
+        if len(suggestions) < n:
+            seen = set(suggestions)
+            fuzzy, _ = self._match(prefix, n)
+            suggestions += [pos for pos in fuzzy if pos not in seen]
+
+        return [self.titles[pos] for pos in suggestions[:n]]
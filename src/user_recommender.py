@@ -0,0 +1,244 @@
+import pandas as pd
+import numpy as np
+from scipy import sparse
+from metrics import profiled, timed
+
+class UserRecommender:
+    """
+    Shared serving code for the per-user collaborative backends.
+
+    Handles the user ID and catalog mappings, the cold-start fallback,
+    top-n selection and result assembly. A backend sets `user_ids`,
+    `book_ids`, `catalog` and `user_item_matrix` when fitting, calls
+    `_build_indices()`, and implements `fit_matrix` and `_predict_ratings`,
+    i.e. only how it scores a user.
+    """
+    # Prefix of the backend's metric stage names, e.g. 'collaborative.scoring'
+    metrics_prefix = 'recommender'
+
+    def fit(self, ratings_data, books_data):
+        """
+        Fit the model on a ratings DataFrame.
+
+        Args:
+            ratings_data: DataFrame with columns [user_id, book_id, rating]
+            books_data: BookCatalog (or DataFrame) with book information
+        """
+        with timed(f'{self.metrics_prefix}.fit'):
+            # Create sparse user-item matrix (duplicate ratings are averaged)
+            ratings = (ratings_data.dropna(subset=['rating'])
+                       .groupby(['user_id', 'book_id'])['rating'].mean()
+                       .reset_index())
+            user_codes, user_ids = pd.factorize(ratings['user_id'], sort=True)
+            book_codes, book_ids = pd.factorize(ratings['book_id'], sort=True)
+            user_item_matrix = sparse.csr_matrix(
+                (ratings['rating'].to_numpy(dtype=np.float64), (user_codes, book_codes)),
+                shape=(len(user_ids), len(book_ids))
+            )
+            self.fit_matrix(user_item_matrix, user_ids, book_ids, books_data)
+
+    def fit_matrix(self, user_item_matrix, user_ids, book_ids, books_data):
+        """
+        Fit the model on a prebuilt user-item matrix (e.g. RatingsStore.user_item_matrix).
+
+        Args:
+            user_item_matrix: Sparse (n_users x n_books) rating matrix
+            user_ids: User ID of every matrix row
+            book_ids: Book ID of every matrix column
+            books_data: BookCatalog (or DataFrame) with book information
+        """
+        raise NotImplementedError
+
+    def _predict_ratings(self, user_rows):
+        """
+        Score every item for a block of users.
+
+        Args:
+            user_rows: Array of user rows of the user-item matrix
+
+        Returns:
+            Dense (len(user_rows) x n_items) scores with already-rated items set to -inf
+        """
+        raise NotImplementedError
+
+    def _score_users(self, user_rows):
+        """
+        Score every item for a block of users, ready for top-n selection.
+
+        Items missing from the catalog are set to -inf like rated ones, so
+        they can never take one of the n slots.
+        """
+        scores = self._predict_ratings(user_rows)
+        scores[:, self.catalog_positions < 0] = -np.inf
+        return scores
+
+    def _build_indices(self):
+        """Create lookups between matrix positions, IDs and catalog rows."""
+        self.user_indices = {user_id: idx for idx, user_id in enumerate(self.user_ids)}
+        self.book_indices = {book_id: idx for idx, book_id in enumerate(self.book_ids)}
+
+        # Catalog row of every matrix column (-1 for books missing from the catalog)
+        self.catalog_positions = self.catalog.positions(self.book_ids)
+
+    def _user_rows(self, user_ids):
+        """Get the matrix row of every user ID, -1 for unknown users."""
+        return np.array([self.user_indices.get(user_id, -1) for user_id in user_ids], dtype=np.int64)
+
+    def get_recommendations(self, user_id, n_recommendations=5):
+        """
+        Get personalized recommendations for a user.
+
+        Args:
+            user_id: ID of the user to recommend for
+            n_recommendations: Number of recommendations to return
+
+        Returns:
+            DataFrame with recommended books
+        """
+        with profiled(f'{self.metrics_prefix}.get_recommendations'):
+            if user_id not in self.user_indices:
+                if self.fallback is not None:
+                    # Cold start: most popular books by weighted rating
+                    positions, scores = self.fallback.top(n_recommendations)
+                    return self.catalog.take(positions, predicted_rating=scores)
+                return pd.DataFrame(columns=['title', 'authors', 'predicted_rating'])
+
+            with timed(f'{self.metrics_prefix}.lookup'):
+                user_rows = np.array([self.user_indices[user_id]])
+            with timed(f'{self.metrics_prefix}.scoring'):
+                predicted_ratings = self._score_users(user_rows)[0]
+
+            # Get indices of top recommended books
+            with timed(f'{self.metrics_prefix}.selection'):
+                recommended_indices = self._top_n_indices(predicted_ratings[None, :], n_recommendations)[0]
+
+            if len(recommended_indices) == 0:
+                return pd.DataFrame(columns=['title', 'authors', 'predicted_rating'])
+
+            # Get book details and predicted ratings
+            with timed(f'{self.metrics_prefix}.assembly'):
+                return self.catalog.take(self.catalog_positions[recommended_indices],
+                                         predicted_rating=predicted_ratings[recommended_indices])
+
+    def score_items(self, user_id):
+        """
+        Score every catalog book by predicted rating for one user.
+
+        Args:
+            user_id: ID of the user to score for
+
+        Returns:
+            Array of predicted ratings indexed by catalog position. Books the
+            user already rated are -inf; books without ratings data are NaN.
+            Unknown users get the fallback's popularity scores.
+
+        Raises:
+            KeyError: If the user is unknown and there is no fallback
+        """
+        return self.score_items_batch([user_id])[0]
+
+    def score_items_batch(self, user_ids):
+        """
+        Score every catalog book for many users with one matrix product.
+
+        Args:
+            user_ids: IDs of the users to score for
+
+        Returns:
+            Dense (n_users x n_catalog) array laid out like score_items
+
+        Raises:
+            KeyError: If a user is unknown and there is no fallback
+        """
+        user_ids = list(user_ids)
+        rows = self._user_rows(user_ids)
+        known = rows >= 0
+        if not known.all() and self.fallback is None:
+            raise KeyError(user_ids[np.flatnonzero(~known)[0]])
+
+        scores = np.full((len(rows), len(self.catalog)), np.nan)
+        if known.any():
+            rows = rows[known]
+            predicted_ratings = self._predict_ratings(rows)
+            found = self.catalog_positions >= 0
+            known_scores = np.full((len(rows), len(self.catalog)), np.nan)
+            known_scores[:, self.catalog_positions[found]] = predicted_ratings[:, found]
+            scores[known] = known_scores
+
+        # Cold start: unknown users get the popularity scores
+        if not known.all():
+            scores[~known] = self.fallback.score_items()
+        return scores
+
+    def get_recommendations_batch(self, user_ids, n_recommendations=5, batch_size=1024):
+        """
+        Get personalized recommendations for many users at once.
+
+        Users are scored `batch_size` at a time with a single matrix-matrix
+        product per batch. Unknown users get the fallback's most popular
+        books, or are skipped when there is no fallback.
+
+        Args:
+            user_ids: Iterable of user IDs to recommend for
+            n_recommendations: Number of recommendations per user
+            batch_size: Number of users scored per matrix product
+
+        Returns:
+            DataFrame with columns [user_id, title, authors, predicted_rating],
+            ordered by user and then by descending predicted rating
+        """
+        with profiled(f'{self.metrics_prefix}.get_recommendations_batch'):
+            user_ids = list(user_ids)
+            rows = self._user_rows(user_ids)
+            known = np.flatnonzero(rows >= 0)
+
+            # Catalog positions and scores of every user's recommendations, in input order
+            results = [None] * len(user_ids)
+            for start in range(0, len(known), batch_size):
+                batch = known[start:start + batch_size]
+                predicted_ratings = self._score_users(rows[batch])
+                top_indices = self._top_n_indices(predicted_ratings, n_recommendations)
+
+                for offset, item_indices in enumerate(top_indices):
+                    results[batch[offset]] = (self.catalog_positions[item_indices],
+                                              predicted_ratings[offset, item_indices])
+
+            # Cold start: unknown users get the most popular books, as in get_recommendations
+            if self.fallback is not None and len(known) < len(user_ids):
+                popular = self.fallback.top(n_recommendations)
+                results = [popular if result is None else result for result in results]
+
+            results = [(user_id, result) for user_id, result in zip(user_ids, results) if result is not None]
+            if not results:
+                return pd.DataFrame(columns=['user_id', 'title', 'authors', 'predicted_rating'])
+
+            recommendations = self.catalog.take(
+                np.concatenate([positions for _, (positions, _) in results]),
+                predicted_rating=np.concatenate([scores for _, (_, scores) in results])
+            )
+            recommendations.insert(0, 'user_id', [user_id for user_id, (positions, _) in results
+                                                   for _ in range(len(positions))])
+            return recommendations
+
+    @staticmethod
+    def _top_n_indices(scores, n):
+        """
+        Select the top-n columns per row with a partial sort.
+
+        Args:
+            scores: Dense (n_rows x n_items) score array, -inf marks excluded items
+            n: Number of items to select per row
+
+        Returns:
+            List of index arrays, one per row, ordered by descending score
+        """
+        n = min(n, scores.shape[1])
+        if n <= 0:
+            return [np.array([], dtype=np.int64) for _ in range(scores.shape[0])]
+
+        top = np.argpartition(-scores, n - 1, axis=1)[:, :n]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        return [row[np.isfinite(row_scores)] for row, row_scores in zip(top, top_scores)]
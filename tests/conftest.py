@@ -0,0 +1,42 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+
+# The modules in src/ import each other by their bare names
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from book_catalog import BookCatalog
+
+N_BOOKS = 120
+N_USERS = 40
+
+@pytest.fixture
+def books():
+    """Small catalog with a few books that nobody rated."""
+    return pd.DataFrame({
+        'book_id': np.arange(N_BOOKS + 5),
+        'title': [f'Title {i}' for i in range(N_BOOKS + 5)],
+        'authors': [f'Author {i % 17}' for i in range(N_BOOKS + 5)],
+        'rating': np.linspace(3.0, 4.5, N_BOOKS + 5),
+        'num_ratings': np.arange(N_BOOKS + 5) + 1
+    })
+
+@pytest.fixture
+def catalog(books):
+    return BookCatalog(books)
+
+@pytest.fixture
+def ratings():
+    """
+    Ratings with continuous values. Continuous values avoid ties between
+    similarities, so different code paths select the same neighbors.
+    """
+    rng = np.random.default_rng(3)
+    ratings = pd.DataFrame({
+        'user_id': rng.integers(0, N_USERS, 1500),
+        'book_id': rng.integers(0, N_BOOKS, 1500),
+        'rating': rng.uniform(1, 5, 1500)
+    })
+    return ratings.drop_duplicates(['user_id', 'book_id'], ignore_index=True)
@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from scipy import sparse
+from als_recommender import ALSRecommender
+
+def random_problem(seed, n_rows=30, n_cols=25, n_factors=6):
+    rng = np.random.default_rng(seed)
+    matrix = sparse.random(n_rows, n_cols, density=0.2, random_state=seed, format='csr',
+                           data_rvs=lambda size: rng.uniform(1, 5, size))
+    factors = rng.normal(0, 0.5, (n_cols, n_factors))
+    current = rng.normal(0, 0.1, (n_rows, n_factors))
+    return matrix, factors, current
+
+def exact_solution(recommender, matrix, factors):
+    """Solve every row's normal equations directly."""
+    k = factors.shape[1]
+    solution = np.zeros((matrix.shape[0], k))
+    for row in range(matrix.shape[0]):
+        cols = matrix.indices[matrix.indptr[row]:matrix.indptr[row + 1]]
+        values = matrix.data[matrix.indptr[row]:matrix.indptr[row + 1]]
+        neighbors = factors[cols]
+        if recommender.implicit:
+            confidence = 1 + recommender.alpha * values
+            lhs = (factors.T @ factors + neighbors.T @ ((confidence - 1)[:, None] * neighbors)
+                   + recommender.regularization * np.eye(k))
+            rhs = neighbors.T @ confidence
+        else:
+            lhs = neighbors.T @ neighbors + recommender.regularization * len(cols) * np.eye(k)
+            rhs = neighbors.T @ values
+        if len(cols) or recommender.implicit:
+            solution[row] = np.linalg.solve(lhs, rhs)
+    return solution
+
+@pytest.mark.parametrize('implicit', [False, True])
+@pytest.mark.parametrize('block_memory_mb', [64, 0.001])
+def test_cg_with_n_factors_steps_solves_normal_equations(implicit, block_memory_mb):
+    matrix, factors, current = random_problem(0)
+    recommender = ALSRecommender(n_factors=factors.shape[1], cg_steps=factors.shape[1],
+                                 implicit=implicit, alpha=2.0, block_memory_mb=block_memory_mb)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        solved = recommender._solve(matrix, factors, current, executor)
+
+    expected = exact_solution(recommender, matrix, factors)
+    # Rows without ratings keep their warm start in explicit mode
+    empty = np.diff(matrix.indptr) == 0
+    if not implicit:
+        expected[empty] = current[empty]
+    np.testing.assert_allclose(solved, expected, rtol=1e-6, atol=1e-8)
+
+def test_fewer_cg_steps_still_reduce_the_residual():
+    matrix, factors, current = random_problem(1)
+    recommender = ALSRecommender(n_factors=factors.shape[1], cg_steps=2)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        solved = recommender._solve(matrix, factors, current, executor)
+
+    expected = exact_solution(recommender, matrix, factors)
+    rated = np.diff(matrix.indptr) > 0
+    assert (np.linalg.norm(solved[rated] - expected[rated]) <
+            np.linalg.norm(current[rated] - expected[rated]))
+
+def test_save_load_round_trip(tmp_path, catalog, ratings):
+    recommender = ALSRecommender(n_factors=8, iterations=3, n_jobs=1)
+    recommender.fit(ratings, catalog)
+    recommender.save(tmp_path / 'als')
+    loaded = ALSRecommender.load(tmp_path / 'als', catalog)
+
+    user_ids = sorted(recommender.user_indices)
+    np.testing.assert_array_equal(loaded.score_items_batch(user_ids), recommender.score_items_batch(user_ids))
+    assert (loaded.get_recommendations_batch(user_ids, 5)['title'].tolist() ==
+            recommender.get_recommendations_batch(user_ids, 5)['title'].tolist())
@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import sparse
+from book_catalog import BookCatalog
+from collaborative_recommender import CollaborativeRecommender
+from popularity import PopularityIndex
+
+def combined_ratings(ratings, *updates):
+    """The ratings a full refit sees after add_ratings: latest value per pair, 0 removes it."""
+    merged = pd.concat([ratings, *updates], ignore_index=True)
+    merged = merged.drop_duplicates(['user_id', 'book_id'], keep='last')
+    return merged[merged['rating'] != 0]
+
+def rating_updates(seed):
+    """New ratings for known and new users and books, plus changed and removed ratings."""
+    rng = np.random.default_rng(seed)
+    updates = pd.DataFrame({
+        'user_id': rng.integers(30, 45, 60),
+        'book_id': rng.integers(100, 125, 60),
+        'rating': rng.uniform(1, 5, 60)
+    }).drop_duplicates(['user_id', 'book_id'], ignore_index=True)
+    updates.loc[updates.index[::6], 'rating'] = 0.0
+    return updates
+
+def test_merged_rows_applies_updates_and_removals():
+    matrix = sparse.csr_matrix(np.array([
+        [1.0, 0.0, 2.0],
+        [0.0, 3.0, 0.0],
+        [4.0, 0.0, 0.0]
+    ]))
+    rows = np.array([0, 2, 3])
+    merged = CollaborativeRecommender._merged_rows(
+        matrix, rows,
+        row_codes=np.array([0, 0, 2, 3]),
+        col_codes=np.array([2, 1, 0, 3]),
+        values=np.array([0.0, 5.0, 6.0, 7.0]),
+        n_cols=4
+    )
+    np.testing.assert_array_equal(merged.toarray(), [
+        [1.0, 5.0, 0.0, 0.0],
+        [6.0, 0.0, 0.0, 0.0],
+        [0.0, 0.0, 0.0, 7.0]
+    ])
+
+def test_splice_rows_matches_dense_assignment():
+    rng = np.random.default_rng(0)
+    dense = rng.uniform(size=(8, 5)) * (rng.uniform(size=(8, 5)) < 0.4)
+    rows = np.array([1, 2, 6, 9])
+    replacement = rng.uniform(size=(4, 6)) * (rng.uniform(size=(4, 6)) < 0.5)
+
+    spliced = CollaborativeRecommender._splice_rows(
+        sparse.csr_matrix(dense), rows, sparse.csr_matrix(replacement), (10, 6)
+    )
+
+    expected = np.zeros((10, 6))
+    expected[:8, :5] = dense
+    expected[rows] = replacement
+    np.testing.assert_array_equal(spliced.toarray(), expected)
+    spliced.check_format(full_check=True)
+
+@pytest.mark.parametrize('n_neighbors', [None, 200])
+def test_add_ratings_matches_full_refit(books, catalog, ratings, n_neighbors):
+    # With every neighbor kept, incremental updates have nothing to backfill
+    updates = [rating_updates(1), rating_updates(2)]
+    incremental = CollaborativeRecommender(n_neighbors=n_neighbors, block_memory_mb=1)
+    incremental.fit(ratings, catalog)
+    for update in updates:
+        incremental.add_ratings(update)
+
+    refit = CollaborativeRecommender(n_neighbors=n_neighbors, block_memory_mb=1)
+    refit.fit(combined_ratings(ratings, *updates), catalog)
+
+    user_ids = sorted(refit.user_indices)
+    assert sorted(incremental.user_indices) == user_ids
+    expected = refit.score_items_batch(user_ids)
+    actual = incremental.score_items_batch(user_ids)
+    # A book whose ratings were all removed stays in the incremental model, scored 0
+    dropped = np.isnan(expected) & ~np.isnan(actual)
+    assert (actual[dropped] == 0).all()
+    actual[dropped] = np.nan
+    np.testing.assert_allclose(actual, expected, rtol=1e-6, atol=1e-9)
+    for user_id in user_ids[::7]:
+        assert (incremental.get_recommendations(user_id, 5)['title'].tolist() ==
+                refit.get_recommendations(user_id, 5)['title'].tolist())
+
+def test_add_ratings_keeps_matrix_copies_consistent(catalog, ratings):
+    recommender = CollaborativeRecommender(n_neighbors=10, block_memory_mb=1)
+    recommender.fit(ratings, catalog)
+    recommender.add_ratings(rating_updates(4))
+
+    assert abs(recommender.item_user_matrix - recommender.user_item_matrix.T).max() == 0
+    assert abs(recommender.similarity_matrix.T - recommender.similarity_matrix_t).max() == 0
+    sums = np.asarray(abs(recommender.similarity_matrix).sum(axis=1)).ravel()
+    np.testing.assert_allclose(recommender.similarity_sums, np.where(sums == 0, 1e-10, sums))
+
+def test_save_mmap_load_then_add_ratings(tmp_path, catalog, ratings):
+    recommender = CollaborativeRecommender(n_neighbors=15, block_memory_mb=1)
+    recommender.fit(ratings, catalog)
+    recommender.save(tmp_path / 'model')
+
+    loaded = CollaborativeRecommender.load(tmp_path / 'model', catalog, mmap=True)
+    update = rating_updates(5)
+    loaded.add_ratings(update)
+    recommender.add_ratings(update)
+
+    user_ids = sorted(recommender.user_indices)
+    np.testing.assert_array_equal(loaded.score_items_batch(user_ids), recommender.score_items_batch(user_ids))
+
+    # The memory-mapped artifact itself is never modified
+    reloaded = CollaborativeRecommender.load(tmp_path / 'model', catalog)
+    original = CollaborativeRecommender(n_neighbors=15, block_memory_mb=1)
+    original.fit(ratings, catalog)
+    known = sorted(original.user_indices)
+    np.testing.assert_array_equal(reloaded.score_items_batch(known), original.score_items_batch(known))
+
+def test_unknown_users_get_fallback_in_single_and_batch_calls(books, catalog, ratings):
+    recommender = CollaborativeRecommender()
+    recommender.fit(ratings, catalog)
+    with pytest.raises(KeyError):
+        recommender.score_items('nobody')
+    assert recommender.get_recommendations_batch(['nobody'], 3).empty
+
+    recommender.fallback = PopularityIndex().fit(books, catalog)
+    batch = recommender.get_recommendations_batch([0, 'nobody'], 3)
+    assert batch['user_id'].tolist() == [0, 0, 0, 'nobody', 'nobody', 'nobody']
+    single = recommender.get_recommendations('nobody', 3)
+    assert batch[batch['user_id'] == 'nobody']['title'].tolist() == single['title'].tolist()
+
+def test_books_missing_from_catalog_never_shorten_results(books, ratings):
+    # Half of the rated books are not in the catalog
+    catalog = BookCatalog(books[books['book_id'] % 2 == 0])
+    recommender = CollaborativeRecommender()
+    recommender.fit(ratings, catalog)
+
+    user_ids = sorted(recommender.user_indices)
+    for user_id in user_ids:
+        assert len(recommender.get_recommendations(user_id, 5)) == 5
+    batch = recommender.get_recommendations_batch(user_ids, 5)
+    assert (batch.groupby('user_id').size() == 5).all()
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from data_processor import DataProcessor, split_frame
+
+TEXT_COLUMNS = ['title', 'authors', 'description']
+
+@pytest.fixture
+def text_books():
+    rng = np.random.default_rng(0)
+    words = np.array(['dragon', 'castle', 'winter', 'murder', 'detective', 'ocean', 'voyage',
+                      'garden', 'secret', 'empire', 'robot', 'galaxy', 'love', 'letters', 'war'])
+    return pd.DataFrame({
+        'book_id': [f'b{i}' for i in range(60)],
+        'title': [' '.join(rng.choice(words, 3)).title() for _ in range(60)],
+        'authors': [f'Author {i % 9}' for i in range(60)],
+        'description': [' '.join(rng.choice(words, 12)) if i % 11 else None for i in range(60)],
+        'rating': rng.uniform(1, 5, 60),
+        'num_ratings': rng.integers(1, 100, 60)
+    })
+
+def write_csv(books, path):
+    books.rename(columns={'book_id': 'bookId', 'authors': 'author', 'num_ratings': 'numRatings'}).to_csv(
+        path, index=False)
+
+def test_chunked_features_do_not_depend_on_chunk_size(text_books):
+    whole = DataProcessor.from_frame(text_books).preprocess_text_features(TEXT_COLUMNS, chunksize=len(text_books))
+    chunked = DataProcessor.from_frame(text_books).preprocess_text_features(TEXT_COLUMNS, chunksize=7)
+    assert abs(whole - chunked).max() == 0
+
+def test_chunked_features_streamed_from_csv_match_loaded_data(tmp_path, text_books):
+    write_csv(text_books, tmp_path / 'data.csv')
+    loaded = DataProcessor(str(tmp_path / 'data.csv'))
+    loaded.load_data()
+    from_data = loaded.preprocess_text_features(TEXT_COLUMNS, chunksize=13)
+    streamed = DataProcessor(str(tmp_path / 'data.csv')).preprocess_text_features(TEXT_COLUMNS, chunksize=13)
+    np.testing.assert_allclose(streamed.toarray(), from_data.toarray())
+
+def test_chunked_features_match_vocabulary_tfidf(text_books):
+    # Without hash collisions the two differ only by a column permutation,
+    # so every document similarity is the same
+    exact = DataProcessor.from_frame(text_books).preprocess_text_features(TEXT_COLUMNS)
+    hashed = DataProcessor.from_frame(text_books).preprocess_text_features(TEXT_COLUMNS, chunksize=10)
+    np.testing.assert_allclose((hashed @ hashed.T).toarray(), (exact @ exact.T).toarray(), atol=1e-12)
+
+def test_chunked_vectorizer_transforms_like_the_fitted_rows(text_books):
+    processor = DataProcessor.from_frame(text_books)
+    features = processor.preprocess_text_features(TEXT_COLUMNS, chunksize=10)
+    transformed = processor.tfidf.transform(DataProcessor._combine_text(text_books.iloc[:5], TEXT_COLUMNS))
+    np.testing.assert_allclose(transformed.toarray(), features[:5].toarray(), atol=1e-12)
+
+def test_chunked_features_survive_save_and_load(tmp_path, text_books):
+    processor = DataProcessor.from_frame(text_books)
+    features = processor.preprocess_text_features(TEXT_COLUMNS, chunksize=10, min_df=2)
+    processor.save(tmp_path / 'processor')
+
+    loaded = DataProcessor.load(tmp_path / 'processor')
+    assert loaded.features_version == processor.features_version
+    assert abs(loaded.tfidf_matrix - features).max() == 0
+    text = DataProcessor._combine_text(text_books.iloc[:3], TEXT_COLUMNS)
+    np.testing.assert_allclose(loaded.tfidf.transform(text).toarray(), processor.tfidf.transform(text).toarray())
+
+def test_split_frame_is_reproducible(text_books):
+    train, test = split_frame(text_books, test_size=0.25)
+    again_train, again_test = split_frame(text_books, test_size=0.25)
+    assert len(test) == 15
+    assert train.index.equals(again_train.index) and test.index.equals(again_test.index)
+    assert not set(train.index) & set(test.index)
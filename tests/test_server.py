@@ -0,0 +1,96 @@
+import asyncio
+import json
+import pytest
+from collaborative_recommender import CollaborativeRecommender
+from content_recommender import ContentBasedRecommender
+from data_processor import DataProcessor
+from hybrid_recommender import HybridRecommender
+from popularity import PopularityIndex
+from server import RecommendationServer, RequestError
+
+@pytest.fixture
+def server(books, catalog, ratings):
+    books = books.assign(description='')
+    processor = DataProcessor.from_frame(books)
+    content = ContentBasedRecommender()
+    content.fit(processor.preprocess_text_features(['title', 'authors']), catalog, processor.tfidf)
+    collaborative = CollaborativeRecommender()
+    collaborative.fit(ratings, catalog)
+    collaborative.fallback = PopularityIndex().fit(books, catalog)
+    return RecommendationServer(content, collaborative, HybridRecommender(content, collaborative),
+                                port=0, workers=1, max_wait_ms=1)
+
+def request(server, raw):
+    """Send raw request bytes to a running server and return (status, JSON body)."""
+    async def run():
+        await server.start()
+        port = server.server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        server.server.close()
+        await server.server.wait_closed()
+        return response
+
+    head, _, body = asyncio.run(run()).partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body)
+
+def get(server, target):
+    return request(server, f'GET {target} HTTP/1.1\r\nConnection: close\r\n\r\n'.encode())
+
+def post(server, path, payload):
+    body = json.dumps(payload).encode()
+    return request(server, f'POST {path} HTTP/1.1\r\nConnection: close\r\n'
+                           f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+
+@pytest.mark.parametrize('value, expected', [(5, 5), ('5', 5), (7.0, None), (True, None),
+                                             ([1], None), ({'id': 1}, None), (None, None)])
+def test_parse_id_accepts_only_scalar_ids(value, expected):
+    known = {5: 0}
+    if expected is not None:
+        assert RecommendationServer._parse_id(value, known, 'user_id') == expected
+        return
+    with pytest.raises(RequestError) as error:
+        RecommendationServer._parse_id(value, known, 'user_id')
+    assert error.value.status == 400
+
+def test_parse_id_reports_unknown_ids():
+    with pytest.raises(RequestError) as error:
+        RecommendationServer._parse_id('missing', {5: 0}, 'book_id')
+    assert error.value.status == 404
+
+@pytest.mark.parametrize('n', ['0', '101', 'many', None])
+def test_parse_n_rejects_out_of_range_and_non_integers(n):
+    with pytest.raises(RequestError) as error:
+        RecommendationServer._parse_n({'n': n} if n is not None else {'n': []})
+    assert error.value.status == 400
+
+def test_parse_user_passes_unknown_users_to_the_fallback(server):
+    assert server._parse_user({'user_id': '3'}) == 3
+    assert server._parse_user({'user_id': 'newcomer'}) == 'newcomer'
+    server.collaborative_recommender.fallback = None
+    with pytest.raises(RequestError) as error:
+        server._parse_user({'user_id': 'newcomer'})
+    assert error.value.status == 404
+
+def test_recommendations_for_known_and_unknown_users(server):
+    status, body = get(server, '/recommend/collaborative?user_id=3&n=4')
+    assert status == 200 and len(body['recommendations']) == 4
+
+    status, body = get(server, '/recommend/hybrid?user_id=newcomer&book_id=7&n=3')
+    assert status == 200 and len(body['recommendations']) == 3
+
+def test_json_body_with_non_scalar_id_is_a_bad_request(server):
+    status, body = post(server, '/recommend/content', {'book_id': [1, 2]})
+    assert status == 400 and 'must be a string or an integer' in body['error']
+
+@pytest.mark.parametrize('raw', [b'GARBAGE\r\n\r\n', b'GET /recommend/content\r\n\r\n'])
+def test_malformed_request_line_gets_400(server, raw):
+    status, body = request(server, raw)
+    assert status == 400 and body == {'error': 'Malformed request line'}
+
+def test_unknown_book_is_not_found(server):
+    status, _ = get(server, '/recommend/content?book_id=999999')
+    assert status == 404